@@ -0,0 +1,189 @@
+"""Asynchronous (actor-learner) collection of training rollouts.
+
+Rather than alternating between collecting a rollout and updating on it,
+rollouts are collected in a background thread of the training worker by a
+copy of the model (the acting model) while the learner updates on
+previously collected rollouts. Task samplers (in their own processes) thus
+keep stepping during updates and the learner does not wait for every
+rollout to be collected. As the acting model is only refreshed with the
+learner weights every few updates, rollouts are collected by a (slightly)
+stale policy, which the learner corrects for with V-trace (see
+`RolloutStorage.compute_vtrace_returns`).
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import torch
+from torch import nn
+
+from allenact.algorithms.onpolicy_sync.storage import RolloutStorage
+
+
+class AsyncRolloutCollector(object):
+    """Collects rollouts into a pool of storages in a background thread.
+
+    The collection thread fills (with `collect_rollout`) the storages of the
+    pool one at a time, every rollout starting from the last step of the
+    previous one, and queues the collected rollouts for the learner, which
+    takes them with `get` and gives them back with `release` once done. At
+    most `queue_size` collected rollouts are waiting, after which collection
+    pauses until the learner releases a rollout.
+
+    Before each rollout, the acting model is loaded with the latest weights
+    given to `publish_weights` (if any), together with their version. The
+    version of the weights used for a rollout is returned (along with the
+    rollout) by `get`, e.g. to compute the policy lag of the learner, as is
+    the value returned by `collect_rollout` for the rollout (e.g. info
+    tracked while collecting it, so that it is not shared between the
+    threads).
+
+    # Attributes
+
+    acting_model : The model used by `collect_rollout`.
+    queue_size : Maximum number of collected rollouts waiting for the learner.
+    """
+
+    def __init__(
+        self,
+        storages: Sequence[RolloutStorage],
+        acting_model: nn.Module,
+        collect_rollout: Callable[[RolloutStorage], Any],
+        queue_size: int = 1,
+        initial_version: int = 0,
+        poll_seconds: float = 0.1,
+    ):
+        """Initializer.
+
+        # Parameters
+
+        storages : The storages of the pool (at least `queue_size + 2`, as
+            the thread collects into a storage while the learner updates on
+            another), the first one of which must be initialized with the
+            current observations of the samplers.
+        acting_model : The model used by `collect_rollout`.
+        collect_rollout : Function collecting a rollout into the given storage
+            (with the acting model), its return value is handed to the learner
+            along with the rollout.
+        queue_size : Maximum number of collected rollouts waiting for the
+            learner.
+        initial_version : Version of the initial weights of `acting_model`.
+        poll_seconds : How often blocked calls check whether collection stopped
+            (or failed).
+        """
+        assert queue_size >= 1, "`queue_size` must be positive."
+        assert (
+            len(storages) >= queue_size + 2
+        ), "At least `queue_size + 2` storages are required."
+        self.acting_model = acting_model
+        self.collect_rollout = collect_rollout
+        self.queue_size = queue_size
+        self.poll_seconds = poll_seconds
+
+        self._first_storage = storages[0]
+        self._free: queue.Queue = queue.Queue()
+        for storage in storages[1:]:
+            self._free.put(storage)
+        self._collected: queue.Queue = queue.Queue(maxsize=queue_size)
+
+        self._weights_lock = threading.Lock()
+        self._weights: Optional[Dict[str, torch.Tensor]] = None
+        self._weights_version = initial_version
+        self._acting_version = initial_version
+
+        self._stopped = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Starts collecting rollouts."""
+        assert self._thread is None, "Collection already started."
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish_weights(self, model: nn.Module, version: int):
+        """Makes a copy of the weights of `model` (with the given version) the
+        weights of the acting model for the next rollouts."""
+        weights = {
+            key: value.detach().clone() for key, value in model.state_dict().items()
+        }
+        with self._weights_lock:
+            self._weights = weights
+            self._weights_version = version
+
+    def _refresh_weights(self):
+        with self._weights_lock:
+            weights, self._weights = self._weights, None
+            version = self._weights_version
+        if weights is not None:
+            self.acting_model.load_state_dict(weights)
+            self._acting_version = version
+
+    def _get_or_stop(self, from_queue: queue.Queue) -> Optional[Any]:
+        while not self._stopped.is_set():
+            try:
+                return from_queue.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                pass
+        return None
+
+    def _put_or_stop(self, to_queue: queue.Queue, item: Any) -> bool:
+        while not self._stopped.is_set():
+            try:
+                to_queue.put(item, timeout=self.poll_seconds)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            rollouts = self._first_storage
+            while not self._stopped.is_set():
+                self._refresh_weights()
+                version = self._acting_version
+                collection_info = self.collect_rollout(rollouts)
+
+                next_rollouts = self._get_or_stop(self._free)
+                if next_rollouts is None:
+                    return
+                next_rollouts.continue_from(rollouts)
+
+                if not self._put_or_stop(
+                    self._collected, (rollouts, version, collection_info)
+                ):
+                    return
+                rollouts = next_rollouts
+        except BaseException as e:
+            self._error = e
+
+    def get(self) -> Tuple[RolloutStorage, int, Any]:
+        """Waits for the next collected rollout.
+
+        # Returns
+
+        The rollout, the version of the weights used to collect it and the
+        value returned by `collect_rollout` for it.
+        """
+        while True:
+            if self._error is not None:
+                raise RuntimeError("Rollout collection failed.") from self._error
+            assert (
+                self._thread is not None and self._thread.is_alive()
+            ), "Rollout collection is not running."
+            try:
+                return self._collected.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                pass
+
+    def release(self, rollouts: RolloutStorage):
+        """Gives back a rollout (taken with `get`) to collect into."""
+        self._free.put(rollouts)
+
+    def stop(self):
+        """Stops collecting (after the rollout being collected, if any)."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
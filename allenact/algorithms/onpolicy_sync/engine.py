@@ -1,5 +1,7 @@
 """Defines the reinforcement learning `OnPolicyRLEngine`."""
+import copy
 import datetime
+import inspect
 import itertools
 import logging
 import os
@@ -19,8 +21,10 @@ from typing import (
     cast,
     Iterator,
     Callable,
+    Tuple,
 )
 
+import numpy as np
 import torch
 import torch.distributed as dist  # type: ignore
 import torch.distributions  # type: ignore
@@ -29,7 +33,11 @@ import torch.optim
 from torch import nn
 from torch import optim
 
-from allenact.utils.misc_utils import md5_hash_str_as_int, tensor_print_options
+from allenact.utils.misc_utils import (
+    md5_hash_str_as_int,
+    tensor_print_options,
+    partition_sequence,
+)
 
 try:
     # noinspection PyProtectedMember
@@ -37,17 +45,27 @@ try:
 except:
     raise ImportError("`_LRScheduler` was not found in `torch.optim.lr_scheduler`")
 
+from allenact.algorithms.onpolicy_sync.async_collection import AsyncRolloutCollector
 from allenact.algorithms.onpolicy_sync.losses.abstract_loss import (
     AbstractActorCriticLoss,
 )
+from allenact.algorithms.onpolicy_sync.grad_reduction import BucketedGradientReducer
 from allenact.algorithms.onpolicy_sync.policy import ActorCriticModel
+from allenact.algorithms.onpolicy_sync.preemption import RolloutDoneNotifier
 from allenact.algorithms.onpolicy_sync.storage import RolloutStorage
 from allenact.algorithms.onpolicy_sync.vector_sampled_tasks import (
     VectorSampledTasks,
+    ThreadedVectorSampledTasks,
+    SamplerLatencyStats,
     COMPLETE_TASK_METRICS_KEY,
+    WORKER_TIMINGS_KEY,
 )
 from allenact.base_abstractions.experiment_config import ExperimentConfig, MachineParams
-from allenact.base_abstractions.misc import RLStepResult
+from allenact.base_abstractions.misc import (
+    RLStepResult,
+    StackedObservations,
+    StackedStepResults,
+)
 from allenact.utils import spaces_utils as su
 from allenact.utils.experiment_utils import (
     set_seed,
@@ -57,9 +75,10 @@ from allenact.utils.experiment_utils import (
     PipelineStage,
     set_deterministic_cudnn,
 )
-from allenact.utils.system import get_logger
+from allenact.utils.profiling import PhaseProfiler
+from allenact.utils.system import get_logger, imported_module_names
 from allenact.utils.tensor_utils import (
-    batch_observations,
+    ObservationBatcher,
     to_device_recursively,
     detach_recursively,
 )
@@ -92,6 +111,7 @@ class OnPolicyRLEngine(object):
         worker_id: int = 0,
         num_workers: int = 1,
         device: Union[str, torch.device, int] = "cpu",
+        distributed_address: str = "127.0.0.1",
         distributed_port: int = 0,
         deterministic_agents: bool = False,
         max_sampler_processes_per_worker: Optional[int] = None,
@@ -112,6 +132,9 @@ class OnPolicyRLEngine(object):
             training performance this is necessary (but not sufficient) if you desire
             deterministic behavior.
         extra_tag : An additional label to add to the experiment when saving tensorboard logs.
+        distributed_address : Address of the host of the worker with id 0 (which
+            hosts the distributed store), e.g. the master node in multi-node training.
+        distributed_port : Port of the distributed store.
         """
         self.config = config
         self.results_queue = results_queue
@@ -121,8 +144,12 @@ class OnPolicyRLEngine(object):
         self.worker_id = worker_id
         self.num_workers = num_workers
         self.device = torch.device("cpu") if device == -1 else torch.device(device)  # type: ignore
+        self.distributed_address = distributed_address
         self.distributed_port = distributed_port
 
+        # Batches the observations of the samplers into reused buffers
+        self.observation_batcher = ObservationBatcher(device=self.device)
+
         self.mode = mode.lower().strip()
         assert self.mode in [
             "train",
@@ -155,10 +182,26 @@ class OnPolicyRLEngine(object):
         self.num_samplers_per_worker = self.machine_params.nprocesses
         self.num_samplers = self.num_samplers_per_worker[self.worker_id]
 
+        self.profiler = PhaseProfiler(
+            enabled=self.machine_params.profile_phases,
+            synchronize=self.machine_params.profile_synchronize,
+            device=self.device,
+            trace_rollouts=self.machine_params.profile_trace_rollouts
+            if self.mode == "train"
+            else None,
+            trace_path=os.path.join(
+                self.checkpoints_dir,
+                "profiler_trace_{}_worker{}.json".format(self.mode, self.worker_id),
+            ),
+        )
+
         self._vector_tasks: Optional[VectorSampledTasks] = None
 
         self.sensor_preprocessor_graph = None
         self.actor_critic: Optional[ActorCriticModel] = None
+        # If not None, the model used to act (rather than `actor_critic`), e.g. the
+        # copy of `actor_critic` collecting rollouts asynchronously
+        self.acting_actor_critic: Optional[nn.Module] = None
         if self.num_samplers > 0:
             create_model_kwargs = {}
             if self.machine_params.sensor_preprocessor_graph is not None:
@@ -195,7 +238,7 @@ class OnPolicyRLEngine(object):
         self.store: Optional[torch.distributed.TCPStore] = None  # type:ignore
         if self.num_workers > 1:
             self.store = torch.distributed.TCPStore(  # type:ignore
-                "127.0.0.1",
+                self.distributed_address,
                 self.distributed_port,
                 self.num_workers,
                 self.worker_id == 0,
@@ -217,6 +260,12 @@ class OnPolicyRLEngine(object):
 
         self.deterministic_agents = deterministic_agents
 
+        # If not None, paused samplers are only masked out of the rollout storage
+        # (see `pause_samplers`) and `active_samplers` holds the storage sampler
+        # index of each running sampler (`None` if all stored samplers are running)
+        self.paused_sampler_compaction_threshold: Optional[float] = None
+        self.active_samplers: Optional[List[int]] = None
+
         self._is_closed: bool = False
 
         self.training_pipeline: Optional[TrainingPipeline] = None
@@ -224,6 +273,15 @@ class OnPolicyRLEngine(object):
         # Keeping track of metrics during training/inference
         self.single_process_metrics_queue: queue.Queue = queue.Queue()
 
+        # (phase, mean time, count) reported by the sampler processes
+        self.worker_timings_info: List[Tuple[str, float, int]] = []
+
+        # Profiler and worker timings used while collecting rollouts, these are
+        # only distinct from `profiler` and `worker_timings_info` when rollouts
+        # are collected in a background thread (see `run_async_pipeline`)
+        self.collection_profiler = self.profiler
+        self.collection_worker_timings_info = self.worker_timings_info
+
     @property
     def vector_tasks(self) -> VectorSampledTasks:
         if self._vector_tasks is None and self.num_samplers > 0:
@@ -239,7 +297,17 @@ class OnPolicyRLEngine(object):
                 initial_seed=self.seed,  # do not update the RNG state (creation might happen after seed resetting)
             )
 
-            self._vector_tasks = VectorSampledTasks(
+            backend = self.machine_params.sampler_backend
+            assert backend in ["process", "thread"], (
+                f"Unknown sampler backend {backend}"
+                f" (must be one of 'process' or 'thread')."
+            )
+            vector_tasks_class = (
+                ThreadedVectorSampledTasks
+                if backend == "thread"
+                else VectorSampledTasks
+            )
+            self._vector_tasks = vector_tasks_class(
                 make_sampler_fn=self.config.make_sampler_fn,
                 sampler_fn_args=self.get_sampler_fn_args(seeds),
                 multiprocessing_start_method="forkserver"
@@ -247,6 +315,18 @@ class OnPolicyRLEngine(object):
                 else None,
                 mp_ctx=self.mp_ctx,
                 max_processes=self.max_sampler_processes_per_worker,
+                transport=self.machine_params.sampler_transport,
+                parallel_startup=self.machine_params.fast_sampler_startup,
+                forkserver_preload=imported_module_names(type(self.config))
+                if self.machine_params.fast_sampler_startup
+                else None,
+                worker_timing_period=self.machine_params.sampler_timing_period,
+                make_batched_sampler_fn=self.config.make_batched_sampler_fn
+                if self.machine_params.batched_samplers
+                else None,
+                # Latencies are only needed (and measured) for rebalancing
+                measure_sampler_latencies=self.mode == "train"
+                and self.machine_params.sampler_rebalance_period is not None,
             )
         return self._vector_tasks
 
@@ -366,22 +446,31 @@ class OnPolicyRLEngine(object):
     def _preprocess_observations(self, batched_observations):
         if self.sensor_preprocessor_graph is None:
             return batched_observations
-        return self.sensor_preprocessor_graph.get_observations(batched_observations)
+        with self.collection_profiler.span("preprocess_observations"):
+            return self.sensor_preprocessor_graph.get_observations(
+                batched_observations
+            )
 
     def remove_paused(self, observations):
-        paused, keep, running = [], [], []
-        for it, obs in enumerate(observations):
-            if obs is None:
-                paused.append(it)
-            else:
-                keep.append(it)
-                running.append(obs)
+        if isinstance(observations, StackedObservations):
+            # Kept stacked for the observation batcher
+            keep = np.flatnonzero(observations.present).tolist()
+            paused = np.flatnonzero(~observations.present).tolist()
+            running = observations if len(paused) == 0 else observations.select(keep)
+        else:
+            paused, keep, running = [], [], []
+            for it, obs in enumerate(observations):
+                if obs is None:
+                    paused.append(it)
+                else:
+                    keep.append(it)
+                    running.append(obs)
 
         for p in reversed(paused):
             self.vector_tasks.pause_at(p)
 
         # Group samplers along new dim:
-        batch = batch_observations(running, device=self.device)
+        batch = self.observation_batcher.batch(running)
 
         return len(paused), keep, batch
 
@@ -399,16 +488,57 @@ class OnPolicyRLEngine(object):
             visualizer.collect(vector_task=self.vector_tasks, alive=keep)
         return npaused
 
-    def act(self, rollouts: RolloutStorage):
+    def pause_samplers(self, rollouts: RolloutStorage, keep: List[int]):
+        """Removes paused samplers from the rollout storage given the indices
+        `keep` (among the previously running samplers) of the samplers still
+        running.
+
+        By default the storage is compacted right away. If
+        `paused_sampler_compaction_threshold` is set, paused samplers are
+        instead removed from `active_samplers` (the storage keeps its size and
+        acting/inserting only involve the active samplers) until the fraction
+        of active samplers drops below the threshold, at which point the
+        storage is compacted.
+        """
+        if self.paused_sampler_compaction_threshold is None:
+            rollouts.sampler_select(keep)
+            return
+
+        if self.active_samplers is None:
+            self.active_samplers = list(keep)
+        else:
+            self.active_samplers = [self.active_samplers[k] for k in keep]
+
+        num_stored_samplers = rollouts.masks.shape[1]
+        if (
+            len(self.active_samplers)
+            < self.paused_sampler_compaction_threshold * num_stored_samplers
+        ):
+            rollouts.sampler_select(self.active_samplers)
+            self.active_samplers = None
+
+    def act(
+        self,
+        rollouts: RolloutStorage,
+        time_step: Optional[int] = None,
+        samplers: Optional[Sequence[int]] = None,
+    ):
+        if time_step is None:
+            time_step = rollouts.step
         with torch.no_grad():
-            step_observation = rollouts.pick_observation_step(rollouts.step)
-            memory = rollouts.pick_memory_step(rollouts.step)
-            prev_actions = rollouts.pick_prev_actions_step(rollouts.step)
-            actor_critic_output, memory = self.actor_critic(
+            step_observation = rollouts.pick_observation_step(time_step, samplers)
+            memory = rollouts.pick_memory_step(time_step, samplers)
+            prev_actions = rollouts.pick_prev_actions_step(time_step, samplers)
+            actor_critic = (
+                self.actor_critic
+                if self.acting_actor_critic is None
+                else self.acting_actor_critic
+            )
+            actor_critic_output, memory = actor_critic(
                 step_observation,
                 memory,
                 prev_actions,
-                rollouts.masks[rollouts.step : rollouts.step + 1],
+                rollouts.pick_masks_step(time_step, samplers),
             )
 
             # Assume actions do not contain a step dimension
@@ -475,10 +605,7 @@ class OnPolicyRLEngine(object):
                 else:
                     self._probe_steps = -self._probe_steps
 
-    def collect_rollout_step(self, rollouts: RolloutStorage, visualizer=None) -> int:
-        actions, actor_critic_output, memory, _ = self.act(rollouts=rollouts)
-
-        # Flatten actions
+    def _flatten_actions(self, actions: Any) -> torch.Tensor:
         flat_actions = su.flatten(self.actor_critic.action_space, actions)
 
         assert len(flat_actions.shape) == 3, (
@@ -487,41 +614,26 @@ class OnPolicyRLEngine(object):
             "to the Distribution."
         )
 
-        # Convert flattened actions into list of actions and send them
-        outputs: List[RLStepResult] = self.vector_tasks.step(
-            su.action_list(self.actor_critic.action_space, flat_actions)
-        )
-
-        # Save after task completion metrics
-        for step_result in outputs:
-            if COMPLETE_TASK_METRICS_KEY in step_result.info:
-                self.single_process_metrics_queue.put(
-                    step_result.info[COMPLETE_TASK_METRICS_KEY]
-                )
-                del step_result.info[COMPLETE_TASK_METRICS_KEY]
+        return flat_actions
 
-        rewards: Union[List, torch.Tensor]
-        observations, rewards, dones, infos = [list(x) for x in zip(*outputs)]
-
-        rewards = torch.tensor(
-            rewards, dtype=torch.float, device=self.device,  # type:ignore
-        )
+    def collect_rollout_step(self, rollouts: RolloutStorage, visualizer=None) -> int:
+        with self.collection_profiler.span("act"):
+            actions, actor_critic_output, memory, _ = self.act(
+                rollouts=rollouts, samplers=self.active_samplers
+            )
 
-        # We want rewards to have dimensions [sampler, reward]
-        if len(rewards.shape) == 1:
-            # Rewards are of shape [sampler,]
-            rewards = rewards.unsqueeze(-1)
-        elif len(rewards.shape) > 1:
-            raise NotImplementedError()
+        # Flatten actions
+        flat_actions = self._flatten_actions(actions)
+
+        # Send the flattened actions (copied to the host at once), the workers
+        # convert them into actions of their samplers
+        with self.collection_profiler.span("env_step"):
+            outputs: Sequence[RLStepResult] = self.vector_tasks.step(
+                flat_actions[0].cpu().numpy(),
+                flat_action_space=self.actor_critic.action_space,
+            )
 
-        # If done then clean the history of observations.
-        masks = torch.tensor(
-            [0.0 if done else 1.0 for done in dones],
-            dtype=torch.float32,
-            device=self.device,  # type:ignore
-        ).view(
-            -1, 1
-        )  # [sampler, 1]
+        observations, rewards, masks = self._unpack_step_outputs(outputs)
 
         npaused, keep, batch = self.remove_paused(observations)
 
@@ -529,21 +641,24 @@ class OnPolicyRLEngine(object):
         # self.probe(dones, npaused)
 
         if npaused > 0:
-            rollouts.sampler_select(keep)
-
-        rollouts.insert(
-            observations=self._preprocess_observations(batch)
-            if len(keep) > 0
-            else batch,
-            memory=self._active_memory(memory, keep),
-            actions=flat_actions[0, keep],
-            action_log_probs=actor_critic_output.distributions.log_prob(actions)[
-                0, keep
-            ],
-            value_preds=actor_critic_output.values[0, keep],
-            rewards=rewards[keep],
-            masks=masks[keep],
-        )
+            self.pause_samplers(rollouts, keep)
+
+        observations = self._preprocess_observations(batch) if len(keep) > 0 else batch
+        with self.collection_profiler.span("rollouts_insert"):
+            rollouts.insert(
+                observations=observations,
+                memory=self._active_memory(memory, keep),
+                actions=flat_actions[0, keep],
+                action_log_probs=actor_critic_output.distributions.log_prob(actions)[
+                    0, keep
+                ],
+                value_preds=actor_critic_output.values[0, keep],
+                rewards=rewards[keep],
+                masks=masks[keep],
+                samplers=self.active_samplers,
+            )
+            if self.active_samplers is not None:
+                rollouts.advance_step()
 
         # TODO we always miss tensors for the last action in the last episode of each worker
         if visualizer is not None:
@@ -559,6 +674,65 @@ class OnPolicyRLEngine(object):
 
         return npaused
 
+    @staticmethod
+    def _num_paused(observations: Sequence[Optional[Any]]) -> int:
+        """Number of samplers without an observation (to be paused)."""
+        if isinstance(observations, StackedObservations):
+            return observations.num_missing
+        return sum(obs is None for obs in observations)
+
+    def _unpack_step_outputs(
+        self, outputs: Sequence[RLStepResult]
+    ) -> Tuple[Sequence[Any], torch.Tensor, torch.Tensor]:
+        """Extracts the observations, rewards (as a `[sampler, reward]`
+        tensor) and masks (as a `[sampler, 1]` tensor) from the step results
+        and saves any after task completion metrics.
+
+        The observations of `StackedStepResults` are returned as (stacked)
+        `StackedObservations`.
+        """
+        stacked = isinstance(outputs, StackedStepResults)
+
+        # Save after task completion metrics
+        for info in outputs.infos if stacked else (sr.info for sr in outputs):
+            if COMPLETE_TASK_METRICS_KEY in info:
+                self.single_process_metrics_queue.put(info[COMPLETE_TASK_METRICS_KEY])
+                del info[COMPLETE_TASK_METRICS_KEY]
+            if WORKER_TIMINGS_KEY in info:
+                for phase, (total, count) in info.pop(WORKER_TIMINGS_KEY).items():
+                    self.collection_worker_timings_info.append(
+                        (phase, total / count, count)
+                    )
+
+        rewards: Union[List, torch.Tensor]
+        if stacked:
+            observations = outputs.observations
+            rewards, dones = outputs.rewards, outputs.dones
+        else:
+            observations, rewards, dones, infos = [list(x) for x in zip(*outputs)]
+
+        rewards = torch.as_tensor(
+            rewards, dtype=torch.float, device=self.device,  # type:ignore
+        )
+
+        # We want rewards to have dimensions [sampler, reward]
+        if len(rewards.shape) == 1:
+            # Rewards are of shape [sampler,]
+            rewards = rewards.unsqueeze(-1)
+        elif len(rewards.shape) > 1:
+            raise NotImplementedError()
+
+        # If done then clean the history of observations.
+        masks = torch.as_tensor(
+            ~dones if stacked else [0.0 if done else 1.0 for done in dones],
+            dtype=torch.float32,
+            device=self.device,  # type:ignore
+        ).view(
+            -1, 1
+        )  # [sampler, 1]
+
+        return observations, rewards, masks
+
     def close(self, verbose=True):
         if "_is_closed" in self.__dict__ and self._is_closed:
             return
@@ -615,6 +789,7 @@ class OnPolicyTrainer(OnPolicyRLEngine):
         worker_id: int = 0,
         num_workers: int = 1,
         device: Union[str, torch.device, int] = "cpu",
+        distributed_address: str = "127.0.0.1",
         distributed_port: int = 0,
         deterministic_agents: bool = False,
         distributed_preemption_threshold: float = 0.7,
@@ -634,6 +809,7 @@ class OnPolicyTrainer(OnPolicyRLEngine):
             worker_id=worker_id,
             num_workers=num_workers,
             device=device,
+            distributed_address=distributed_address,
             distributed_port=distributed_port,
             deterministic_agents=deterministic_agents,
             max_sampler_processes_per_worker=max_sampler_processes_per_worker,
@@ -655,12 +831,42 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                 optimizer=self.optimizer
             )
 
+        # Built after the optimizer as it may replace parameters (e.g. KFAC)
+        self.gradient_reducer: Optional[BucketedGradientReducer] = None
+        if (
+            self.is_distributed
+            and self.machine_params.gradient_bucket_size_mb is not None
+        ):
+            self.gradient_reducer = BucketedGradientReducer(
+                params=self.actor_critic.parameters(),
+                bucket_size_mb=self.machine_params.gradient_bucket_size_mb,
+                overlap=self.machine_params.overlap_gradient_reduction,
+            )
+        compressors = [self.training_pipeline.gradient_compressor] + [
+            stage.gradient_compressor
+            for stage in self.training_pipeline.pipeline_stages
+        ]
+        assert (
+            not self.is_distributed
+            or self.gradient_reducer is not None
+            or all(compressor is None for compressor in compressors)
+        ), (
+            "Gradient compression requires gradient bucketing"
+            " (`MachineParams.gradient_bucket_size_mb` must not be `None`)."
+        )
+
+        self.rollout_done_notifier: Optional[RolloutDoneNotifier] = None
         if self.is_distributed:
-            # Tracks how many workers have finished their rollout
-            self.num_workers_done = torch.distributed.PrefixStore(  # type:ignore
-                "num_workers_done", self.store
+            # Notifies (without polling the store) that enough workers have finished
+            # their rollout to preempt stragglers
+            self.rollout_done_notifier = RolloutDoneNotifier(
+                store=self.store,
+                address=self.distributed_address,
+                port=self.distributed_port,
+                world_size=self.num_workers,
+                threshold=distributed_preemption_threshold,
             )
-            # Tracks the number of steps taken by each worker in current rollout
+            # Tracks the number of steps taken by each worker in off-policy updates
             self.num_workers_steps = torch.distributed.PrefixStore(  # type:ignore
                 "num_workers_steps", self.store
             )
@@ -670,17 +876,58 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                 "offpolicy_epoch_done", self.store
             )
         else:
-            self.num_workers_done = None
             self.num_workers_steps = None
             self.distributed_preemption_threshold = 1.0
             self.offpolicy_epoch_done = None
 
         # Keeping track of training state
         self.tracking_info: Dict[str, List] = defaultdict(lambda: [])
+        # Tracking info of rollout collection (see `collection_profiler`)
+        self.collection_tracking_info = self.tracking_info
         self.former_steps: Optional[int] = None
         self.last_log: Optional[int] = None
         self.last_save: Optional[int] = None
 
+        self.rollout_collection_mode = self.machine_params.rollout_collection_mode
+        assert self.rollout_collection_mode in [
+            "sync",
+            "split_groups",
+            "ready_subsets",
+        ], (
+            f"Unknown rollout collection mode {self.rollout_collection_mode}"
+            f" (must be one of 'sync', 'split_groups' or 'ready_subsets')."
+        )
+        # Groups of samplers whose environments are stepping while we
+        # run inference for the other groups (in "split_groups" mode).
+        self._in_flight_groups: Optional[List[Tuple]] = None
+        # Sampler processes with a pending step (in "ready_subsets" mode) and
+        # number of rollout steps collected so far in the current rollout.
+        self._in_flight_processes: Optional[Dict[int, Tuple]] = None
+        self._num_ready_subsets_steps = 0
+
+        self.sampler_rebalance_period = self.machine_params.sampler_rebalance_period
+        assert (
+            self.sampler_rebalance_period is None
+            or not self.machine_params.batched_samplers
+        ), "Batched task samplers cannot be rebalanced."
+
+        # Whether rollouts are collected by a background thread (see
+        # `run_async_pipeline`)
+        self.async_rollouts = self.machine_params.async_rollouts
+        assert not self.async_rollouts or (
+            self.rollout_collection_mode == "sync"
+            and self.sampler_rebalance_period is None
+            and self.training_pipeline.advance_scene_rollout_period is None
+            and all(
+                stage.offpolicy_component is None
+                for stage in self.training_pipeline.pipeline_stages
+            )
+        ), (
+            "Asynchronous rollouts require the 'sync' rollout collection mode and do"
+            " not support sampler rebalancing, forced scene advances nor off-policy"
+            " updates."
+        )
+
     def advance_seed(
         self, seed: Optional[int], return_same_seed_per_worker=False
     ) -> Optional[int]:
@@ -816,9 +1063,14 @@ class OnPolicyTrainer(OnPolicyRLEngine):
     def log_interval(self):
         return self.training_pipeline.metric_accumulate_interval
 
-    def act(self, rollouts: RolloutStorage):
+    def act(
+        self,
+        rollouts: RolloutStorage,
+        time_step: Optional[int] = None,
+        samplers: Optional[Sequence[int]] = None,
+    ):
         actions, actor_critic_output, memory, step_observation = super().act(
-            rollouts=rollouts
+            rollouts=rollouts, time_step=time_step, samplers=samplers
         )
 
         if self.is_distributed:
@@ -848,55 +1100,331 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                     approx_steps
                 ),
             }
-            self.tracking_info["teacher"].append(
+            self.collection_tracking_info["teacher"].append(
                 ("teacher_package", teacher_force_info, actions.nelement())
             )
 
-        self.step_count += num_active_samplers
+        if not self.async_rollouts:
+            # Asynchronous rollouts are counted by the learner once consumed
+            self.step_count += num_active_samplers
 
         return actions, actor_critic_output, memory, step_observation
 
-    def update(self, rollouts: RolloutStorage):
-        advantages = rollouts.returns[:-1] - rollouts.value_preds[:-1]
+    def _rollout_process_groups(self) -> List[List[int]]:
+        num_processes = self.vector_tasks.num_processes
+        num_groups = self.machine_params.num_rollout_groups
+        if num_groups > num_processes:
+            get_logger().warning(
+                f"Requested {num_groups} rollout groups but only {num_processes} sampler"
+                f" processes are available, using {num_processes} groups instead."
+            )
+            num_groups = num_processes
+        return partition_sequence(list(range(num_processes)), num_groups)
+
+    def _act_and_send(
+        self, rollouts: RolloutStorage, time_step: int, process_inds: List[int]
+    ) -> Tuple:
+        samplers = [
+            sampler_index
+            for inds in self.vector_tasks.sampler_indices_for_processes(process_inds)
+            for sampler_index in inds
+        ]
+        with self.collection_profiler.span("act"):
+            actions, actor_critic_output, memory, _ = self.act(
+                rollouts=rollouts, time_step=time_step, samplers=samplers
+            )
+        flat_actions = self._flatten_actions(actions)
+        self.vector_tasks.async_step(
+            flat_actions[0].cpu().numpy(),
+            process_inds=process_inds,
+            flat_action_space=self.actor_critic.action_space,
+        )
+        return process_inds, samplers, actions, flat_actions, actor_critic_output, memory
 
-        for e in range(self.training_pipeline.update_repeats):
-            data_generator = rollouts.recurrent_generator(
-                advantages, self.training_pipeline.num_mini_batch
+    def collect_split_groups_rollout_step(
+        self, rollouts: RolloutStorage, is_last_step: bool
+    ) -> int:
+        """Collects one rollout step with samplers split into groups (of
+        worker processes) so that policy inference for one group overlaps with
+        environment stepping for the others.
+
+        As soon as the results of a group for the current step are inserted
+        into `rollouts`, the actions for the group's next step are computed
+        and sent, so that group keeps stepping while we wait for the remaining
+        groups. Unless `is_last_step` is `True`, the groups are left stepping
+        on return.
+
+        # Returns
+
+        The number of samplers which ran out of tasks (pausing is not
+        supported in this mode, nothing is inserted if this is not 0).
+        """
+        if self._in_flight_groups is None:
+            self._in_flight_groups = [
+                self._act_and_send(rollouts, rollouts.step, process_inds)
+                for process_inds in self._rollout_process_groups()
+            ]
+
+        in_flight, self._in_flight_groups = self._in_flight_groups, []
+        for group_ind, group in enumerate(in_flight):
+            (
+                process_inds,
+                samplers,
+                actions,
+                flat_actions,
+                actor_critic_output,
+                memory,
+            ) = group
+            with self.collection_profiler.span("env_step"):
+                outputs = self.vector_tasks.wait_step(process_inds)
+            observations, rewards, masks = self._unpack_step_outputs(outputs)
+
+            num_paused = self._num_paused(observations)
+            if num_paused > 0:
+                # Read the pending results of the later groups and of the earlier
+                # groups whose next step was already sent
+                for other_group in in_flight[group_ind + 1 :] + self._in_flight_groups:
+                    self.vector_tasks.wait_step(other_group[0])
+                self._in_flight_groups = None
+                return num_paused
+
+            rollouts.insert(
+                observations=self._preprocess_observations(
+                    self.observation_batcher.batch(observations)
+                ),
+                memory=memory,
+                actions=flat_actions[0],
+                action_log_probs=actor_critic_output.distributions.log_prob(actions)[
+                    0
+                ],
+                value_preds=actor_critic_output.values[0],
+                rewards=rewards,
+                masks=masks,
+                samplers=samplers,
             )
 
+            if not is_last_step:
+                self._in_flight_groups.append(
+                    self._act_and_send(rollouts, rollouts.step + 1, process_inds)
+                )
+
+        rollouts.advance_step()
+
+        if is_last_step:
+            self._in_flight_groups = None
+
+        return 0
+
+    def _act_and_send_per_process(
+        self, rollouts: RolloutStorage, process_inds: List[int]
+    ) -> None:
+        """Runs inference for the samplers of the given processes (each at its
+        own step in `rollouts`) and sends the resulting actions."""
+        samplers_per_process = self.vector_tasks.sampler_indices_for_processes(
+            process_inds
+        )
+        samplers = [s for process_samplers in samplers_per_process for s in process_samplers]
+        with self.collection_profiler.span("act"):
+            actions, actor_critic_output, memory, _ = self.act(
+                rollouts=rollouts,
+                time_step=[rollouts.sampler_steps[s] for s in samplers],
+                samplers=samplers,
+            )
+        flat_actions = self._flatten_actions(actions)
+        self.vector_tasks.async_step(
+            flat_actions[0].cpu().numpy(),
+            process_inds=process_inds,
+            flat_action_space=self.actor_critic.action_space,
+        )
+
+        action_log_probs = actor_critic_output.distributions.log_prob(actions)
+        start = 0
+        for process_ind, process_samplers in zip(process_inds, samplers_per_process):
+            local_inds = list(range(start, start + len(process_samplers)))
+            start += len(process_samplers)
+            self._in_flight_processes[process_ind] = (
+                process_samplers,
+                flat_actions[0, local_inds],
+                action_log_probs[0, local_inds],
+                actor_critic_output.values[0, local_inds],
+                self._active_memory(memory, local_inds),
+            )
+
+    def collect_ready_subsets_rollout_step(
+        self, rollouts: RolloutStorage, is_last_step: bool
+    ) -> int:
+        """Collects (at least) one rollout step for every sampler without
+        waiting for all sampler processes at every step.
+
+        Results are processed for whichever sampler processes are ready and
+        inference is run for all of them together (each sampler at its own
+        step, tracked in `rollouts.sampler_steps`) so that fast processes can
+        run ahead (up to the end of the rollout) while a slow process is busy,
+        e.g. resetting a scene. We return once every sampler has collected as
+        many steps as calls to this method were made in the current rollout.
+        If `is_last_step` is `True`, all samplers are brought to the same
+        number of steps (the rollout length or, when preempting, the largest
+        number of steps any sampler has or will have collected) and no
+        process is left stepping.
+
+        # Returns
+
+        The number of samplers which ran out of tasks (pausing is not
+        supported in this mode, the rollout is abandoned if this is not 0).
+        """
+        if self._in_flight_processes is None:
+            rollouts.start_per_sampler_steps()
+            self._in_flight_processes = {}
+            self._num_ready_subsets_steps = 0
+            self._act_and_send_per_process(
+                rollouts, list(range(self.vector_tasks.num_processes))
+            )
+
+        self._num_ready_subsets_steps += 1
+        target_step = rollouts.step + self._num_ready_subsets_steps
+
+        max_step = rollouts.num_steps
+        if is_last_step and target_step < rollouts.num_steps:
+            # We're preempted: bring every sampler to the number of steps the
+            # most advanced sampler will have collected after its pending step.
+            max_step = max(
+                [target_step]
+                + [
+                    rollouts.sampler_steps[s] + 1
+                    for pending in self._in_flight_processes.values()
+                    for s in pending[0]
+                ]
+            )
+
+        while len(self._in_flight_processes) > 0 and (
+            is_last_step or min(rollouts.sampler_steps) < target_step
+        ):
+            to_send = []
+            with self.collection_profiler.span("env_step"):
+                ready = self.vector_tasks.wait_step_ready()
+            for process_ind, outputs in ready:
+                (
+                    samplers,
+                    flat_actions,
+                    action_log_probs,
+                    values,
+                    memory,
+                ) = self._in_flight_processes.pop(process_ind)
+
+                observations, rewards, masks = self._unpack_step_outputs(outputs)
+
+                num_paused = self._num_paused(observations)
+                if num_paused > 0:
+                    self.vector_tasks.wait_step(list(self._in_flight_processes.keys()))
+                    self._in_flight_processes = None
+                    rollouts.sampler_steps = None
+                    return num_paused
+
+                rollouts.insert(
+                    observations=self._preprocess_observations(
+                        self.observation_batcher.batch(observations)
+                    ),
+                    memory=memory,
+                    actions=flat_actions,
+                    action_log_probs=action_log_probs,
+                    value_preds=values,
+                    rewards=rewards,
+                    masks=masks,
+                    samplers=samplers,
+                )
+
+                if rollouts.sampler_steps[samplers[0]] < max_step:
+                    to_send.append(process_ind)
+
+            if len(to_send) > 0:
+                self._act_and_send_per_process(rollouts, to_send)
+
+        if is_last_step:
+            assert len(self._in_flight_processes) == 0
+            rollouts.finish_per_sampler_steps()
+            self._in_flight_processes = None
+
+        return 0
+
+    def update(
+        self, rollouts: RolloutStorage, advantages: Optional[torch.Tensor] = None
+    ):
+        if advantages is None:
+            advantages = rollouts.returns[:-1] - rollouts.value_preds[:-1]
+
+        actor_critic = (
+            self.actor_critic
+            if isinstance(self.actor_critic, ActorCriticModel)
+            else cast(ActorCriticModel, self.actor_critic.module)
+        )
+        # Memoryless models are trained on shuffled transitions rather than on
+        # (contiguous in time) sampler trajectories
+        is_memoryless = actor_critic.recurrent_memory_specification is None
+        # Models accepting an `episode_starts` argument are given the episode
+        # boundaries precomputed by the rollout storage
+        forward_kwargs_names = {"episode_starts"} & set(
+            inspect.signature(actor_critic.forward).parameters.keys()
+        )
+
+        for e in range(self.training_pipeline.update_repeats):
+            if is_memoryless:
+                data_generator = rollouts.feed_forward_generator(
+                    advantages, self.training_pipeline.num_mini_batch
+                )
+            elif self.training_pipeline.recurrent_chunk_length is not None:
+                data_generator = rollouts.chunked_recurrent_generator(
+                    advantages, self.training_pipeline.num_mini_batch
+                )
+            else:
+                data_generator = rollouts.recurrent_generator(
+                    advantages,
+                    self.training_pipeline.num_mini_batch,
+                    shuffle_samplers=self.training_pipeline.shuffle_minibatch_samplers,
+                    zero_copy=self.training_pipeline.zero_copy_minibatches,
+                )
+
             for bit, batch in enumerate(data_generator):
                 # masks is always [steps, samplers, 1]:
                 num_rollout_steps, num_samplers = batch["masks"].shape[:2]
                 bsize = num_rollout_steps * num_samplers
 
-                actor_critic_output, memory = self.actor_critic(
-                    observations=batch["observations"],
-                    memory=batch["memory"],
-                    prev_actions=batch["prev_actions"],
-                    masks=batch["masks"],
-                )
+                with self.profiler.span("update/forward"):
+                    actor_critic_output, memory = self.actor_critic(
+                        observations=batch["observations"],
+                        memory=batch["memory"],
+                        prev_actions=batch["prev_actions"],
+                        masks=batch["masks"],
+                        **{
+                            name: batch[name]
+                            for name in forward_kwargs_names
+                            if name in batch
+                        },
+                    )
 
                 info: Dict[str, float] = {}
 
                 total_loss: Optional[torch.Tensor] = None
-                for loss_name in self.training_pipeline.current_stage_losses:
-                    loss, loss_weight = (
-                        self.training_pipeline.current_stage_losses[loss_name],
-                        self.training_pipeline.current_stage_loss_weights[loss_name],
-                    )
+                with self.profiler.span("update/loss"):
+                    for loss_name in self.training_pipeline.current_stage_losses:
+                        loss, loss_weight = (
+                            self.training_pipeline.current_stage_losses[loss_name],
+                            self.training_pipeline.current_stage_loss_weights[
+                                loss_name
+                            ],
+                        )
 
-                    current_loss, current_info = loss.loss(
-                        step_count=self.step_count,
-                        batch=batch,
-                        actor_critic_output=actor_critic_output,
-                    )
-                    if total_loss is None:
-                        total_loss = loss_weight * current_loss
-                    else:
-                        total_loss = total_loss + loss_weight * current_loss
+                        current_loss, current_info = loss.loss(
+                            step_count=self.step_count,
+                            batch=batch,
+                            actor_critic_output=actor_critic_output,
+                        )
+                        if total_loss is None:
+                            total_loss = loss_weight * current_loss
+                        else:
+                            total_loss = total_loss + loss_weight * current_loss
 
-                    for key in current_info:
-                        info[loss_name + "/" + key] = current_info[key]
+                        for key in current_info:
+                            info[loss_name + "/" + key] = current_info[key]
 
                 assert (
                     total_loss is not None
@@ -956,27 +1484,48 @@ class OnPolicyTrainer(OnPolicyRLEngine):
 
     def backprop_step(self, total_loss):
         self.optimizer.zero_grad()  # type: ignore
+        if self.gradient_reducer is not None:
+            self.gradient_reducer.compressor = (
+                self.training_pipeline.current_stage_gradient_compressor
+            )
+            self.gradient_reducer.prepare()
         if isinstance(total_loss, torch.Tensor):
-            total_loss.backward()
+            with self.profiler.span("update/backward"):
+                total_loss.backward()
 
-        if self.is_distributed:
-            # From https://github.com/pytorch/pytorch/issues/43135
-            reductions = []
-            for p in self.actor_critic.parameters():
-                # you can also organize grads to larger buckets to make allreduce more efficient
-                if p.requires_grad:
-                    if p.grad is None:
-                        p.grad = torch.zeros_like(p.data)
-                    reductions.append(
-                        dist.all_reduce(p.grad, async_op=True,)
-                    )  # synchronize
-            for reduction in reductions:
-                reduction.wait()
-
-        nn.utils.clip_grad_norm_(
-            self.actor_critic.parameters(), self.training_pipeline.max_grad_norm,  # type: ignore
-        )
-        self.optimizer.step()  # type: ignore
+        if self.gradient_reducer is not None:
+            with self.profiler.span("update/all_reduce"):
+                self.gradient_reducer.reduce()
+            self.tracking_info["grad_reduction"].append(
+                (
+                    "grad_reduction",
+                    {
+                        f"perf/grad_reduction/{k}": v
+                        for k, v in self.gradient_reducer.pop_stats().items()
+                    },
+                    1,
+                )
+            )
+        elif self.is_distributed:
+            with self.profiler.span("update/all_reduce"):
+                # From https://github.com/pytorch/pytorch/issues/43135
+                reductions = []
+                for p in self.actor_critic.parameters():
+                    # you can also organize grads to larger buckets to make allreduce more efficient
+                    if p.requires_grad:
+                        if p.grad is None:
+                            p.grad = torch.zeros_like(p.data)
+                        reductions.append(
+                            dist.all_reduce(p.grad, async_op=True,)
+                        )  # synchronize
+                for reduction in reductions:
+                    reduction.wait()
+
+        with self.profiler.span("update/optimizer_step"):
+            nn.utils.clip_grad_norm_(
+                self.actor_critic.parameters(), self.training_pipeline.max_grad_norm,  # type: ignore
+            )
+            self.optimizer.step()  # type: ignore
 
     def offpolicy_update(
         self,
@@ -1115,6 +1664,65 @@ class OnPolicyTrainer(OnPolicyRLEngine):
             {"teacher_forcing_mask": teacher_forcing_mask},
         )
 
+    def rebalance_samplers(self, rollouts: RolloutStorage):
+        """Migrates samplers between sampler processes based on their measured
+        step latency (see `VectorSampledTasks.rebalance`) and restarts the
+        stored (first) rollout step of the migrated samplers, which now run a
+        new task."""
+        all_stats = self.vector_tasks.latency_stats()
+        migrated = self.vector_tasks.rebalance()
+
+        num_steps = sum(stats.num_steps for stats in all_stats)
+        num_resets = sum(stats.num_resets for stats in all_stats)
+        self.tracking_info["sampler_latency"].append(
+            (
+                "sampler_latency",
+                {
+                    "sampler_latency/step": sum(s.step_time for s in all_stats)
+                    / max(num_steps, 1),
+                    "sampler_latency/reset": sum(s.reset_time for s in all_stats)
+                    / max(num_resets, 1),
+                    "sampler_latency/migrated": len(migrated),
+                },
+                1,
+            )
+        )
+        # The latency histograms the rebalancing was based on
+        bin_edges = SamplerLatencyStats.bin_edges
+        self.tracking_info["sampler_latency"].append(
+            (
+                "histograms",
+                {
+                    "sampler_latency/step": (
+                        bin_edges,
+                        sum(stats.step_histogram for stats in all_stats),
+                    ),
+                    "sampler_latency/reset": (
+                        bin_edges,
+                        sum(stats.reset_histogram for stats in all_stats),
+                    ),
+                },
+                1,
+            )
+        )
+
+        if len(migrated) == 0:
+            return
+
+        # Fetched with a single round trip to the sampler processes
+        all_observations = self.vector_tasks.call("get_observations")
+        observations = [all_observations[sampler_index] for sampler_index in migrated]
+        rollouts.insert_observations(
+            self._preprocess_observations(
+                self.observation_batcher.batch(observations)
+            ),
+            time_step=0,
+            samplers=migrated,
+        )
+        # The migrated samplers start a new episode
+        rollouts.masks[0, migrated] = 0
+        rollouts.prev_actions[0, migrated] = 0
+
     def send_package(self, tracking_info: Dict[str, List]):
         logging_pkg = LoggingPackage(
             mode=self.mode,
@@ -1125,12 +1733,25 @@ class OnPolicyTrainer(OnPolicyRLEngine):
 
         self.aggregate_task_metrics(logging_pkg=logging_pkg)
 
+        for name, (mean_time, count) in self.profiler.pop().items():
+            logging_pkg.add_train_info_dict(
+                train_info_dict={f"perf/engine/{name}": mean_time}, n=count
+            )
+        for phase, mean_time, count in self.worker_timings_info:
+            logging_pkg.add_train_info_dict(
+                train_info_dict={f"perf/worker/{phase}": mean_time}, n=count
+            )
+        self.worker_timings_info.clear()
+
         for (info_type, train_info_dict, n) in itertools.chain(*tracking_info.values()):
             if n < 0:
                 get_logger().warning(
                     f"Obtained a train_info_dict with {n} elements."
                     f" Full info: ({info_type}, {train_info_dict}, {n})."
                 )
+            elif info_type == "histograms":
+                for name, (bin_edges, counts) in train_info_dict.items():
+                    logging_pkg.add_histogram(name, bin_edges, counts)
             elif info_type == "losses":
                 logging_pkg.add_train_info_dict(
                     train_info_dict={
@@ -1143,6 +1764,60 @@ class OnPolicyTrainer(OnPolicyRLEngine):
 
         self.results_queue.put(logging_pkg)
 
+    def sum_rollout_steps(self):
+        """Sets the step count to the number of steps collected (since
+        `former_steps`) by all distributed workers, once all of them are done
+        collecting the current rollout."""
+        # Sum the steps (and count the workers) once all workers are done
+        steps_and_done = torch.tensor(
+            [self.step_count - self.former_steps, 1], device=self.device
+        )
+        dist.all_reduce(steps_and_done)
+        steps, ndone = steps_and_done.tolist()
+        assert ndone == self.num_workers, "# workers done {} != # workers {}".format(
+            ndone, self.num_workers
+        )
+
+        # get the actual step_count
+        self.step_count = steps + self.former_steps
+
+    def log_and_save(self, reseed_samplers: bool = True):
+        """Sends the tracked training info to the runner and saves a
+        checkpoint, if due after the latest update.
+
+        # Parameters
+
+        reseed_samplers : Whether to reseed the samplers (deterministically)
+            before saving.
+        """
+        if (
+            self.training_pipeline.total_steps - self.last_log >= self.log_interval
+            or self.training_pipeline.current_stage.is_complete
+        ):
+            with self.profiler.span("send_package"):
+                self.send_package(tracking_info=self.tracking_info)
+            self.tracking_info.clear()
+            self.last_log = self.training_pipeline.total_steps
+
+        # save for every interval-th episode or for the last epoch
+        if (
+            self.checkpoints_dir != ""
+            and self.training_pipeline.save_interval > 0
+            and (
+                self.training_pipeline.total_steps - self.last_save
+                >= self.training_pipeline.save_interval
+                or self.training_pipeline.current_stage.is_complete
+            )
+        ):
+            if reseed_samplers:
+                self.deterministic_seeds()
+            if self.worker_id == 0:
+                with self.profiler.span("checkpoint_save"):
+                    model_path = self.checkpoint_save()
+                if self.checkpoints_queue is not None:
+                    self.checkpoints_queue.put(("eval", model_path))
+            self.last_save = self.training_pipeline.total_steps
+
     def run_pipeline(self, rollouts: RolloutStorage):
         self.initialize_rollouts(rollouts)
         self.tracking_info.clear()
@@ -1152,48 +1827,66 @@ class OnPolicyTrainer(OnPolicyRLEngine):
 
         offpolicy_data_iterator: Optional[Iterator] = None
 
+        # Rollout storage is fully allocated after the first rollout
+        log_storage_nbytes = self.worker_id == 0
+
         while True:
             self.training_pipeline.before_rollout()
             if self.training_pipeline.current_stage is None:
                 break
+            self.profiler.before_rollout(self.training_pipeline.rollout_count)
 
             if self.is_distributed:
-                self.num_workers_done.set("done", str(0))
-                self.num_workers_steps.set("steps", str(0))
-                # Ensure all workers are done before incrementing num_workers_{steps, done}
-                dist.barrier()
+                self.rollout_done_notifier.start()
 
             self.former_steps = self.step_count
             for step in range(self.training_pipeline.num_steps):
-                num_paused = self.collect_rollout_step(rollouts=rollouts)
-                if num_paused > 0:
-                    raise NotImplementedError(
-                        "When trying to get a new task from a task sampler (using the `.next_task()` method)"
-                        " the task sampler returned `None`. This is not currently supported during training"
-                        " (and almost certainly a bug in the implementation of the task sampler or in the "
-                        " initialization of the task sampler for training)."
-                    )
-
+                preempt = False
                 if self.is_distributed:
                     # Preempt stragglers
                     # Each worker will stop collecting steps for the current rollout whenever a
                     # 100 * distributed_preemption_threshold percentage of workers are finished collecting their
                     # rollout steps and we have collected at least 25% but less than 90% of the steps.
-                    num_done = int(self.num_workers_done.get("done"))
-                    if (
-                        num_done
-                        > self.distributed_preemption_threshold * self.num_workers
+                    # We decide before collecting the step as, in "split_groups" mode, we must
+                    # know whether this is the last step before sending the next actions.
+                    preempt = (
+                        self.rollout_done_notifier.notified
                         and 0.25 * self.training_pipeline.num_steps
                         <= step
                         < 0.9 * self.training_pipeline.num_steps
-                    ):
-                        get_logger().debug(
-                            "{} worker {} narrowed rollouts after {} steps (out of {}) with {} workers done".format(
-                                self.mode, self.worker_id, rollouts.step, step, num_done
-                            )
+                    )
+
+                is_last_step = preempt or step == self.training_pipeline.num_steps - 1
+                if self.rollout_collection_mode == "split_groups":
+                    num_paused = self.collect_split_groups_rollout_step(
+                        rollouts=rollouts, is_last_step=is_last_step,
+                    )
+                elif self.rollout_collection_mode == "ready_subsets":
+                    num_paused = self.collect_ready_subsets_rollout_step(
+                        rollouts=rollouts, is_last_step=is_last_step,
+                    )
+                else:
+                    num_paused = self.collect_rollout_step(rollouts=rollouts)
+                if num_paused > 0:
+                    raise NotImplementedError(
+                        "When trying to get a new task from a task sampler (using the `.next_task()` method)"
+                        " the task sampler returned `None`. This is not currently supported during training"
+                        " (and almost certainly a bug in the implementation of the task sampler or in the "
+                        " initialization of the task sampler for training)."
+                    )
+
+                if preempt:
+                    get_logger().debug(
+                        "{} worker {} narrowed rollouts after {} steps (out of {}) with at least {} workers done".format(
+                            self.mode,
+                            self.worker_id,
+                            rollouts.step,
+                            step,
+                            self.rollout_done_notifier.num_done_to_notify,
                         )
-                        rollouts.narrow()
-                        break
+                    )
+                    rollouts.narrow()
+                    break
 
             with torch.no_grad():
                 actor_critic_output, _ = self.actor_critic(
@@ -1207,71 +1900,52 @@ class OnPolicyTrainer(OnPolicyRLEngine):
 
             if self.is_distributed:
                 # Mark that a worker is done collecting experience
-                self.num_workers_done.add("done", 1)
-                self.num_workers_steps.add("steps", self.step_count - self.former_steps)
+                self.rollout_done_notifier.finish()
 
-                # Ensure all workers are done before updating step counter
-                dist.barrier()
-
-                ndone = int(self.num_workers_done.get("done"))
-                assert (
-                    ndone == self.num_workers
-                ), "# workers done {} != # workers {}".format(ndone, self.num_workers)
+                self.sum_rollout_steps()
 
-                # get the actual step_count
-                self.step_count = (
-                    int(self.num_workers_steps.get("steps")) + self.former_steps
+            with self.profiler.span("compute_returns"):
+                rollouts.compute_returns(
+                    next_value=actor_critic_output.values.detach(),
+                    use_gae=self.training_pipeline.use_gae,
+                    gamma=self.training_pipeline.gamma,
+                    tau=self.training_pipeline.gae_lambda,
                 )
 
-            rollouts.compute_returns(
-                next_value=actor_critic_output.values.detach(),
-                use_gae=self.training_pipeline.use_gae,
-                gamma=self.training_pipeline.gamma,
-                tau=self.training_pipeline.gae_lambda,
-            )
-
-            self.update(rollouts=rollouts)  # here we synchronize
+            with self.profiler.span("update"):
+                self.update(rollouts=rollouts)  # here we synchronize
             self.training_pipeline.rollout_count += 1
 
             rollouts.after_update()
 
+            if log_storage_nbytes:
+                self.log_storage_nbytes(rollouts)
+                log_storage_nbytes = False
+
+            if (
+                self.sampler_rebalance_period is not None
+                and self.training_pipeline.rollout_count
+                % self.sampler_rebalance_period
+                == 0
+            ):
+                with self.profiler.span("rebalance_samplers"):
+                    self.rebalance_samplers(rollouts)
+
             if self.training_pipeline.current_stage.offpolicy_component is not None:
                 offpolicy_component = (
                     self.training_pipeline.current_stage.offpolicy_component
                 )
-                offpolicy_data_iterator = self.offpolicy_update(
-                    updates=offpolicy_component.updates,
-                    data_iterator=offpolicy_data_iterator,
-                    data_iterator_builder=offpolicy_component.data_iterator_builder,
-                )
+                with self.profiler.span("offpolicy_update"):
+                    offpolicy_data_iterator = self.offpolicy_update(
+                        updates=offpolicy_component.updates,
+                        data_iterator=offpolicy_data_iterator,
+                        data_iterator_builder=offpolicy_component.data_iterator_builder,
+                    )
 
             if self.lr_scheduler is not None:
                 self.lr_scheduler.step(epoch=self.training_pipeline.total_steps)
 
-            if (
-                self.training_pipeline.total_steps - self.last_log >= self.log_interval
-                or self.training_pipeline.current_stage.is_complete
-            ):
-                self.send_package(tracking_info=self.tracking_info)
-                self.tracking_info.clear()
-                self.last_log = self.training_pipeline.total_steps
-
-            # save for every interval-th episode or for the last epoch
-            if (
-                self.checkpoints_dir != ""
-                and self.training_pipeline.save_interval > 0
-                and (
-                    self.training_pipeline.total_steps - self.last_save
-                    >= self.training_pipeline.save_interval
-                    or self.training_pipeline.current_stage.is_complete
-                )
-            ):
-                self.deterministic_seeds()
-                if self.worker_id == 0:
-                    model_path = self.checkpoint_save()
-                    if self.checkpoints_queue is not None:
-                        self.checkpoints_queue.put(("eval", model_path))
-                self.last_save = self.training_pipeline.total_steps
+            self.log_and_save()
 
             if (self.training_pipeline.advance_scene_rollout_period is not None) and (
                 self.training_pipeline.rollout_count
@@ -1286,6 +1960,233 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                 self.vector_tasks.next_task(force_advance_scene=True)
                 self.initialize_rollouts(rollouts)
 
+    def collect_async_rollout(
+        self, rollouts: RolloutStorage
+    ) -> Tuple[
+        Dict[str, List], Dict[str, Tuple[float, int]], List[Tuple[str, float, int]]
+    ]:
+        """Collects a complete rollout (with the acting model), called from
+        the collection thread of `run_async_pipeline`.
+
+        # Returns
+
+        The tracking info, profiler timings and worker timings of the
+        collection of the rollout, which the collection thread does not share
+        with the learner but hands over along with the rollout.
+        """
+        for _ in range(rollouts.num_steps):
+            num_paused = self.collect_rollout_step(rollouts=rollouts)
+            if num_paused > 0:
+                raise NotImplementedError(
+                    "Task samplers returning `None` tasks are not supported during"
+                    " training."
+                )
+
+        tracking_info = dict(self.collection_tracking_info)
+        self.collection_tracking_info.clear()
+        worker_timings_info = list(self.collection_worker_timings_info)
+        self.collection_worker_timings_info.clear()
+        return tracking_info, self.collection_profiler.pop(), worker_timings_info
+
+    def vtrace_advantages(self, rollouts: RolloutStorage) -> torch.Tensor:
+        """Replaces the values and action log probabilities stored by the
+        (behaviour) acting model in `rollouts` by those of the learner and
+        computes V-trace returns, see `RolloutStorage.compute_vtrace_returns`.
+
+        # Returns
+
+        The advantages.
+        """
+        actor_critic = (
+            self.actor_critic
+            if isinstance(self.actor_critic, ActorCriticModel)
+            else cast(ActorCriticModel, self.actor_critic.module)
+        )
+        forward_kwargs_names = {"episode_starts"} & set(
+            inspect.signature(actor_critic.forward).parameters.keys()
+        )
+
+        with torch.no_grad():
+            # The whole rollout as a single minibatch (of views into the storage)
+            batch = next(
+                rollouts.recurrent_generator(
+                    torch.zeros_like(rollouts.value_preds[:-1]),
+                    num_mini_batch=1,
+                    zero_copy=True,
+                )
+            )
+            actor_critic_output, memory = self.actor_critic(
+                observations=batch["observations"],
+                memory=batch["memory"],
+                prev_actions=batch["prev_actions"],
+                masks=batch["masks"],
+                **{name: batch[name] for name in forward_kwargs_names},
+            )
+            action_log_probs = actor_critic_output.distributions.log_prob(
+                batch["actions"]
+            )
+
+            # The value after the last step, from the memory of the learner
+            next_output, _ = self.actor_critic(
+                observations=rollouts.pick_observation_step(-1),
+                memory=memory,
+                prev_actions=su.unflatten(
+                    self.actor_critic.action_space, rollouts.prev_actions[-1:]
+                ),
+                masks=rollouts.masks[-1:],
+            )
+            values = torch.cat([actor_critic_output.values, next_output.values], dim=0)
+
+        return rollouts.compute_vtrace_returns(
+            values=values,
+            action_log_probs=action_log_probs,
+            gamma=self.training_pipeline.gamma,
+            tau=self.training_pipeline.gae_lambda
+            if self.training_pipeline.use_gae
+            else 1.0,
+            rho_clip=self.training_pipeline.vtrace_rho_clip,
+            c_clip=self.training_pipeline.vtrace_c_clip,
+        )
+
+    def run_async_pipeline(self, rollouts: RolloutStorage):
+        """Trains with rollouts collected asynchronously (see
+        `AsyncRolloutCollector`) by a copy of the model, refreshed with the
+        learner weights every `MachineParams.async_weights_refresh_period`
+        updates.
+
+        The learner updates on every collected rollout once, with V-trace
+        returns correcting for the policy lag (the number of updates since the
+        weights of the acting model were published, logged as
+        `async/policy_lag`). Stragglers are not preempted in distributed
+        training.
+        """
+        self.initialize_rollouts(rollouts)
+        self.tracking_info.clear()
+
+        self.last_log = self.training_pipeline.total_steps
+        self.last_save = self.training_pipeline.total_steps
+
+        queue_size = self.machine_params.async_rollout_queue_size
+        refresh_period = self.machine_params.async_weights_refresh_period
+        storages = [rollouts]
+        for _ in range(queue_size + 1):
+            storage = self.make_rollout_storage()
+            storage.to(self.device)
+            storages.append(storage)
+
+        self.acting_actor_critic = copy.deepcopy(self.actor_critic)
+        # The collection thread tracks its info and timings separately from the
+        # learner, they are merged once the learner gets the rollout
+        self.collection_tracking_info = defaultdict(lambda: [])
+        self.collection_profiler = PhaseProfiler(
+            enabled=self.profiler.enabled,
+            synchronize=self.profiler.synchronize,
+            device=self.profiler.device,
+        )
+        self.collection_worker_timings_info = []
+        collector = AsyncRolloutCollector(
+            storages=storages,
+            acting_model=self.acting_actor_critic,
+            collect_rollout=self.collect_async_rollout,
+            queue_size=queue_size,
+            initial_version=self.training_pipeline.rollout_count,
+        )
+        self.former_steps = self.step_count
+        collector.start()
+
+        # Rollout storages are fully allocated after the first rollout
+        log_storage_nbytes = self.worker_id == 0
+
+        try:
+            while True:
+                self.training_pipeline.before_rollout()
+                if self.training_pipeline.current_stage is None:
+                    break
+                self.profiler.before_rollout(self.training_pipeline.rollout_count)
+
+                wait_start = time.time()
+                with self.profiler.span("async/wait_rollout"):
+                    rollouts, version, collection_info = collector.get()
+                tracking_info, timings, worker_timings_info = collection_info
+                for key, entries in tracking_info.items():
+                    self.tracking_info[key].extend(entries)
+                self.profiler.merge(timings)
+                self.worker_timings_info.extend(worker_timings_info)
+                self.tracking_info["async"].append(
+                    (
+                        "async",
+                        {
+                            "async/policy_lag": self.training_pipeline.rollout_count
+                            - version,
+                            "async/learner_wait_seconds": time.time() - wait_start,
+                        },
+                        1,
+                    )
+                )
+
+                self.former_steps = self.step_count
+                self.step_count += rollouts.num_steps * rollouts.masks.shape[1]
+                if self.is_distributed:
+                    self.sum_rollout_steps()
+
+                with self.profiler.span("compute_returns"):
+                    advantages = self.vtrace_advantages(rollouts)
+
+                with self.profiler.span("update"):
+                    self.update(rollouts=rollouts, advantages=advantages)
+                self.training_pipeline.rollout_count += 1
+
+                if log_storage_nbytes:
+                    self.log_storage_nbytes(rollouts)
+                    log_storage_nbytes = False
+
+                collector.release(rollouts)
+                if self.training_pipeline.rollout_count % refresh_period == 0:
+                    collector.publish_weights(
+                        self.actor_critic, self.training_pipeline.rollout_count
+                    )
+
+                if self.lr_scheduler is not None:
+                    self.lr_scheduler.step(epoch=self.training_pipeline.total_steps)
+
+                # Samplers are stepped by the collection thread, so they are not
+                # reseeded (asynchronous training is not deterministic anyway)
+                self.log_and_save(reseed_samplers=False)
+        finally:
+            collector.stop()
+            self.acting_actor_critic = None
+            self.collection_tracking_info = self.tracking_info
+            self.collection_profiler = self.profiler
+            self.collection_worker_timings_info = self.worker_timings_info
+
+    def make_rollout_storage(self) -> RolloutStorage:
+        return RolloutStorage(
+            num_steps=self.training_pipeline.num_steps,
+            num_samplers=self.num_samplers,
+            actor_critic=self.actor_critic
+            if isinstance(self.actor_critic, ActorCriticModel)
+            else cast(ActorCriticModel, self.actor_critic.module),
+            observation_dtypes=self.machine_params.rollout_observation_dtypes,
+            memory_dtypes=self.machine_params.rollout_memory_dtypes,
+            memory_chunk_length=self.training_pipeline.recurrent_chunk_length,
+        )
+
+    def log_storage_nbytes(self, rollouts: RolloutStorage):
+        nbytes_by_key = rollouts.nbytes_by_key()
+        get_logger().info(
+            "{} worker {} rollout storage uses {:.1f} MB:\n{}".format(
+                self.mode,
+                self.worker_id,
+                sum(nbytes_by_key.values()) / 2 ** 20,
+                "\n".join(
+                    "    {}: {:.1f} MB".format(key, nbytes / 2 ** 20)
+                    for key, nbytes in sorted(
+                        nbytes_by_key.items(), key=lambda x: -x[1]
+                    )
+                ),
+            )
+        )
+
     def train(
         self, checkpoint_file_name: Optional[str] = None, restart_pipeline: bool = False
     ):
@@ -1296,15 +2197,10 @@ class OnPolicyTrainer(OnPolicyRLEngine):
             if checkpoint_file_name is not None:
                 self.checkpoint_load(checkpoint_file_name, restart_pipeline)
 
-            self.run_pipeline(
-                RolloutStorage(
-                    num_steps=self.training_pipeline.num_steps,
-                    num_samplers=self.num_samplers,
-                    actor_critic=self.actor_critic
-                    if isinstance(self.actor_critic, ActorCriticModel)
-                    else cast(ActorCriticModel, self.actor_critic.module),
-                )
-            )
+            if self.async_rollouts:
+                self.run_async_pipeline(self.make_rollout_storage())
+            else:
+                self.run_pipeline(self.make_rollout_storage())
 
             training_completed_successfully = True
         except KeyboardInterrupt:
@@ -1329,6 +2225,7 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                 )
             else:
                 self.results_queue.put(("train_stopped", 1 + self.worker_id))
+            self.profiler.close()
             self.close()
 
 
@@ -1385,11 +2282,21 @@ class OnPolicyInference(OnPolicyRLEngine):
             num_steps=rollout_steps,
             num_samplers=self.num_samplers,
             actor_critic=cast(ActorCriticModel, self.actor_critic),
+            observation_dtypes=self.machine_params.rollout_observation_dtypes,
+            memory_dtypes=self.machine_params.rollout_memory_dtypes,
         )
 
         if visualizer is not None:
             assert visualizer.empty()
 
+        # The visualizer expects the storage to only hold running samplers
+        self.paused_sampler_compaction_threshold = (
+            self.machine_params.paused_sampler_compaction_threshold
+            if visualizer is None
+            else None
+        )
+        self.active_samplers = None
+
         num_paused = self.initialize_rollouts(rollouts, visualizer=visualizer)
         num_tasks = sum(
             self.vector_tasks.command(
@@ -1470,6 +2377,9 @@ class OnPolicyInference(OnPolicyRLEngine):
             )
         )
 
+        self.paused_sampler_compaction_threshold = None
+        self.active_samplers = None
+
         self.vector_tasks.resume_all()
         self.vector_tasks.set_seeds(self.worker_seeds(self.num_samplers, self.seed))
         self.vector_tasks.reset_all()
@@ -0,0 +1,235 @@
+"""Gradient compression for the bucketed gradient all-reduce of distributed
+training (see `BucketedGradientReducer`).
+
+A `GradientCompressor` replaces the all-reduce of a flat gradient bucket by
+collectives on a compressed representation of it, trading (some) accuracy
+of the summed gradients for less data sent by every worker. Compressors
+only use `all_reduce` and `all_gather` on float and int tensors so they work
+with the gloo backend.
+"""
+
+import abc
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.distributed as dist  # type: ignore
+
+
+class GradientCompressor(abc.ABC):
+    """Abstract class for a gradient compression scheme.
+
+    Compressors may keep state across updates (e.g. error feedback), indexed
+    by the `key` of the bucket they are given.
+    """
+
+    @abc.abstractmethod
+    def all_reduce(
+        self, key: int, buffer: torch.Tensor, shapes: Sequence[torch.Size], group: Any
+    ) -> int:
+        """Replaces (in place) the flat gradient bucket `buffer` by (an
+        approximation of) its sum over the workers of `group`.
+
+        # Parameters
+
+        key : Index of the bucket (the same for every update).
+        buffer : The flat bucket, the concatenation of the (flattened)
+            gradients of its parameters.
+        shapes : The shapes of the gradients in `buffer`.
+        group : The process group.
+
+        # Returns
+
+        The number of bytes this worker sent to the collectives.
+        """
+        raise NotImplementedError()
+
+
+class CastCompressor(GradientCompressor):
+    """Casts gradients to a lower precision floating point type (e.g.
+    `torch.float16` or `torch.bfloat16`) for the all-reduce. Gradients are
+    divided by the number of workers before casting (and multiplied back
+    afterwards) so that their sum does not overflow.
+
+    Note that reducing `torch.bfloat16` tensors requires a PyTorch version
+    whose gloo backend supports them.
+
+    # Attributes
+
+    dtype : The dtype of the reduced gradients.
+    """
+
+    def __init__(self, dtype: torch.dtype = torch.float16):
+        self.dtype = dtype
+
+    def all_reduce(
+        self, key: int, buffer: torch.Tensor, shapes: Sequence[torch.Size], group: Any
+    ) -> int:
+        world_size = dist.get_world_size(group)
+        compressed = buffer.div(world_size).to(self.dtype)
+        dist.all_reduce(compressed, group=group)
+        buffer.copy_(compressed).mul_(world_size)
+        return compressed.numel() * compressed.element_size()
+
+
+def _orthogonalize(matrix: torch.Tensor, eps: float = 1e-8):
+    """Orthonormalizes the columns of `matrix` in place (Gram-Schmidt)."""
+    for i in range(matrix.shape[1]):
+        col = matrix[:, i : i + 1]
+        col.div_(col.norm() + eps)
+        if i + 1 < matrix.shape[1]:
+            rest = matrix[:, i + 1 :]
+            rest.sub_(col * (col.t() @ rest))
+
+
+class PowerSGDCompressor(GradientCompressor):
+    """Low-rank (PowerSGD, https://arxiv.org/abs/1905.13727) compression
+    with error feedback.
+
+    The gradient of each parameter with at least two dimensions is viewed as
+    an `n x m` matrix `M` and approximated by `P Q^T` with `P = M Q` (`n x
+    rank`, all-reduced and orthogonalized) and `Q = M^T P` (`m x rank`,
+    all-reduced), where `Q` is warm-started from the previous update. Only `P`
+    and `Q` are sent. Gradients of other parameters (e.g. biases), and of
+    matrices too small for compression to pay off, are all-reduced
+    uncompressed. The error of every worker's own approximation of its
+    gradients (`P P^T M`, with its `M` rather than the all-reduced one) is added
+    to its gradients of the next update.
+
+    # Attributes
+
+    rank : The rank of the approximation.
+    min_compression_rate : Matrices are only compressed if this reduces the
+        number of values sent by at least this factor.
+    """
+
+    def __init__(self, rank: int = 2, min_compression_rate: float = 2.0, seed: int = 0):
+        self.rank = rank
+        self.min_compression_rate = min_compression_rate
+        # Initial `Q`s are drawn in the same order on every worker
+        self._generator = torch.Generator()
+        self._generator.manual_seed(seed)
+        self._errors: Dict[int, torch.Tensor] = {}
+        self._qs: Dict[Tuple[int, int], torch.Tensor] = {}
+
+    def _is_compressed(self, shape: torch.Size) -> bool:
+        if len(shape) < 2:
+            return False
+        n, m = shape[0], int(np.prod(shape[1:]))
+        rank = min(self.rank, n, m)
+        return n * m >= self.min_compression_rate * (n + m) * rank
+
+    def _q(self, key: Tuple[int, int], matrix: torch.Tensor) -> torch.Tensor:
+        if key not in self._qs:
+            rank = min(self.rank, *matrix.shape)
+            self._qs[key] = torch.randn(
+                matrix.shape[1], rank, generator=self._generator
+            ).to(device=matrix.device, dtype=matrix.dtype)
+        return self._qs[key]
+
+    def all_reduce(
+        self, key: int, buffer: torch.Tensor, shapes: Sequence[torch.Size], group: Any
+    ) -> int:
+        if key not in self._errors:
+            self._errors[key] = torch.zeros_like(buffer)
+        error = self._errors[key]
+        buffer.add_(error)
+
+        matrices: List[Tuple[int, torch.Tensor, torch.Tensor]] = []
+        uncompressed: List[torch.Tensor] = []
+        start = 0
+        for ind, shape in enumerate(shapes):
+            end = start + int(np.prod(shape))
+            if self._is_compressed(shape):
+                matrices.append(
+                    (
+                        ind,
+                        buffer[start:end].view(shape[0], -1),
+                        error[start:end].view(shape[0], -1),
+                    )
+                )
+            else:
+                uncompressed.append(buffer[start:end])
+            start = end
+
+        num_sent = 0
+        if len(uncompressed) > 0:
+            num_sent += self._all_reduce_concatenated(uncompressed, group)
+
+        if len(matrices) > 0:
+            ps = [matrix @ self._q((key, ind), matrix) for ind, matrix, _ in matrices]
+            num_sent += self._all_reduce_concatenated(ps, group)
+            for p in ps:
+                _orthogonalize(p)
+
+            q_locals = [matrix.t() @ p for (_, matrix, _), p in zip(matrices, ps)]
+            qs = [q_local.clone() for q_local in q_locals]
+            num_sent += self._all_reduce_concatenated(qs, group)
+
+            for (ind, matrix, matrix_error), p, q_local, q in zip(
+                matrices, ps, q_locals, qs
+            ):
+                # What this worker's own approximation of its (compensated)
+                # gradient lacks
+                matrix_error.copy_(matrix - p @ q_local.t())
+                matrix.copy_(p @ q.t())
+                self._qs[(key, ind)] = q
+
+        return num_sent * buffer.element_size()
+
+    @staticmethod
+    def _all_reduce_concatenated(tensors: List[torch.Tensor], group: Any) -> int:
+        """All-reduces `tensors` (in place) with a single collective."""
+        flat = torch.cat([t.view(-1) for t in tensors])
+        dist.all_reduce(flat, group=group)
+        offset = 0
+        for t in tensors:
+            t.view(-1).copy_(flat[offset : offset + t.numel()])
+            offset += t.numel()
+        return flat.numel()
+
+
+class TopKCompressor(GradientCompressor):
+    """Sparsification keeping the largest (in absolute value) `ratio` of the
+    entries of every bucket, with error feedback.
+
+    Every worker sends the values and (int32) indices of its largest entries
+    (with `all_gather`, since workers select different entries) and the
+    entries it did not send are added to its gradients of the next update.
+
+    # Attributes
+
+    ratio : Fraction of the entries of a bucket sent by every worker.
+    """
+
+    def __init__(self, ratio: float = 0.01):
+        assert 0 < ratio <= 1, "`ratio` must be in (0, 1]."
+        self.ratio = ratio
+        self._errors: Dict[int, torch.Tensor] = {}
+
+    def all_reduce(
+        self, key: int, buffer: torch.Tensor, shapes: Sequence[torch.Size], group: Any
+    ) -> int:
+        world_size = dist.get_world_size(group)
+        if key not in self._errors:
+            self._errors[key] = torch.zeros_like(buffer)
+        error = self._errors[key]
+        buffer.add_(error)
+
+        k = max(1, int(self.ratio * buffer.numel()))
+        indices = buffer.abs().topk(k, sorted=False)[1]
+        values = buffer[indices]
+        error.copy_(buffer)
+        error[indices] = 0
+
+        indices = indices.int()
+        all_values = [torch.empty_like(values) for _ in range(world_size)]
+        all_indices = [torch.empty_like(indices) for _ in range(world_size)]
+        dist.all_gather(all_values, values, group=group)
+        dist.all_gather(all_indices, indices, group=group)
+
+        buffer.zero_()
+        for worker_values, worker_indices in zip(all_values, all_indices):
+            buffer.index_add_(0, worker_indices.long(), worker_values)
+
+        return k * (values.element_size() + indices.element_size())
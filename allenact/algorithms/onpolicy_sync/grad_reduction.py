@@ -0,0 +1,263 @@
+"""Bucketed all-reduce of model gradients across distributed workers.
+
+Rather than launching one collective per parameter, gradients are copied
+into a few flat buffers (buckets) of at most a given size, every bucket is
+all-reduced with a single collective and the reduced values are copied back
+into the `.grad` of the parameters. The `.grad` tensors remain independent
+tensors (rather than views into the buckets), so in-place modifications of
+the gradients after the reduction (`clip_grad_norm_`, `KFACOptimizer`, etc.)
+behave exactly as without bucketing.
+
+Buckets can optionally be compressed before being reduced, see
+`allenact.algorithms.onpolicy_sync.grad_compression`.
+"""
+
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import torch
+import torch.distributed as dist  # type: ignore
+from torch import nn
+
+from allenact.algorithms.onpolicy_sync.grad_compression import GradientCompressor
+
+
+class _GradientBucket(object):
+    """The flat buffer (and bookkeeping) of a group of parameters sharing
+    their device and dtype."""
+
+    def __init__(self, params: List[nn.Parameter]):
+        self.params = params
+        self.ranges: List[Tuple[int, int]] = []
+        start = 0
+        for param in params:
+            self.ranges.append((start, start + param.numel()))
+            start += param.numel()
+        self.buffer = torch.zeros(start, dtype=params[0].dtype, device=params[0].device)
+        self.shapes = [param.shape for param in params]
+        # Indices (in `params`) of the parameters whose gradients are ready
+        self.ready: Set[int] = set()
+        self.work: Optional[Any] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return len(self.ready) == len(self.params)
+
+    def pack(self):
+        """Copies the gradients into the flat buffer (zeros for parameters
+        without gradient)."""
+        for param, (start, end) in zip(self.params, self.ranges):
+            view = self.buffer[start:end].view(param.shape)
+            if param.grad is None:
+                view.zero_()
+            else:
+                view.copy_(param.grad)
+
+    def unpack(self):
+        """Copies the (reduced) flat buffer back into the gradients."""
+        for param, (start, end) in zip(self.params, self.ranges):
+            reduced = self.buffer[start:end].view(param.shape)
+            if param.grad is None:
+                param.grad = reduced.clone()
+            else:
+                param.grad.copy_(reduced)
+
+
+def _same_device_and_dtype(a: torch.Tensor, b: torch.Tensor) -> bool:
+    return a.device == b.device and a.dtype == b.dtype
+
+
+class BucketedGradientReducer(object):
+    """Sums the gradients of a set of parameters over all workers of a
+    process group with a few collectives on flat buffers.
+
+    Parameters are assigned to buckets in reverse order (the order in which
+    their gradients are roughly computed during the backward pass), starting
+    a new bucket whenever the current one would exceed `bucket_size_mb` or
+    the device/dtype changes. Buckets are always all-reduced in the same
+    order so that all workers issue matching collectives.
+
+    Use as
+    ```python
+    reducer.prepare()
+    loss.backward()
+    reducer.reduce()
+    ```
+    Parameters without gradient after the backward pass get (reduced) zero
+    gradients, as every worker must take part in every collective.
+
+    # Attributes
+
+    params : The parameters (requiring gradients) whose gradients are reduced.
+    overlap : Whether buckets are all-reduced during the backward pass.
+    process_group : The process group.
+    compressor : Optional compression applied to every bucket, can be changed
+        between updates (e.g. with the pipeline stage). Compressed buckets are
+        reduced synchronously (when launched).
+    """
+
+    def __init__(
+        self,
+        params: Iterable[nn.Parameter],
+        bucket_size_mb: float = 25.0,
+        overlap: bool = False,
+        process_group: Optional[Any] = None,
+        compressor: Optional[GradientCompressor] = None,
+    ):
+        """Initializer.
+
+        # Parameters
+
+        params : The parameters whose gradients to reduce (parameters not
+            requiring gradients are ignored).
+        bucket_size_mb : Maximum size (in MiB) of a bucket, larger parameters
+            get a bucket of their own.
+        overlap : If `True`, hooks launch the all-reduce of a bucket during the
+            backward pass as soon as all of its gradients (and those of the
+            buckets before it) are computed, overlapping communication with the
+            rest of the backward pass. Requires calling `prepare` before each
+            (single) backward pass.
+        process_group : The process group to reduce over (`None` for the
+            default group).
+        compressor : Optional compression of the buckets.
+        """
+        self.params = [p for p in params if p.requires_grad]
+        self.overlap = overlap
+        self.process_group = (
+            process_group if process_group is not None else dist.group.WORLD
+        )
+        self.compressor = compressor
+
+        bucket_size = int(bucket_size_mb * 2 ** 20)
+        self.buckets: List[_GradientBucket] = []
+        self._param_location: List[Tuple[int, int]] = [(-1, -1)] * len(self.params)
+        bucket_params: List[int] = []
+        bucket_bytes = 0
+        for param_ind in reversed(range(len(self.params))):
+            param = self.params[param_ind]
+            param_bytes = param.numel() * param.element_size()
+            if len(bucket_params) > 0 and (
+                bucket_bytes + param_bytes > bucket_size
+                or not _same_device_and_dtype(param, self.params[bucket_params[0]])
+            ):
+                self._add_bucket(bucket_params)
+                bucket_params, bucket_bytes = [], 0
+            bucket_params.append(param_ind)
+            bucket_bytes += param_bytes
+        if len(bucket_params) > 0:
+            self._add_bucket(bucket_params)
+
+        self._armed = False
+        self._next_bucket = 0
+
+        # Sizes (uncompressed and sent) and duration of the reductions since the
+        # last `pop_stats`, and start time of the current reduction
+        self._reduced_bytes = 0
+        self._sent_bytes = 0
+        self._reduction_seconds = 0.0
+        self._reduction_start: Optional[float] = None
+
+        # References to the gradient accumulators keep the hooks alive
+        self._grad_accumulators: List[Any] = []
+        if self.overlap:
+            for param_ind, param in enumerate(self.params):
+                grad_accumulator = param.expand_as(param).grad_fn.next_functions[0][0]
+                grad_accumulator.register_hook(self._make_hook(param_ind))
+                self._grad_accumulators.append(grad_accumulator)
+
+    def _add_bucket(self, param_inds: List[int]):
+        for index_in_bucket, param_ind in enumerate(param_inds):
+            self._param_location[param_ind] = (len(self.buckets), index_in_bucket)
+        self.buckets.append(_GradientBucket([self.params[i] for i in param_inds]))
+
+    @property
+    def num_buckets(self) -> int:
+        return len(self.buckets)
+
+    def _make_hook(self, param_ind: int):
+        def hook(*_):
+            if self._armed:
+                bucket_ind, index_in_bucket = self._param_location[param_ind]
+                self.buckets[bucket_ind].ready.add(index_in_bucket)
+                self._launch_ready_buckets()
+
+        return hook
+
+    def _launch_next_bucket(self):
+        if self._reduction_start is None:
+            self._reduction_start = time.perf_counter()
+
+        bucket = self.buckets[self._next_bucket]
+        bucket.pack()
+        bucket_bytes = bucket.buffer.numel() * bucket.buffer.element_size()
+        self._reduced_bytes += bucket_bytes
+        if self.compressor is None:
+            bucket.work = dist.all_reduce(
+                bucket.buffer, group=self.process_group, async_op=True
+            )
+            self._sent_bytes += bucket_bytes
+        else:
+            self._sent_bytes += self.compressor.all_reduce(
+                self._next_bucket, bucket.buffer, bucket.shapes, self.process_group
+            )
+        self._next_bucket += 1
+
+    def _launch_ready_buckets(self):
+        while (
+            self._next_bucket < len(self.buckets)
+            and self.buckets[self._next_bucket].is_ready
+        ):
+            self._launch_next_bucket()
+
+    def prepare(self):
+        """Resets the buckets (and arms the hooks if `overlap`) before a
+        backward pass."""
+        for bucket in self.buckets:
+            bucket.ready.clear()
+            bucket.work = None
+        self._next_bucket = 0
+        self._reduction_start = None
+        self._armed = self.overlap
+
+    def reduce(self):
+        """Waits until the gradients of all parameters are replaced by their
+        sums over the workers, launching the all-reduce of the buckets not
+        launched during the backward pass."""
+        self._armed = False
+        while self._next_bucket < len(self.buckets):
+            self._launch_next_bucket()
+
+        for bucket in self.buckets:
+            if bucket.work is not None:
+                bucket.work.wait()
+                bucket.work = None
+            bucket.unpack()
+        self._next_bucket = 0
+
+        if self._reduction_start is not None:
+            self._reduction_seconds += time.perf_counter() - self._reduction_start
+            self._reduction_start = None
+
+    def pop_stats(self) -> Dict[str, float]:
+        """Statistics of the reductions since the last call.
+
+        # Returns
+
+        Dictionary with the `compression_ratio` (size of the gradients over
+        the size of the data sent) and the achieved `bandwidth_MBps`
+        (megabytes sent per second spent reducing, from the launch of the
+        first bucket to the end of `reduce`). Empty if nothing was reduced.
+        """
+        stats: Dict[str, float] = {}
+        if self._sent_bytes > 0:
+            stats["compression_ratio"] = self._reduced_bytes / self._sent_bytes
+            stats["bandwidth_MBps"] = (
+                self._sent_bytes / max(self._reduction_seconds, 1e-9) / 1e6
+            )
+        self._reduced_bytes = self._sent_bytes = 0
+        self._reduction_seconds = 0.0
+        return stats
+
+    def bucket_sizes(self) -> List[int]:
+        """The number of elements of every bucket."""
+        return [bucket.buffer.numel() for bucket in self.buckets]
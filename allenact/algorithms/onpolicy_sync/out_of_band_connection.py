@@ -0,0 +1,140 @@
+"""Connection wrapper used by `VectorSampledTasks` (with the ``'pickle5'``
+transport) to send large buffers (e.g. numpy observation arrays) through a
+pipe out-of-band, i.e. without copying them into an intermediate pickle byte
+string."""
+
+import copyreg
+import io
+import struct
+import sys
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import ForkingPickler
+from typing import Any, List, Optional
+
+if sys.version_info >= (3, 8):
+    import pickle
+else:
+    try:
+        # Backport of pickle protocol 5 (as used by numpy for python < 3.8)
+        import pickle5 as pickle  # type:ignore
+    except ImportError:
+        import pickle
+
+# Whether out-of-band pickling (protocol 5) is available, it requires
+# python>=3.8 or the `pickle5` backport
+OUT_OF_BAND_PICKLING_AVAILABLE = pickle.HIGHEST_PROTOCOL >= 5
+
+_HEADER_COUNT_FORMAT = "!I"
+_HEADER_LENGTH_FORMAT = "!{}Q"
+
+
+class _OutOfBandPickler(pickle.Pickler):
+    """Protocol 5 pickler using the reducers registered with
+    `ForkingPickler` (e.g. those of `torch.multiprocessing` for shared
+    tensors), as `multiprocessing` connections do."""
+
+    def __init__(self, file, buffer_callback):
+        super().__init__(file, protocol=5, buffer_callback=buffer_callback)
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table.update(ForkingPickler._extra_reducers)
+
+
+class OutOfBandConnection(object):
+    """Wraps a `multiprocessing.connection.Connection` so that messages are
+    pickled with protocol 5 and their out-of-band buffers (e.g. the data of
+    contiguous numpy arrays, at any depth of the message) are sent as separate
+    messages with `send_bytes` and received with `recv_bytes_into`.
+
+    Each message is sent as a header (number and lengths of the out-of-band
+    buffers followed by the in-band pickle data, which only holds the
+    structure of the message and small objects) and then one message per
+    buffer. Both ends of a pipe must hence be wrapped.
+
+    # Attributes
+
+    connection : The wrapped connection.
+    reuse_buffers : Default of the `reuse_buffers` argument of `recv`.
+    """
+
+    def __init__(self, connection: Connection, reuse_buffers: bool = False):
+        assert OUT_OF_BAND_PICKLING_AVAILABLE, (
+            "Out-of-band pickling requires python>=3.8 or the `pickle5` package"
+            " (`pip install pickle5`)."
+        )
+        self.connection = connection
+        self.reuse_buffers = reuse_buffers
+        self._receive_buffers: List[bytearray] = []
+
+    def __getstate__(self):
+        # Receive buffers are specific to the current process
+        return {"connection": self.connection, "reuse_buffers": self.reuse_buffers}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def send(self, obj: Any) -> None:
+        buffers: List[pickle.PickleBuffer] = []
+        in_band = io.BytesIO()
+        _OutOfBandPickler(in_band, buffer_callback=buffers.append).dump(obj)
+
+        raw_buffers = [buffer.raw() for buffer in buffers]
+        header = struct.pack(_HEADER_COUNT_FORMAT, len(raw_buffers)) + struct.pack(
+            _HEADER_LENGTH_FORMAT.format(len(raw_buffers)),
+            *(raw.nbytes for raw in raw_buffers)
+        )
+        self.connection.send_bytes(b"".join([header, in_band.getbuffer()]))
+        for raw in raw_buffers:
+            self.connection.send_bytes(raw)
+
+    def _receive_buffer(
+        self, buffer_ind: int, nbytes: int, reuse_buffers: bool
+    ) -> bytearray:
+        if not reuse_buffers:
+            return bytearray(nbytes)
+
+        if buffer_ind == len(self._receive_buffers):
+            self._receive_buffers.append(bytearray(nbytes))
+        elif len(self._receive_buffers[buffer_ind]) < nbytes:
+            self._receive_buffers[buffer_ind] = bytearray(nbytes)
+        return self._receive_buffers[buffer_ind]
+
+    def recv(self, reuse_buffers: Optional[bool] = None) -> Any:
+        """Receives a message.
+
+        # Parameters
+
+        reuse_buffers : If `True`, buffers are received into bytearrays which
+            are reused by later calls to `recv` (with `reuse_buffers`), arrays
+            in the received message are then views into these bytearrays and
+            are only valid until the next such call. If `False`, a new
+            bytearray is allocated for each buffer. Defaults to the
+            `reuse_buffers` attribute if `None`.
+        """
+        if reuse_buffers is None:
+            reuse_buffers = self.reuse_buffers
+        message = memoryview(self.connection.recv_bytes())
+
+        count_size = struct.calcsize(_HEADER_COUNT_FORMAT)
+        (num_buffers,) = struct.unpack(_HEADER_COUNT_FORMAT, message[:count_size])
+        lengths_format = _HEADER_LENGTH_FORMAT.format(num_buffers)
+        lengths_size = struct.calcsize(lengths_format)
+        lengths = struct.unpack(
+            lengths_format, message[count_size : count_size + lengths_size]
+        )
+
+        buffers = []
+        for buffer_ind, nbytes in enumerate(lengths):
+            buffer = self._receive_buffer(buffer_ind, nbytes, reuse_buffers)
+            self.connection.recv_bytes_into(buffer)
+            buffers.append(memoryview(buffer)[:nbytes])
+
+        return pickle.loads(message[count_size + lengths_size :], buffers=buffers)
+
+    def poll(self, timeout: Optional[float] = 0.0) -> bool:
+        return self.connection.poll(timeout)
+
+    def fileno(self) -> int:
+        return self.connection.fileno()
+
+    def close(self) -> None:
+        self.connection.close()
@@ -125,6 +125,10 @@ class ActorCriticModel(Generic[DistributionType], nn.Module):
         masks : tensor of shape [steps, samplers, agents, 1] with zeros indicating steps where a new episode/task
                 starts.
 
+        Models may additionally accept an `episode_starts` keyword argument, in which case, during updates,
+        they are given a boolean CPU tensor of shape [steps, samplers] equal to `masks == 0` (precomputed
+        by `RolloutStorage`, so that no device-to-host copy of `masks` is required to find episode boundaries).
+
         # Returns
 
         A tuple whose first element is an object of class ActorCriticOutput which stores
@@ -0,0 +1,133 @@
+"""Notification of the distributed workers that enough of them finished
+collecting their rollout (so that stragglers can be preempted).
+
+Rather than querying the distributed store for the number of finished
+workers at every rollout step, every worker adds itself to a counter (a
+single store call) when it is done collecting, and the worker reaching the
+preemption count sets a notification key. A background thread of every
+worker blocks on this key (with a store client of its own) and sets a local
+flag, so that checking for preemption during the rollout is free.
+"""
+
+import datetime
+import math
+import threading
+from typing import Any, Optional
+
+import torch
+import torch.distributed  # type: ignore
+
+
+class RolloutDoneNotifier(object):
+    """Notifies a worker once more than a fraction of all workers finished
+    collecting the current rollout.
+
+    Use as
+    ```python
+    notifier.start()  # at the start of every rollout
+    for step in range(num_steps):
+        if notifier.notified:
+            break  # preempted
+        ...
+    notifier.finish()  # once done collecting
+    ```
+    All workers must call `start` and `finish` once for every rollout.
+
+    # Attributes
+
+    num_done_to_notify : Number of finished workers triggering the
+        notification (never notifies if larger than the number of workers).
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        address: str,
+        port: int,
+        world_size: int,
+        threshold: float,
+        prefix: str = "rollout_done",
+        poll_timeout: datetime.timedelta = datetime.timedelta(seconds=30),
+    ):
+        """Initializer.
+
+        # Parameters
+
+        store : The distributed store (a client of the `TCPStore` at `address`
+            and `port`), only used from the calling thread.
+        address : The address of the `TCPStore` host.
+        port : The port of the `TCPStore`.
+        world_size : The number of workers.
+        threshold : Workers are notified once more than `threshold * world_size`
+            workers finished their rollout.
+        prefix : Prefix of the store keys.
+        poll_timeout : Timeout of every wait of the background thread (after
+            which it checks whether it should stop waiting).
+        """
+        self.store = store
+        self.prefix = prefix
+        self.poll_timeout = poll_timeout
+        self.num_done_to_notify = int(math.floor(threshold * world_size)) + 1
+
+        # Store clients must not be shared between threads
+        self._wait_store: Optional[torch.distributed.TCPStore] = None  # type:ignore
+        if self.num_done_to_notify <= world_size:
+            self._wait_store = torch.distributed.TCPStore(  # type:ignore
+                address, port, world_size, False
+            )
+
+        self._rollout = -1
+        self._notified = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _key(self, rollout: int, name: str) -> str:
+        return "{}/{}/{}".format(self.prefix, rollout, name)
+
+    def _wait(self, rollout: int):
+        key = self._key(rollout, "notify")
+        while not self._stopped.is_set():
+            try:
+                self._wait_store.wait([key], self.poll_timeout)
+            except RuntimeError:  # timeout
+                continue
+            self._notified.set()
+            return
+
+    def start(self):
+        """Starts waiting for the notification of a new rollout."""
+        self.stop()
+        self._stopped.clear()
+        self._notified.clear()
+        self._rollout += 1
+        if self._wait_store is not None:
+            self._thread = threading.Thread(
+                target=self._wait, args=(self._rollout,), daemon=True
+            )
+            self._thread.start()
+
+    @property
+    def notified(self) -> bool:
+        """Whether enough workers finished the current rollout."""
+        return self._notified.is_set()
+
+    def finish(self) -> int:
+        """Marks this worker as done collecting the current rollout.
+
+        # Returns
+
+        The number of workers done (including this one) when this worker
+        finished.
+        """
+        num_done = self.store.add(self._key(self._rollout, "done"), 1)
+        if num_done == self.num_done_to_notify:
+            self.store.set(self._key(self._rollout, "notify"), "1")
+        return num_done
+
+    def stop(self):
+        """Stops waiting for the notification of the current rollout (which
+        returns at once if all workers called `finish`)."""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
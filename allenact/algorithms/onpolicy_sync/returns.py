@@ -0,0 +1,193 @@
+"""Discounted returns and advantage estimators for rollouts.
+
+All functions follow the conventions of `RolloutStorage`: `rewards` (and
+importance weights) have shape `[steps, ...]` while `values` and `masks`
+have shape `[steps + 1, ...]`, with `masks[t] == 0` if a new episode starts
+at step `t` (so that `masks[t + 1] == 0` if the episode ended at step `t`).
+Trailing dimensions are broadcast after appending singleton dimensions, so
+that e.g. `[steps, samplers, 1]` rewards can be used with
+`[steps + 1, samplers, agents, 1]` values. Outputs have the (broadcast) shape
+of the values.
+
+The terms not depending on the recursion are computed for all steps at once
+and only the (reverse) scans over the step dimension are TorchScript loops.
+The order of floating point operations is that of the per-step loops
+previously used by `RolloutStorage.compute_returns`, so the results are
+identical to those.
+"""
+
+from typing import List, Tuple
+
+import torch
+
+
+@torch.jit.script
+def _extend(tensor: torch.Tensor, ndim: int) -> torch.Tensor:
+    """Appends singleton dimensions to `tensor` up to `ndim` dimensions."""
+    shape: List[int] = list(tensor.shape)
+    for _ in range(ndim - tensor.dim()):
+        shape.append(1)
+    return tensor.view(shape)
+
+
+@torch.jit.script
+def _reverse_scan(
+    deltas: torch.Tensor, discounts: torch.Tensor, initial: torch.Tensor
+) -> torch.Tensor:
+    """Returns `out` with `out[t] = deltas[t] + discounts[t] * out[t + 1]`
+    for every step `t`, where `out[steps] = initial`."""
+    out = torch.empty_like(deltas)
+    acc = initial
+    for step in range(deltas.shape[0] - 1, -1, -1):
+        acc = deltas[step] + discounts[step] * acc
+        out[step] = acc
+    return out
+
+
+@torch.jit.script
+def compute_gae(
+    rewards: torch.Tensor,
+    values: torch.Tensor,
+    masks: torch.Tensor,
+    gamma: float,
+    tau: float,
+) -> torch.Tensor:
+    """Generalized advantage estimates (https://arxiv.org/abs/1506.02438).
+
+    # Parameters
+
+    rewards : `[steps, ...]` rewards.
+    values : `[steps + 1, ...]` value predictions (the last one bootstraps
+        the returns after the last step).
+    masks : `[steps + 1, ...]` episode masks.
+    gamma : Discount factor.
+    tau : GAE lambda parameter.
+
+    # Returns
+
+    The `[steps, ...]` advantages (add `values[:-1]` to get the returns).
+    """
+    ndim = values.dim()
+    rewards = _extend(rewards, ndim)
+    masks = _extend(masks, ndim)
+
+    deltas = rewards + gamma * values[1:] * masks[1:] - values[:-1]
+    return _reverse_scan(deltas, gamma * tau * masks[1:], torch.zeros_like(deltas[0]))
+
+
+@torch.jit.script
+def compute_discounted_returns(
+    rewards: torch.Tensor, masks: torch.Tensor, next_return: torch.Tensor, gamma: float
+) -> torch.Tensor:
+    """Discounted (Monte Carlo) returns, bootstrapped after the last step.
+
+    # Parameters
+
+    rewards : `[steps, ...]` rewards.
+    masks : `[steps + 1, ...]` episode masks.
+    next_return : The return after the last step, with the shape of the
+        returns for a single step.
+    gamma : Discount factor.
+
+    # Returns
+
+    The `[steps, ...]` returns.
+    """
+    ndim = next_return.dim() + 1
+    rewards = _extend(rewards, ndim)
+    masks = _extend(masks, ndim)
+
+    shape: List[int] = [rewards.shape[0]] + list(next_return.shape)
+    out = torch.empty(shape, dtype=next_return.dtype, device=next_return.device)
+    acc = next_return
+    for step in range(rewards.shape[0] - 1, -1, -1):
+        acc = acc * gamma * masks[step + 1] + rewards[step]
+        out[step] = acc
+    return out
+
+
+@torch.jit.script
+def compute_n_step_returns(
+    rewards: torch.Tensor,
+    values: torch.Tensor,
+    masks: torch.Tensor,
+    gamma: float,
+    n: int,
+) -> torch.Tensor:
+    """Returns bootstrapped from the value `n` steps ahead (or from the last
+    value for steps closer than `n` steps to the end of the rollout).
+
+    # Parameters
+
+    rewards : `[steps, ...]` rewards.
+    values : `[steps + 1, ...]` value predictions.
+    masks : `[steps + 1, ...]` episode masks.
+    gamma : Discount factor.
+    n : Number of steps. `n = 1` gives one-step TD targets, while
+        `n >= steps` gives the returns of `compute_discounted_returns`.
+
+    # Returns
+
+    The `[steps, ...]` returns.
+    """
+    assert n > 0, "`n` must be positive"
+    ndim = values.dim()
+    rewards = _extend(rewards, ndim)
+    discounts = gamma * _extend(masks, ndim)[1:]
+
+    # After `h` iterations, `returns[t]` is the `h`-step return of step `t`
+    returns = values
+    for _ in range(min(n, rewards.shape[0])):
+        returns = torch.cat([rewards + discounts * returns[1:], values[-1:]], dim=0)
+    return returns[:-1]
+
+
+@torch.jit.script
+def compute_vtrace(
+    rewards: torch.Tensor,
+    values: torch.Tensor,
+    masks: torch.Tensor,
+    log_rhos: torch.Tensor,
+    gamma: float,
+    tau: float = 1.0,
+    rho_clip: float = 1.0,
+    c_clip: float = 1.0,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """V-trace targets and policy gradient advantages with truncated
+    importance weights (https://arxiv.org/abs/1802.01561), for learning from
+    rollouts collected with a (slightly) stale policy.
+
+    # Parameters
+
+    rewards : `[steps, ...]` rewards.
+    values : `[steps + 1, ...]` value predictions of the learner.
+    masks : `[steps + 1, ...]` episode masks.
+    log_rhos : `[steps, ...]` log importance weights, i.e. the log
+        probabilities of the taken actions under the learner policy minus
+        those under the behaviour policy.
+    gamma : Discount factor.
+    tau : Lambda parameter (multiplying the trace coefficients).
+    rho_clip : Truncation of the importance weights of the TD errors.
+    c_clip : Truncation of the importance weights of the traces.
+
+    # Returns
+
+    The `[steps, ...]` value targets and the `[steps, ...]` advantages.
+    """
+    ndim = values.dim()
+    rewards = _extend(rewards, ndim)
+    log_rhos = _extend(log_rhos, ndim)
+    discounts = gamma * _extend(masks, ndim)[1:]
+
+    rhos = torch.exp(log_rhos)
+    clipped_rhos = torch.clamp(rhos, max=rho_clip)
+    cs = tau * torch.clamp(rhos, max=c_clip)
+
+    deltas = clipped_rhos * (rewards + discounts * values[1:] - values[:-1])
+    vs = values[:-1] + _reverse_scan(
+        deltas, discounts * cs, torch.zeros_like(deltas[0])
+    )
+
+    next_vs = torch.cat([vs[1:], values[-1:]], dim=0)
+    advantages = clipped_rhos * (rewards + discounts * next_vs - values[:-1])
+    return vs, advantages
@@ -15,6 +15,7 @@ from multiprocessing.context import BaseContext
 from multiprocessing.process import BaseProcess
 from typing import Optional, Dict, Union, Tuple, Sequence, List, Any
 
+import numpy as np
 import torch
 import torch.multiprocessing as mp
 from setproctitle import setproctitle as ptitle
@@ -30,6 +31,7 @@ from allenact.utils.experiment_utils import (
     set_deterministic_cudnn,
     set_seed,
     LoggingPackage,
+    evenly_distribute_count_into_bins,
 )
 
 from allenact.utils.misc_utils import (
@@ -66,6 +68,8 @@ class OnPolicyRunner(object):
         self.config = config
         self.output_dir = output_dir
         self.loaded_config_src_files = loaded_config_src_files
+        # Runners on different nodes must share their seed (used to initialize models)
+        self._random_seed = seed is None
         self.seed = seed if seed is not None else random.randint(0, 2 ** 31 - 1)
         self.deterministic_cudnn = deterministic_cudnn
         if multiprocessing_start_method == "default":
@@ -103,6 +107,10 @@ class OnPolicyRunner(object):
 
         self.current_checkpoint = None
 
+        # Rank of the node running this runner in multi-node training (see
+        # `start_train`), only the runner of node 0 writes logs and checkpoints
+        self.node_rank = 0
+
         self.local_start_time_str = time.strftime(
             "%Y-%m-%d_%H-%M-%S", time.localtime(time.time())
         )
@@ -244,13 +252,71 @@ class OnPolicyRunner(object):
         checkpoint: Optional[str] = None,
         restart_pipeline: bool = False,
         max_sampler_processes_per_worker: Optional[int] = None,
+        node_rank: int = 0,
+        num_nodes: int = 1,
+        master_address: str = "127.0.0.1",
+        master_port: Optional[int] = None,
+        trainers_per_node: Optional[Sequence[int]] = None,
     ):
-        if not self.disable_config_saving:
-            self.save_project_state()
-
+        """Starts the train (and validation) processes and logs their results
+        until training completes.
+
+        For multi-node training, a runner is started on every node (with the
+        same experiment config and seed). The train `MachineParams` describe
+        all the trainers across nodes (global ranks), and each runner starts
+        the trainers of its own node. Only the runner of node 0 saves the
+        project state, runs validation and writes logs, and only the trainer
+        with global rank 0 (on node 0) saves checkpoints.
+
+        # Parameters
+
+        checkpoint : Optional checkpoint to resume training from.
+        restart_pipeline : Whether to restart the training pipeline (keeping
+            only the model weights of `checkpoint`).
+        max_sampler_processes_per_worker : Maximum number of sampler processes
+            of each trainer.
+        node_rank : Rank of this node.
+        num_nodes : Number of nodes.
+        master_address : Address of node 0, reachable from all nodes.
+        master_port : Free port on node 0 for the distributed store (required
+            with multiple nodes, a free local port is used otherwise).
+        trainers_per_node : Number of trainers run by each node (with global
+            ranks assigned in node order). Trainers are split evenly between
+            nodes if `None`.
+
+        # Returns
+
+        The start time string of the experiment (of this runner).
+        """
         devices = self.worker_devices("train")
         num_workers = len(devices)
 
+        if trainers_per_node is None:
+            trainers_per_node = evenly_distribute_count_into_bins(
+                num_workers, num_nodes
+            )
+        assert 0 <= node_rank < num_nodes, "`node_rank` must be in [0, num_nodes)."
+        assert (
+            len(trainers_per_node) == num_nodes
+            and sum(trainers_per_node) == num_workers
+        ), (
+            f"`trainers_per_node` ({trainers_per_node}) must give the number of"
+            f" trainers of each of the {num_nodes} nodes, {num_workers} in total."
+        )
+        assert num_nodes == 1 or not self._random_seed, (
+            "With multiple nodes, the seed must be given (and the same for all nodes)"
+            " so that all trainers start from the same model."
+        )
+        assert (
+            num_nodes == 1 or master_port is not None
+        ), "`master_port` must be given when training with multiple nodes."
+        self.node_rank = node_rank
+        first_trainer = sum(trainers_per_node[:node_rank])
+        trainer_ids = range(first_trainer, first_trainer + trainers_per_node[node_rank])
+
+        if not self.disable_config_saving and self.node_rank == 0:
+            self.save_project_state()
+
         # Be extra careful to ensure that all models start
         # with the same initializations.
         set_seed(self.seed)
@@ -260,11 +326,17 @@ class OnPolicyRunner(object):
             ).sensor_preprocessor_graph
         ).state_dict()
 
+        distributed_address = "127.0.0.1"
         distributed_port = 0
-        if num_workers > 1:
+        if num_nodes > 1:
+            distributed_address = master_address
+            distributed_port = master_port
+        elif num_workers > 1:
             distributed_port = find_free_port()
 
-        for trainer_it in range(num_workers):
+        running_validation = self.running_validation and self.node_rank == 0
+
+        for trainer_it in trainer_ids:
             train: BaseProcess = self.mp_ctx.Process(
                 target=self.train_loop,
                 kwargs=dict(
@@ -275,14 +347,18 @@ class OnPolicyRunner(object):
                     config=self.config,
                     results_queue=self.queues["results"],
                     checkpoints_queue=self.queues["checkpoints"]
-                    if self.running_validation
+                    if running_validation
                     else None,
-                    checkpoints_dir=self.checkpoint_dir(),
+                    # Only written to by the trainer of global rank 0 (on node 0)
+                    checkpoints_dir=self.checkpoint_dir(
+                        create_if_none=self.node_rank == 0
+                    ),
                     seed=self.seed,
                     deterministic_cudnn=self.deterministic_cudnn,
                     mp_ctx=self.mp_ctx,
                     num_workers=num_workers,
                     device=devices[trainer_it],
+                    distributed_address=distributed_address,
                     distributed_port=distributed_port,
                     max_sampler_processes_per_worker=max_sampler_processes_per_worker,
                     initial_model_state_dict=initial_model_state_dict,
@@ -296,7 +372,7 @@ class OnPolicyRunner(object):
         )
 
         # Validation
-        if self.running_validation:
+        if running_validation:
             device = self.worker_devices("valid")[0]
             self.init_visualizer("valid")
             valid: BaseProcess = self.mp_ctx.Process(
@@ -320,12 +396,13 @@ class OnPolicyRunner(object):
             get_logger().info(
                 "Started {} valid processes".format(len(self.processes["valid"]))
             )
-        else:
+        elif self.node_rank == 0:
             get_logger().info(
                 "No processes allocated to validation, no validation will be run."
             )
 
-        self.log(self.local_start_time_str, num_workers)
+        # The runner receives the logging packages of the trainers of its node
+        self.log(self.local_start_time_str, len(trainer_ids))
 
         return self.local_start_time_str
 
@@ -552,6 +629,33 @@ class OnPolicyRunner(object):
                 num_steps=training_steps,
             )
 
+    @staticmethod
+    def log_histogram(
+        log_writer: SummaryWriter,
+        tag: str,
+        bin_edges: np.ndarray,
+        counts: np.ndarray,
+        global_step: int,
+    ):
+        """Logs a histogram given as counts per bin (with the given
+        `bin_edges`), approximating its statistics with the bin centers."""
+        num = int(counts.sum())
+        if num == 0:
+            return
+        centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+        nonzero = np.nonzero(counts)[0]
+        log_writer.add_histogram_raw(
+            tag=tag,
+            min=float(bin_edges[nonzero[0]]),
+            max=float(bin_edges[nonzero[-1] + 1]),
+            num=num,
+            sum=float((centers * counts).sum()),
+            sum_squares=float((centers ** 2 * counts).sum()),
+            bucket_limits=bin_edges[1:].tolist(),
+            bucket_counts=counts.tolist(),
+            global_step=global_step,
+        )
+
     def process_train_packages(
         self,
         log_writer: Optional[SummaryWriter],
@@ -576,7 +680,7 @@ class OnPolicyRunner(object):
         def add_prefix(d: Dict[str, Any], tag: str) -> Dict[str, Any]:
             new_dict = {}
             for k, v in d.items():
-                if "offpolicy" in k:
+                if "offpolicy" in k or k.startswith("perf/"):
                     pass
                 elif k.startswith("losses/"):
                     k = f"{self.mode}-{k}"
@@ -612,6 +716,22 @@ class OnPolicyRunner(object):
             message.append(f"{short_key} {means[k]:.3g}")
         message += [f"elapsed_time {(current_time - last_time):.3g}s"]
 
+        if log_writer is not None:
+            histograms: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+            for pkg in pkgs:
+                for name, (bin_edges, counts) in pkg.histograms.items():
+                    if name in histograms:
+                        counts = histograms[name][1] + counts
+                    histograms[name] = (bin_edges, counts)
+            for name, (bin_edges, counts) in histograms.items():
+                self.log_histogram(
+                    log_writer,
+                    f"{self.mode}-misc/{name}",
+                    bin_edges,
+                    counts,
+                    training_steps,
+                )
+
         if last_steps > 0:
             fps = (training_steps - last_steps) / (current_time - last_time)
             message += [f"approx_fps {fps:.3g}"]
@@ -698,7 +818,7 @@ class OnPolicyRunner(object):
         finalized = False
 
         log_writer: Optional[SummaryWriter] = None
-        if not self.disable_tensorboard:
+        if not self.disable_tensorboard and self.node_rank == 0:
             log_writer = SummaryWriter(
                 log_dir=self.log_writer_path(start_time_str),
                 filename_suffix="__{}_{}".format(self.mode, self.local_start_time_str),
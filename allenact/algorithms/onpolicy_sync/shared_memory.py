@@ -0,0 +1,218 @@
+"""Shared-memory buffers used by `VectorSampledTasks` to move step results
+(observations, rewards and dones) and actions between the main process and
+its worker processes without pickling large arrays through a pipe."""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import gym
+import numpy as np
+import torch
+from gym.spaces.dict import Dict as SpaceDict
+
+from allenact.base_abstractions.misc import RLStepResult
+
+ObservationPath = Tuple[str, ...]
+
+
+def _box_leaves(
+    space: gym.Space, prefix: ObservationPath = ()
+) -> List[Tuple[ObservationPath, gym.spaces.Box]]:
+    """All (path, space) pairs of the `Box` leaves of a (possibly nested)
+    `Dict` space."""
+    if isinstance(space, SpaceDict):
+        leaves = []
+        for key, subspace in space.spaces.items():
+            leaves.extend(_box_leaves(subspace, prefix + (key,)))
+        return leaves
+    elif isinstance(space, gym.spaces.Box):
+        return [(prefix, space)]
+    else:
+        return []
+
+
+def _torch_dtype(np_dtype: Any) -> torch.dtype:
+    return torch.from_numpy(np.zeros((), dtype=np_dtype)).dtype
+
+
+def _pop_path(observation: Dict[str, Any], path: ObservationPath) -> Any:
+    for key in path[:-1]:
+        observation = observation[key]
+    return observation.pop(path[-1])
+
+
+def _set_path(observation: Dict[str, Any], path: ObservationPath, value: Any):
+    for key in path[:-1]:
+        observation = observation.setdefault(key, {})
+    observation[path[-1]] = value
+
+
+def _copy_nested(observation: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        k: _copy_nested(v) if isinstance(v, Dict) else v
+        for k, v in observation.items()
+    }
+
+
+class SharedMemoryStepBuffers(object):
+    """Preallocated shared-memory tensors holding one slot per task sampler.
+
+    Observation buffers are laid out from the (shared) observation space of
+    the samplers: every `gym.spaces.Box` leaf gets a tensor of shape
+    `[num_samplers, *leaf.shape]`. Rewards and dones get a tensor of shape
+    `[num_samplers]` each and, if all samplers share a `Discrete` or `Box`
+    action space, actions are written to a tensor of shape
+    `[num_samplers, *action_shape]`. Anything else (non-Box observations,
+    non-scalar rewards, `info` dictionaries, other action spaces) keeps
+    going through the pipe.
+
+    An instance is created in the main process and sent once to each worker
+    (the underlying storage is shared, not copied). Slots are indexed by the
+    *original* sampler index, so they remain valid while samplers are
+    paused and resumed.
+
+    # Attributes
+
+    num_samplers : Number of slots in each buffer.
+    observations : Mapping from observation path (tuple of keys) to buffer.
+    rewards : Reward buffer.
+    dones : Done buffer.
+    actions : Action buffer (or `None` if actions are sent through the pipe).
+    """
+
+    def __init__(
+        self,
+        num_samplers: int,
+        observation_space: SpaceDict,
+        action_spaces: Sequence[gym.Space],
+    ):
+        self.num_samplers = num_samplers
+
+        self.observations: Dict[ObservationPath, torch.Tensor] = {
+            path: torch.zeros(
+                (num_samplers,) + tuple(space.shape), dtype=_torch_dtype(space.dtype)
+            ).share_memory_()
+            for path, space in (
+                _box_leaves(observation_space)
+                if isinstance(observation_space, SpaceDict)
+                else []
+            )
+        }
+        self.rewards = torch.zeros(num_samplers, dtype=torch.float32).share_memory_()
+        self.dones = torch.zeros(num_samplers, dtype=torch.bool).share_memory_()
+
+        self.action_space: Optional[gym.Space] = None
+        self.actions: Optional[torch.Tensor] = None
+        if all(action_spaces[0] == space for space in action_spaces):
+            space = action_spaces[0]
+            if isinstance(space, gym.spaces.Discrete):
+                self.action_space = space
+                self.actions = torch.zeros(
+                    num_samplers, dtype=torch.int64
+                ).share_memory_()
+            elif isinstance(space, gym.spaces.Box):
+                self.action_space = space
+                self.actions = torch.zeros(
+                    (num_samplers,) + tuple(space.shape),
+                    dtype=_torch_dtype(space.dtype),
+                ).share_memory_()
+
+    @property
+    def has_action_buffer(self) -> bool:
+        return self.actions is not None
+
+    def write_actions(self, actions: Sequence[Any], slots: Sequence[int]) -> None:
+        """Write the actions of the samplers in `slots` (main process
+        side)."""
+        assert len(actions) == len(slots)
+        for slot, action in zip(slots, actions):
+            if isinstance(action, torch.Tensor):
+                self.actions[slot].copy_(action)
+            else:
+                self.actions[slot].copy_(torch.as_tensor(np.asarray(action)))
+
+    def write_flat_actions(
+        self, flat_actions: np.ndarray, slots: Sequence[int]
+    ) -> None:
+        """Write the flattened actions (see `allenact.utils.spaces_utils`) of
+        the samplers in `slots`, given as a `[len(slots), flatdim]` array, with
+        a single copy (main process side)."""
+        assert len(flat_actions) == len(slots)
+        self.actions[list(slots)] = (
+            torch.from_numpy(np.ascontiguousarray(flat_actions))
+            .view((len(slots),) + self.actions.shape[1:])
+            .to(self.actions.dtype)
+        )
+
+    def read_actions(self, slots: Sequence[int]) -> List[Any]:
+        """Read the actions of the samplers in `slots` (worker side)."""
+        if isinstance(self.action_space, gym.spaces.Discrete):
+            return self.actions[list(slots)].tolist()
+        return [self.actions[slot].numpy().copy() for slot in slots]
+
+    def write_step_results(
+        self, step_results: Sequence[RLStepResult], slots: Sequence[int]
+    ) -> List[RLStepResult]:
+        """Copy the tensor content of `step_results` into the buffers (worker
+        side).
+
+        # Returns
+
+        The step results stripped of everything written to shared memory,
+        these are what should be sent back through the pipe.
+        """
+        assert len(step_results) == len(slots)
+
+        light_results = []
+        for slot, sr in zip(slots, step_results):
+            observation = sr.observation
+            if observation is not None:
+                observation = _copy_nested(observation)
+                for path, buffer in self.observations.items():
+                    value = _pop_path(observation, path)
+                    buffer[slot].copy_(torch.as_tensor(value).view(buffer.shape[1:]))
+
+            reward = sr.reward
+            if reward is not None and np.size(reward) == 1:
+                self.rewards[slot] = float(np.asarray(reward).reshape(-1)[0])
+                reward = None
+
+            done = sr.done
+            if isinstance(done, (bool, np.bool_)):
+                self.dones[slot] = bool(done)
+                done = None
+
+            light_results.append(
+                RLStepResult(
+                    observation=observation, reward=reward, done=done, info=sr.info
+                )
+            )
+        return light_results
+
+    def read_step_results(
+        self, light_results: Sequence[RLStepResult], slots: Sequence[int]
+    ) -> List[RLStepResult]:
+        """Rebuild full step results from the pipe messages and the buffers
+        (main process side).
+
+        Observations are returned as views into the shared buffers and are
+        hence only valid until the next step, callers that need to keep them
+        around (rather than batching them immediately) must copy them.
+        """
+        assert len(light_results) == len(slots)
+
+        results = []
+        for slot, sr in zip(slots, light_results):
+            observation = sr.observation
+            if observation is not None:
+                for path, buffer in self.observations.items():
+                    _set_path(observation, path, buffer[slot])
+
+            results.append(
+                RLStepResult(
+                    observation=observation,
+                    reward=self.rewards[slot].item() if sr.reward is None else sr.reward,
+                    done=bool(self.dones[slot]) if sr.done is None else sr.done,
+                    info=sr.info,
+                )
+            )
+        return results
@@ -3,7 +3,17 @@
 # LICENSE file in the root directory of this source tree.
 import random
 from collections import defaultdict
-from typing import Union, List, Dict, Tuple, DefaultDict, Sequence, cast, Optional
+from typing import (
+    Union,
+    List,
+    Dict,
+    Tuple,
+    DefaultDict,
+    Sequence,
+    cast,
+    Optional,
+    NamedTuple,
+)
 
 import numpy as np
 import torch
@@ -14,13 +24,72 @@ from allenact.algorithms.onpolicy_sync.policy import (
     ObservationType,
     ActionType,
 )
+from allenact.algorithms.onpolicy_sync.returns import (
+    compute_discounted_returns,
+    compute_gae,
+    compute_vtrace,
+)
 from allenact.base_abstractions.misc import Memory
+from allenact.utils.spaces_utils import TreeSpec
 from allenact.utils.system import get_logger
 import allenact.utils.spaces_utils as su
 
 
+class StorageDtype(NamedTuple):
+    """Compact dtype in which an observation or memory tensor is stored in
+    `RolloutStorage`.
+
+    # Attributes
+
+    dtype : The storage dtype (e.g. `torch.uint8`, `torch.float16` or
+        `torch.bfloat16`).
+    scale : If not `None`, values are multiplied by `scale` (and, for integer
+        storage dtypes, rounded and clamped to the range of `dtype`) when
+        stored and divided by `scale` when read. E.g. `StorageDtype(torch.uint8,
+        255.0)` stores images with values in `[0, 1]` as bytes.
+    """
+
+    dtype: torch.dtype
+    scale: Optional[float] = None
+
+
+StorageDtypesType = Dict[str, Union[torch.dtype, StorageDtype]]
+
+
+def _moved_dim_permutation(ndim: int, source: int, destination: int) -> List[int]:
+    """The permutation of `ndim` dimensions which moves dimension `source` to
+    position `destination` (keeping the order of the other dimensions)."""
+    source, destination = source % ndim, destination % ndim
+    dims = [d for d in range(ndim) if d != source]
+    dims.insert(destination, source)
+    return dims
+
+
+def _move_dim(tensor: torch.Tensor, source: int, destination: int) -> torch.Tensor:
+    """Equivalent to `tensor.movedim(source, destination)` (which requires
+    torch>=1.7), returns a view of `tensor`."""
+    if source % tensor.dim() == destination % tensor.dim():
+        return tensor
+    return tensor.permute(*_moved_dim_permutation(tensor.dim(), source, destination))
+
+
 class RolloutStorage(object):
-    """Class for storing rollout information for RL trainers."""
+    """Class for storing rollout information for RL trainers.
+
+    Observations and memory tensors are stored with the dtype they are
+    inserted with (resp. the dtype in the memory specification) unless a
+    compact storage dtype is given for their key in `observation_dtypes`
+    (keys are observation uuids, with nested observations given by their
+    path joined with "/") or `memory_dtypes`. Compactly stored tensors are
+    converted back to their original dtype when read (with
+    `pick_observation_step`, `pick_memory_step` and `recurrent_generator`).
+
+    If `only_store_first_and_last_in_memory` is `True`, only the memory at the
+    first step and at the latest inserted step are stored, as well as, if
+    `memory_chunk_length` is given, the memory at every multiple of
+    `memory_chunk_length` steps (from which `chunked_recurrent_generator`
+    starts its chunks).
+    """
 
     FLATTEN_SEPARATOR: str = "._AUTOFLATTEN_."
 
@@ -30,9 +99,33 @@ class RolloutStorage(object):
         num_samplers: int,
         actor_critic: ActorCriticModel,
         only_store_first_and_last_in_memory: bool = True,
+        observation_dtypes: Optional[StorageDtypesType] = None,
+        memory_dtypes: Optional[StorageDtypesType] = None,
+        memory_chunk_length: Optional[int] = None,
     ):
         self.num_steps = num_steps
         self.only_store_first_and_last_in_memory = only_store_first_and_last_in_memory
+        self.memory_chunk_length = memory_chunk_length
+
+        self.storage_dtypes: Dict[str, Dict[str, StorageDtype]] = {
+            "observations": {
+                key: self._standardize_storage_dtype(dtype)
+                for key, dtype in (observation_dtypes or {}).items()
+            },
+            "memory": {
+                key: self._standardize_storage_dtype(dtype)
+                for key, dtype in (memory_dtypes or {}).items()
+            },
+        }
+        # Original dtypes of the (flattened) keys which are stored compactly
+        self.original_dtypes: Dict[str, Dict[str, torch.dtype]] = {
+            "observations": dict(),
+            "memory": dict(),
+        }
+        self._compact_dtypes: Dict[str, Dict[str, StorageDtype]] = {
+            "observations": dict(),
+            "memory": dict(),
+        }
 
         self.flattened_to_unflattened: Dict[str, Dict[str, List[str]]] = {
             "memory": dict(),
@@ -42,6 +135,13 @@ class RolloutStorage(object):
             "memory": dict(),
             "observations": dict(),
         }
+        # Specs of the inserted observations and memory, with the flattened name
+        # of each of their leaves
+        self._tree_specs: Dict[str, Tuple[TreeSpec, List[str]]] = {}
+        # Flattened names and spec of the stored observations, to unflatten them
+        self._observations_unflatten_spec: Optional[
+            Tuple[List[str], TreeSpec]
+        ] = None
 
         self.dim_names = ["step", "sampler", None]
 
@@ -67,12 +167,125 @@ class RolloutStorage(object):
 
         self.step = 0
 
+        # When not `None`, the number of steps collected by each sampler in the
+        # current rollout (samplers are then allowed to progress at different
+        # rates, see `start_per_sampler_steps`).
+        self.sampler_steps: Optional[List[int]] = None
+
         self.unnarrow_data: DefaultDict[
             str, Union[int, torch.Tensor, Dict]
         ] = defaultdict(dict)
 
         self.device = torch.device("cpu")
 
+        # Buffers (by name and number of samplers) into which minibatches are
+        # gathered by `recurrent_generator`
+        self._minibatch_buffers: Dict[Tuple[str, int], torch.Tensor] = {}
+
+        # Cached (CPU) episode starts of the current rollout, see `episode_starts`
+        self._episode_starts: Optional[torch.Tensor] = None
+
+    @property
+    def episode_starts(self) -> torch.Tensor:
+        """Boolean (CPU) tensor of shape `[steps, samplers]`, `True` at the
+        steps where a new episode starts (i.e. where `masks[:-1]` is 0).
+
+        It is computed (with a single copy from the storage device) once
+        after the last insertion and passed along with minibatches (as
+        `"episode_starts"`) so that recurrent models do not need to find
+        episode boundaries in (device) masks.
+        """
+        if self._episode_starts is None:
+            self._episode_starts = (self.masks[:-1, :, 0] == 0).cpu()
+        return self._episode_starts
+
+    @staticmethod
+    def _standardize_storage_dtype(
+        dtype: Union[torch.dtype, StorageDtype]
+    ) -> StorageDtype:
+        if isinstance(dtype, StorageDtype):
+            return dtype
+        return StorageDtype(dtype=dtype)
+
+    def _storage_dtype(
+        self, storage_name: str, flatten_name: str, dtype: torch.dtype
+    ) -> torch.dtype:
+        """Returns the dtype with which to store the (flattened) key of
+        `storage_name` with original `dtype` (recording the latter if they
+        differ)."""
+        path = self.flattened_to_unflattened[storage_name][flatten_name]
+        storage_dtype = self.storage_dtypes[storage_name].get("/".join(path))
+        if storage_dtype is None or (
+            storage_dtype.dtype == dtype and storage_dtype.scale is None
+        ):
+            return dtype
+        self.original_dtypes[storage_name][flatten_name] = dtype
+        self._compact_dtypes[storage_name][flatten_name] = storage_dtype
+        return storage_dtype.dtype
+
+    def _to_storage(
+        self, storage_name: str, flatten_name: str, data: torch.Tensor
+    ) -> torch.Tensor:
+        """Scales and rounds `data` as required to store it (the cast to the
+        storage dtype happens when copying it into the storage)."""
+        storage_dtype = self._compact_dtypes[storage_name].get(flatten_name)
+        if storage_dtype is None or storage_dtype.scale is None:
+            return data
+        data = data.float() * storage_dtype.scale
+        if not storage_dtype.dtype.is_floating_point:
+            info = torch.iinfo(storage_dtype.dtype)
+            data = data.round_().clamp_(info.min, info.max)
+        return data
+
+    def _from_storage(self, storage_name: str, stored: Memory) -> Memory:
+        """Converts (a selection of) stored tensors back to their original
+        dtypes."""
+        original_dtypes = self.original_dtypes[storage_name]
+        if len(original_dtypes) == 0:
+            return stored
+
+        result = Memory()
+        for key in stored:
+            tensor = stored.tensor(key)
+            if key in original_dtypes:
+                scale = self._compact_dtypes[storage_name][key].scale
+                if scale is not None:
+                    tensor = tensor.float() / scale
+                tensor = tensor.to(original_dtypes[key])
+            result.check_append(key, tensor, stored.sampler_dim(key))
+        return result
+
+    def nbytes_by_key(self) -> Dict[str, int]:
+        """Number of bytes used by each of the stored tensors.
+
+        Observation and memory tensors are reported as
+        `"observations/<key>"` and `"memory/<key>"` (with nested observation
+        keys given by their path joined with "/").
+        """
+        result: Dict[str, int] = {}
+        for storage_name in ["observations", "memory"]:
+            storage: Memory = getattr(self, storage_name)
+            for key in storage:
+                path = self.flattened_to_unflattened[storage_name][key]
+                tensor = storage.tensor(key)
+                result["/".join([storage_name] + path)] = (
+                    tensor.numel() * tensor.element_size()
+                )
+
+        for name in [
+            "actions",
+            "prev_actions",
+            "masks",
+            "rewards",
+            "value_preds",
+            "returns",
+            "action_log_probs",
+        ]:
+            tensor = getattr(self, name)
+            if tensor is not None:
+                result[name] = tensor.numel() * tensor.element_size()
+        return result
+
     def create_memory(
         self,
         spec: Optional[FullMemorySpecType],
@@ -91,19 +304,25 @@ class RolloutStorage(object):
 
             if not first_and_last_only:
                 all_dims = [self.num_steps + 1] + [d[1] for d in dims_template]
+            elif self.memory_chunk_length is not None:
+                # The start of every chunk and the latest step
+                num_chunks = -(-self.num_steps // self.memory_chunk_length)
+                all_dims = [num_chunks + 1] + [d[1] for d in dims_template]
             else:
                 all_dims = [2] + [d[1] for d in dims_template]
             all_dims[sampler_dim] = num_samplers
 
+            self.flattened_to_unflattened["memory"][key] = [key]
+            self.unflattened_to_flattened["memory"][(key,)] = key
+
             memory.check_append(
                 key=key,
-                tensor=torch.zeros(*all_dims, dtype=dtype),
+                tensor=torch.zeros(
+                    *all_dims, dtype=self._storage_dtype("memory", key, dtype)
+                ),
                 sampler_dim=sampler_dim,
             )
 
-            self.flattened_to_unflattened["memory"][key] = [key]
-            self.unflattened_to_flattened["memory"][(key,)] = key
-
         return memory
 
     def to(self, device: torch.device):
@@ -122,93 +341,243 @@ class RolloutStorage(object):
         self.device = device
 
     def insert_observations(
-        self, observations: ObservationType, time_step: int = 0,
+        self,
+        observations: ObservationType,
+        time_step: Union[int, Sequence[int]] = 0,
+        samplers: Optional[Sequence[int]] = None,
     ):
         self.insert_tensors(
-            storage_name="observations", unflattened=observations, time_step=time_step
+            storage_name="observations",
+            unflattened=observations,
+            time_step=time_step,
+            samplers=samplers,
         )
 
     def insert_memory(
-        self, memory: Optional[Memory], time_step: int,
+        self,
+        memory: Optional[Memory],
+        time_step: Union[int, Sequence[int]],
+        samplers: Optional[Sequence[int]] = None,
     ):
         if memory is None:
             assert len(self.memory) == 0
             return
 
-        if self.only_store_first_and_last_in_memory and time_step > 0:
-            time_step = 1
+        if self.only_store_first_and_last_in_memory:
+            if self.memory_chunk_length is not None:
+                self._insert_chunk_start_memory(memory, time_step, samplers)
+            time_step = self._first_and_last_step(time_step)
 
         self.insert_tensors(
-            storage_name="memory", unflattened=memory, time_step=time_step
+            storage_name="memory",
+            unflattened=memory,
+            time_step=time_step,
+            samplers=samplers,
         )
 
+    def _insert_chunk_start_memory(
+        self,
+        memory: Memory,
+        time_step: Union[int, Sequence[int]],
+        samplers: Optional[Sequence[int]],
+    ):
+        """Also stores the memory of samplers at the start of a chunk (in the
+        slot of their chunk)."""
+
+        def is_chunk_start(t: int) -> bool:
+            return 0 < t < self.num_steps and t % self.memory_chunk_length == 0
+
+        if samplers is None:
+            assert isinstance(time_step, int)
+            if is_chunk_start(time_step):
+                self.insert_tensors(
+                    storage_name="memory",
+                    unflattened=memory,
+                    time_step=time_step // self.memory_chunk_length,
+                )
+            return
+
+        if isinstance(time_step, int):
+            time_step = [time_step] * len(samplers)
+        chunk_starts = [i for i, t in enumerate(time_step) if is_chunk_start(t)]
+        if len(chunk_starts) == 0:
+            return
+
+        self.insert_tensors(
+            storage_name="memory",
+            unflattened=memory.sampler_select(chunk_starts),
+            time_step=[time_step[i] // self.memory_chunk_length for i in chunk_starts],
+            samplers=[samplers[i] for i in chunk_starts],
+        )
+
+    @staticmethod
+    def _first_and_last_step(
+        time_step: Union[int, Sequence[int]]
+    ) -> Union[int, List[int]]:
+        """The memory slot of the given steps (when only the first and the
+        latest steps are stored, the latter in the last slot)."""
+        if isinstance(time_step, int):
+            return 0 if time_step == 0 else -1
+        return [0 if t == 0 else -1 for t in time_step]
+
+    def _sampler_index(self, samplers: Sequence[int]) -> torch.Tensor:
+        return torch.as_tensor(list(samplers), dtype=torch.int64, device=self.device)
+
+    def _step_index(
+        self, time_step: Union[int, Sequence[int]], num_samplers: int
+    ) -> torch.Tensor:
+        if isinstance(time_step, int):
+            time_step = [time_step] * num_samplers
+        assert len(time_step) == num_samplers
+        return torch.as_tensor(list(time_step), dtype=torch.int64, device=self.device)
+
+    def _put_samplers(
+        self,
+        tensor: torch.Tensor,
+        sampler_dim: int,
+        time_step: Union[int, Sequence[int]],
+        samplers: Sequence[int],
+        data: torch.Tensor,
+    ):
+        """Writes `data` (without step dimension and with samplers along
+        `sampler_dim - 1`) into the given samplers of the (step-first) `tensor`
+        at the given (possibly per-sampler) time steps."""
+        steps = self._step_index(time_step, len(samplers))
+        view = _move_dim(tensor, sampler_dim, 1)
+        view[steps, self._sampler_index(samplers)] = _move_dim(
+            data, sampler_dim - 1, 0
+        ).to(tensor.dtype)
+
+    def _take_samplers(
+        self,
+        tensor: torch.Tensor,
+        sampler_dim: int,
+        time_step: Union[int, Sequence[int]],
+        samplers: Sequence[int],
+    ) -> torch.Tensor:
+        """The reverse of `_put_samplers`."""
+        steps = self._step_index(time_step, len(samplers))
+        taken = _move_dim(tensor, sampler_dim, 1)[steps, self._sampler_index(samplers)]
+        return _move_dim(taken, 0, sampler_dim - 1)
+
+    def _tree_spec(
+        self, storage_name: str, unflattened: Union[ObservationType, Memory]
+    ) -> Tuple[TreeSpec, List[str]]:
+        """The (cached) spec of the inserted observations or memory and the
+        flattened name of each of its leaves."""
+        cached = self._tree_specs.get(storage_name)
+        if cached is None or not cached[0].matches(unflattened):
+            spec = TreeSpec.from_tree(unflattened)
+            cached = (
+                spec,
+                [self.FLATTEN_SEPARATOR.join(path) for path in spec.paths],
+            )
+            self._tree_specs[storage_name] = cached
+        return cached
+
     def insert_tensors(
         self,
         storage_name: str,
         unflattened: Union[ObservationType, Memory],
-        prefix: str = "",
-        path: Sequence[str] = (),
-        time_step: int = 0,
+        time_step: Union[int, Sequence[int]] = 0,
+        samplers: Optional[Sequence[int]] = None,
+    ):
+        spec, flatten_names = self._tree_spec(storage_name, unflattened)
+        for path, flatten_name, current_data in zip(
+            spec.paths, flatten_names, spec.leaves(unflattened)
+        ):
+            self._insert_tensor(
+                storage_name, path, flatten_name, current_data, time_step, samplers
+            )
+
+    def _insert_tensor(
+        self,
+        storage_name: str,
+        path: Tuple[str, ...],
+        flatten_name: str,
+        current_data: Union[torch.Tensor, Tuple[torch.Tensor, int]],
+        time_step: Union[int, Sequence[int]],
+        samplers: Optional[Sequence[int]],
     ):
         storage = getattr(self, storage_name)
-        path = list(path)
 
-        for name in unflattened:
-            current_data = unflattened[name]
+        sampler_dim = self.dim_names.index("sampler")
+        if isinstance(current_data, tuple):
+            sampler_dim = current_data[1]
+            current_data = current_data[0]
 
-            if isinstance(current_data, Dict):
-                self.insert_tensors(
-                    storage_name,
-                    cast(ObservationType, current_data),
-                    prefix=prefix + name + self.FLATTEN_SEPARATOR,
-                    path=path + [name],
-                    time_step=time_step,
+        if flatten_name not in storage:
+            assert storage_name == "observations"
+            assert (
+                samplers is None
+            ), "observations must be inserted for all samplers before inserting for subsets"
+
+            assert (
+                flatten_name not in self.flattened_to_unflattened[storage_name]
+            ), "new flattened name {} already existing in flattened spaces[{}]".format(
+                flatten_name, storage_name
+            )
+            self.flattened_to_unflattened[storage_name][flatten_name] = list(path)
+            self.unflattened_to_flattened[storage_name][path] = flatten_name
+            self._observations_unflatten_spec = None
+
+            storage[flatten_name] = (
+                torch.zeros_like(  # type:ignore
+                    current_data,
+                    dtype=self._storage_dtype(
+                        storage_name, flatten_name, current_data.dtype
+                    ),
                 )
-                continue
-
-            sampler_dim = self.dim_names.index("sampler")
-            if isinstance(current_data, tuple):
-                sampler_dim = current_data[1]
-                current_data = current_data[0]
-
-            flatten_name = prefix + name
-            if flatten_name not in storage:
-                assert storage_name == "observations"
-                storage[flatten_name] = (
-                    torch.zeros_like(current_data)  # type:ignore
-                    .repeat(
-                        self.num_steps + 1,  # required for observations (and memory)
-                        *(1 for _ in range(len(current_data.shape))),
-                    )
-                    .to(self.device),
-                    sampler_dim,
+                .repeat(
+                    self.num_steps + 1,  # required for observations (and memory)
+                    *(1 for _ in range(len(current_data.shape))),
                 )
+                .to(self.device),
+                sampler_dim,
+            )
 
-                assert (
-                    flatten_name not in self.flattened_to_unflattened[storage_name]
-                ), "new flattened name {} already existing in flattened spaces[{}]".format(
-                    flatten_name, storage_name
-                )
-                self.flattened_to_unflattened[storage_name][flatten_name] = path + [
-                    name
-                ]
-                self.unflattened_to_flattened[storage_name][
-                    tuple(path + [name])
-                ] = flatten_name
-
-            if storage_name == "observations":
-                # current_data has a step dimension
-                assert time_step >= 0
-                storage[flatten_name][0][time_step : time_step + 1].copy_(current_data)
-            else:
-                # current_data does not have a step dimension
-                storage[flatten_name][0][time_step].copy_(current_data)
+        current_data = self._to_storage(storage_name, flatten_name, current_data)
+
+        if samplers is not None:
+            # current_data does not have a step dimension (for observations,
+            # `sampler_dim` already refers to the stored tensor, which does)
+            self._put_samplers(
+                storage[flatten_name][0],
+                sampler_dim + (storage_name != "observations"),
+                time_step,
+                samplers,
+                current_data,
+            )
+        elif storage_name == "observations":
+            # current_data has a step dimension
+            assert time_step >= 0
+            storage[flatten_name][0][time_step : time_step + 1].copy_(current_data)
+        else:
+            # current_data does not have a step dimension
+            storage[flatten_name][0][time_step].copy_(current_data)
 
     def create_tensor_storage(
         self, num_steps: int, template: torch.Tensor
     ) -> torch.Tensor:
+        if template.shape[1] != self.masks.shape[1]:
+            # The template only covers a subset of the samplers (sampler dim is 1)
+            template = template[:, :1].expand(
+                template.shape[0], self.masks.shape[1], *template.shape[2:]
+            )
         return torch.cat([torch.zeros_like(template).to(self.device)] * num_steps)
 
+    def _copy_step(
+        self,
+        tensor: torch.Tensor,
+        step: Union[int, Sequence[int]],
+        data: torch.Tensor,
+        samplers: Optional[Sequence[int]],
+    ):
+        if samplers is None:
+            tensor[step].copy_(data)
+        else:
+            self._put_samplers(tensor, 1, step, samplers, data)
+
     def insert(
         self,
         observations: ObservationType,
@@ -218,16 +587,38 @@ class RolloutStorage(object):
         value_preds: torch.Tensor,
         rewards: torch.Tensor,
         masks: torch.Tensor,
+        samplers: Optional[Sequence[int]] = None,
     ):
-        self.insert_observations(observations, time_step=self.step + 1)
-        self.insert_memory(memory, time_step=self.step + 1)
+        """Inserts the transition for the current step (`self.step`).
+
+        If `samplers` is `None`, the transition contains data for all samplers
+        and the current step is advanced. Otherwise, the data only corresponds
+        to the given (indices of) samplers and the current step is not
+        advanced; once the data for all samplers has been inserted, call
+        `advance_step`. If per-sampler steps are being tracked (see
+        `start_per_sampler_steps`), the data for each sampler is instead
+        inserted at that sampler's own step, which is then advanced.
+        """
+        self._episode_starts = None
+
+        step: Union[int, List[int]] = self.step
+        next_step: Union[int, List[int]] = self.step + 1
+        if samplers is not None and self.sampler_steps is not None:
+            step = [self.sampler_steps[s] for s in samplers]
+            assert max(step) < self.num_steps
+            next_step = [t + 1 for t in step]
 
-        assert actions.shape == self.actions[self.step].shape
+        self.insert_observations(observations, time_step=next_step, samplers=samplers)
+        self.insert_memory(memory, time_step=next_step, samplers=samplers)
 
-        self.actions[self.step].copy_(actions)  # type:ignore
-        self.prev_actions[self.step + 1].copy_(actions)  # type:ignore
+        if samplers is None:
+            assert self.sampler_steps is None
+            assert actions.shape == self.actions[self.step].shape
 
-        self.masks[self.step + 1].copy_(masks)  # type:ignore
+        self._copy_step(self.actions, step, actions, samplers)
+        self._copy_step(self.prev_actions, next_step, actions, samplers)
+
+        self._copy_step(self.masks, next_step, masks, samplers)
 
         if self.rewards is None:
             # We delay the instantiation of storage for `rewards`, `value_preds`, `action_log_probs` and `returns`
@@ -249,19 +640,45 @@ class RolloutStorage(object):
                 self.num_steps, action_log_probs.unsqueeze(0)
             )
 
-        self.value_preds[self.step].copy_(value_preds)  # type:ignore
-        self.rewards[self.step].copy_(rewards)  # type:ignore
-        self.action_log_probs[self.step].copy_(  # type:ignore
-            action_log_probs
-        )
+        self._copy_step(self.value_preds, step, value_preds, samplers)
+        self._copy_step(self.rewards, step, rewards, samplers)
+        self._copy_step(self.action_log_probs, step, action_log_probs, samplers)
+
+        if samplers is None:
+            self.advance_step()
+        elif self.sampler_steps is not None:
+            for s in samplers:
+                self.sampler_steps[s] += 1
 
+    def advance_step(self):
         self.step = (self.step + 1) % self.num_steps
 
+    def start_per_sampler_steps(self):
+        """Starts tracking one step index per sampler (starting at the current
+        step) so that samplers can be inserted (and picked) independently from
+        each other."""
+        assert self.sampler_steps is None
+        self.sampler_steps = [self.step] * self.masks.shape[1]
+
+    def finish_per_sampler_steps(self):
+        """Stops tracking per-sampler steps, all samplers must have reached
+        the same step, which becomes the current step."""
+        assert self.sampler_steps is not None
+        assert all(
+            t == self.sampler_steps[0] for t in self.sampler_steps
+        ), "All samplers must have collected the same number of steps, got {}".format(
+            self.sampler_steps
+        )
+        self.step = self.sampler_steps[0] % self.num_steps
+        self.sampler_steps = None
+
     def sampler_select(self, keep_list: Sequence[int]):
         keep_list = list(keep_list)
         if self.actions.shape[1] == len(keep_list):  # samplers dim
             return  # we are keeping everything, no need to copy
 
+        self._episode_starts = None
+
         self.observations = self.observations.sampler_select(keep_list)
         self.memory = self.memory.sampler_select(keep_list)
         self.actions = self.actions[:, keep_list]
@@ -284,6 +701,8 @@ class RolloutStorage(object):
         """
         assert len(self.unnarrow_data) == 0, "attempting to narrow narrowed rollouts"
 
+        self._episode_starts = None
+
         if self.step == 0:  # we're actually done
             get_logger().warning("Called narrow with self.step == 0")
             return
@@ -298,7 +717,8 @@ class RolloutStorage(object):
                     and self.only_store_first_and_last_in_memory
                     and self.step > 0
                 ):
-                    length = 2
+                    # Memory slots do not correspond to steps
+                    length = storage.tensor(key).shape[0]
                 else:
                     length = self.step + 1
                 storage[key] = (
@@ -328,6 +748,8 @@ class RolloutStorage(object):
     def unnarrow(self):
         assert len(self.unnarrow_data) > 0, "attempting to unnarrow unnarrowed rollouts"
 
+        self._episode_starts = None
+
         for storage_name in ["observations", "memory"]:
             storage: Memory = getattr(self, storage_name)
             for key in storage:
@@ -365,6 +787,8 @@ class RolloutStorage(object):
         assert len(self.unnarrow_data) == 0
 
     def after_update(self):
+        self._episode_starts = None
+
         for storage in [self.observations, self.memory]:
             for key in storage:
                 storage[key][0][0].copy_(storage[key][0][-1])
@@ -375,39 +799,164 @@ class RolloutStorage(object):
         if len(self.unnarrow_data) > 0:
             self.unnarrow()
 
-    def _extend_tensor(self, stored_tensor: torch.Tensor):
-        # Ensure broadcast to all flattened dimensions
-        extended_shape = stored_tensor.shape + (1,) * (
-            len(self.value_preds.shape) - len(stored_tensor.shape)
+    def continue_from(self, rollouts: "RolloutStorage"):
+        """Starts a new rollout from the last step of `rollouts` (a storage
+        for the same samplers), i.e. does what `after_update` does for
+        consecutive rollouts collected into the same storage."""
+        assert len(rollouts.unnarrow_data) == 0, "cannot continue narrowed rollouts"
+
+        self._episode_starts = None
+
+        self.insert_observations(rollouts.pick_observation_step(-1), time_step=0)
+        self.insert_memory(
+            rollouts.pick_memory_step(-1) if len(rollouts.memory) > 0 else None,
+            time_step=0,
         )
-        return stored_tensor.view(*extended_shape)
+        self.masks[0].copy_(rollouts.masks[-1])
+        self.prev_actions[0].copy_(rollouts.prev_actions[-1])
+        self.step = 0
 
     def compute_returns(
         self, next_value: torch.Tensor, use_gae: bool, gamma: float, tau: float
     ):
-        extended_mask = self._extend_tensor(self.masks)
-        extended_rewards = self._extend_tensor(self.rewards)
+        """Computes the returns of the stored steps (see
+        `allenact.algorithms.onpolicy_sync.returns`).
 
+        # Parameters
+
+        next_value : The value prediction for the step after the last stored step.
+        use_gae : Whether to compute returns with generalized advantage estimation
+            or as plain discounted returns.
+        gamma : Discount factor.
+        tau : GAE lambda parameter (unused if `use_gae` is `False`).
+        """
+        num_steps = self.rewards.shape[0]
         if use_gae:
             self.value_preds[-1] = next_value
-            gae = 0
-            for step in reversed(range(extended_rewards.shape[0])):
-                delta = (
-                    extended_rewards[step]
-                    + gamma * self.value_preds[step + 1] * extended_mask[step + 1]
-                    - self.value_preds[step]
-                )
-                gae = delta + gamma * tau * extended_mask[step + 1] * gae  # type:ignore
-                self.returns[step] = gae + self.value_preds[step]
+            self.returns[:num_steps] = (
+                compute_gae(self.rewards, self.value_preds, self.masks, gamma, tau)
+                + self.value_preds[:-1]
+            )
         else:
             self.returns[-1] = next_value
-            for step in reversed(range(extended_rewards.shape[0])):
-                self.returns[step] = (
-                    self.returns[step + 1] * gamma * extended_mask[step + 1]
-                    + extended_rewards[step]
-                )
+            self.returns[:num_steps] = compute_discounted_returns(
+                self.rewards, self.masks, self.returns[-1], gamma
+            )
+
+    def compute_vtrace_returns(
+        self,
+        values: torch.Tensor,
+        action_log_probs: torch.Tensor,
+        gamma: float,
+        tau: float = 1.0,
+        rho_clip: float = 1.0,
+        c_clip: float = 1.0,
+    ) -> torch.Tensor:
+        """Computes V-trace returns (see `compute_vtrace`) for rollouts
+        collected by a behaviour policy other than the learner policy (e.g. a
+        stale copy of it).
+
+        The stored values and action log probabilities (of the behaviour
+        policy) are replaced by those of the learner policy, so that the
+        clipping of losses such as `PPO` is relative to the learner policy
+        before the update, while the advantages are weighted by the truncated
+        importance weights of the learner and behaviour policies.
+
+        # Parameters
+
+        values : `[steps + 1, samplers, ...]` value predictions of the learner
+            (including the value after the last step).
+        action_log_probs : `[steps, samplers, ...]` log probabilities of the
+            stored actions under the learner policy.
+        gamma : Discount factor.
+        tau : Lambda parameter of the traces.
+        rho_clip : Truncation of the importance weights of the TD errors.
+        c_clip : Truncation of the importance weights of the traces.
+
+        # Returns
+
+        The `[steps, samplers, ...]` advantages.
+        """
+        num_steps = self.rewards.shape[0]
+        log_rhos = action_log_probs - self.action_log_probs
+        self.value_preds.copy_(values)
+        self.action_log_probs.copy_(action_log_probs)
+        vs, advantages = compute_vtrace(
+            self.rewards,
+            self.value_preds,
+            self.masks,
+            log_rhos,
+            gamma,
+            tau,
+            rho_clip,
+            c_clip,
+        )
+        self.returns[:num_steps] = vs
+        self.returns[-1] = values[-1]
+        return advantages
+
+    def _minibatch_select(
+        self,
+        name: str,
+        tensor: torch.Tensor,
+        sampler_dim: int,
+        samplers: Union[slice, torch.Tensor],
+    ) -> torch.Tensor:
+        """Selects the given samplers of `tensor` for a minibatch.
+
+        `samplers` is either a range (for which a view of `tensor` is
+        returned) or an index tensor, in which case the samplers are gathered
+        into a (contiguous) buffer reused across calls for the same `name`
+        and number of samplers.
+        """
+        if isinstance(samplers, slice):
+            if samplers.start == 0 and samplers.stop == tensor.shape[sampler_dim]:
+                return tensor
+            return tensor.narrow(
+                sampler_dim, samplers.start, samplers.stop - samplers.start
+            )
+
+        shape = list(tensor.shape)
+        shape[sampler_dim] = len(samplers)
+        buffer = self._minibatch_buffers.get((name, len(samplers)))
+        if (
+            buffer is None
+            or list(buffer.shape) != shape
+            or buffer.dtype != tensor.dtype
+            or buffer.device != tensor.device
+        ):
+            buffer = tensor.new_empty(shape)
+            self._minibatch_buffers[(name, len(samplers))] = buffer
+        return torch.index_select(tensor, sampler_dim, samplers, out=buffer)
+
+    def recurrent_generator(
+        self,
+        advantages: torch.Tensor,
+        num_mini_batch: int,
+        shuffle_samplers: bool = False,
+        zero_copy: bool = False,
+    ):
+        """Generates minibatches of complete sampler trajectories.
+
+        # Parameters
+
+        advantages : Advantages with shape `[steps, samplers, ...]`.
+        num_mini_batch : Number of minibatches the samplers are split into.
+        shuffle_samplers : Whether samplers are randomly assigned to
+            minibatches. If `False`, each minibatch contains a contiguous
+            range of samplers (and ranges are visited in random order).
+        zero_copy : If `True` (only supported if `shuffle_samplers` is
+            `False`), minibatch tensors are views into the storage (which are
+            not contiguous in general and must not be modified in-place).
+            Otherwise, minibatch tensors are gathered into contiguous buffers
+            reused across minibatches (and calls), the tensors of each
+            minibatch are hence only valid until the next minibatch is
+            generated.
+        """
+        assert not (
+            shuffle_samplers and zero_copy
+        ), "Shuffled samplers cannot be selected without copying."
 
-    def recurrent_generator(self, advantages: torch.Tensor, num_mini_batch: int):
         normalized_advantages = (advantages - advantages.mean()) / (
             advantages.std() + 1e-5
         )
@@ -425,77 +974,413 @@ class RolloutStorage(object):
         pairs = list(zip(inds[:-1], inds[1:]))
         random.shuffle(pairs)
 
-        for start_ind, end_ind in pairs:
-            cur_samplers = list(range(start_ind, end_ind))
+        # Sampler selection of each minibatch for storage and CPU tensors
+        minibatch_samplers: List[Tuple[Union[slice, torch.Tensor], ...]]
+        if zero_copy or (num_mini_batch == 1 and not shuffle_samplers):
+            # (a single minibatch of all samplers is made of contiguous views)
+            minibatch_samplers = [
+                (slice(int(start), int(end)),) * 2 for start, end in pairs
+            ]
+        else:
+            permutation = list(range(num_samplers))
+            if shuffle_samplers:
+                random.shuffle(permutation)
+            cpu_order = torch.as_tensor(permutation, dtype=torch.int64)
+            order = cpu_order.to(self.device)
+            minibatch_samplers = [
+                (order[start:end], cpu_order[start:end]) for start, end in pairs
+            ]
+
+        episode_starts = self.episode_starts
+        for samplers, cpu_samplers in minibatch_samplers:
+            memory_batch = Memory()
+            for key in self.memory:
+                sampler_dim = self.memory.sampler_dim(key) - 1
+                memory_batch.check_append(
+                    key,
+                    self._minibatch_select(
+                        "memory/" + key,
+                        self.memory.tensor(key)[0],
+                        sampler_dim,
+                        samplers,
+                    ),
+                    sampler_dim,
+                )
+
+            observations_batch = Memory()
+            for key in self.observations:
+                sampler_dim = self.observations.sampler_dim(key)
+                observations_batch.check_append(
+                    key,
+                    self._minibatch_select(
+                        "observations/" + key,
+                        self.observations.tensor(key)[:-1],
+                        sampler_dim,
+                        samplers,
+                    ),
+                    sampler_dim,
+                )
+
+            batch = {
+                name: self._minibatch_select(name, tensor, 1, samplers)
+                for name, tensor in [
+                    ("actions", self.actions),
+                    ("prev_actions", self.prev_actions[:-1]),
+                    ("values", self.value_preds[:-1]),
+                    ("returns", self.returns[:-1]),
+                    ("masks", self.masks[:-1]),
+                    ("old_action_log_probs", self.action_log_probs),
+                    ("adv_targ", advantages),
+                    ("norm_adv_targ", normalized_advantages),
+                ]
+            }
+
+            yield {
+                **batch,
+                "observations": self.unflatten_observations(
+                    self._from_storage("observations", observations_batch)
+                ),
+                "memory": self._from_storage("memory", memory_batch),
+                "episode_starts": episode_starts[:, cpu_samplers],
+                "actions": su.unflatten(self.action_space, batch["actions"]),
+                "prev_actions": su.unflatten(self.action_space, batch["prev_actions"]),
+            }
+
+    def chunked_recurrent_generator(
+        self, advantages: torch.Tensor, num_mini_batch: int
+    ):
+        """Generates minibatches of chunks of sampler trajectories (for
+        truncated backpropagation through time).
+
+        The trajectory of each sampler is split into consecutive chunks of
+        `memory_chunk_length` steps, starting from the memory stored at their
+        first step. Chunks (of all samplers) are shuffled and split into
+        `num_mini_batch` minibatches with tensors of shape
+        `[memory_chunk_length, chunks, ...]`. If the number of steps is not a
+        multiple of `memory_chunk_length`, the shorter last chunks of all
+        samplers form an additional minibatch.
+
+        # Parameters
+
+        advantages : Advantages with shape `[steps, samplers, ...]`.
+        num_mini_batch : Number of minibatches the (full length) chunks are
+            split into.
+        """
+        chunk_length = self.memory_chunk_length
+        assert chunk_length is not None, "`memory_chunk_length` must be set."
+
+        normalized_advantages = (advantages - advantages.mean()) / (
+            advantages.std() + 1e-5
+        )
 
-            memory_batch = self.memory.step_squeeze(0).sampler_select(cur_samplers)
-            observations_batch = self.unflatten_observations(
-                self.observations.slice(dim=0, stop=-1).sampler_select(cur_samplers)
+        num_steps, num_samplers = self.rewards.shape[:2]
+        num_full_chunks = num_steps // chunk_length
+        remainder = num_steps - num_full_chunks * chunk_length
+        assert num_full_chunks * num_samplers >= num_mini_batch, (
+            "The number of chunks ({}) "
+            "must be greater than or equal to the number of "
+            "mini batches ({}).".format(num_full_chunks * num_samplers, num_mini_batch)
+        )
+
+        # For each minibatch: the (global, CPU) indices of its chunks, their
+        # samplers and the length of its chunks
+        selections: List[Tuple[torch.Tensor, torch.Tensor, int]] = []
+        chunk_ids = torch.randperm(num_full_chunks * num_samplers)
+        inds = np.round(
+            np.linspace(0, len(chunk_ids), num_mini_batch + 1, endpoint=True)
+        ).astype(np.int32)
+        for start, end in zip(inds[:-1], inds[1:]):
+            selected = chunk_ids[start:end]
+            selections.append(
+                (selected // num_samplers, selected % num_samplers, chunk_length)
+            )
+        if remainder > 0:
+            selections.append(
+                (
+                    torch.full((num_samplers,), num_full_chunks, dtype=torch.int64),
+                    torch.arange(num_samplers),
+                    remainder,
+                )
             )
 
-            actions_batch = []
-            prev_actions_batch = []
-            value_preds_batch = []
-            return_batch = []
-            masks_batch = []
-            old_action_log_probs_batch = []
-            adv_targ = []
-            norm_adv_targ = []
-
-            for ind in cur_samplers:
-                actions_batch.append(self.actions[:, ind])
-                prev_actions_batch.append(self.prev_actions[:-1, ind])
-                value_preds_batch.append(self.value_preds[:-1, ind])
-                return_batch.append(self.returns[:-1, ind])
-                masks_batch.append(self.masks[:-1, ind])
-                old_action_log_probs_batch.append(self.action_log_probs[:, ind])
-
-                adv_targ.append(advantages[:, ind])
-                norm_adv_targ.append(normalized_advantages[:, ind])
-
-            actions_batch = torch.stack(actions_batch, 1)  # type:ignore
-            prev_actions_batch = torch.stack(prev_actions_batch, 1)  # type:ignore
-            value_preds_batch = torch.stack(value_preds_batch, 1)  # type:ignore
-            return_batch = torch.stack(return_batch, 1)  # type:ignore
-            masks_batch = torch.stack(masks_batch, 1)  # type:ignore
-            old_action_log_probs_batch = torch.stack(  # type:ignore
-                old_action_log_probs_batch, 1
+        def select_chunks(
+            tensor: torch.Tensor,
+            sampler_dim: int,
+            chunks: torch.Tensor,
+            samplers: torch.Tensor,
+            length: int,
+        ) -> torch.Tensor:
+            # `[steps, ..., samplers, ...]` to `[length, ..., chunks, ...]`
+            tensor = _move_dim(tensor, sampler_dim, 1)
+            if length != chunk_length:
+                # The last chunks (of all samplers)
+                tensor = tensor[-length:]
+                chunks = chunks - num_full_chunks
+            else:
+                tensor = tensor[: num_full_chunks * chunk_length]
+            tensor = tensor.reshape(-1, length, *tensor.shape[1:]).transpose(0, 1)
+            return _move_dim(tensor[:, chunks, samplers], 1, sampler_dim)
+
+        episode_starts = self.episode_starts
+        for cpu_chunks, cpu_samplers, length in selections:
+            chunks, samplers = cpu_chunks.to(self.device), cpu_samplers.to(self.device)
+
+            memory_batch = Memory()
+            for key in self.memory:
+                # Memory at the first step of each chunk
+                sampler_dim = self.memory.sampler_dim(key)
+                memory_steps = chunks * (
+                    1 if self.only_store_first_and_last_in_memory else chunk_length
+                )
+                memory_batch.check_append(
+                    key,
+                    _move_dim(
+                        _move_dim(self.memory.tensor(key), sampler_dim, 1)[
+                            memory_steps, samplers
+                        ],
+                        0,
+                        sampler_dim - 1,
+                    ),
+                    sampler_dim - 1,
+                )
+
+            observations_batch = Memory()
+            for key in self.observations:
+                sampler_dim = self.observations.sampler_dim(key)
+                observations_batch.check_append(
+                    key,
+                    select_chunks(
+                        self.observations.tensor(key)[:-1],
+                        sampler_dim,
+                        chunks,
+                        samplers,
+                        length,
+                    ),
+                    sampler_dim,
+                )
+
+            batch = {
+                name: select_chunks(tensor, 1, chunks, samplers, length)
+                for name, tensor in [
+                    ("actions", self.actions),
+                    ("prev_actions", self.prev_actions[:-1]),
+                    ("values", self.value_preds[:-1]),
+                    ("returns", self.returns[:-1]),
+                    ("masks", self.masks[:-1]),
+                    ("old_action_log_probs", self.action_log_probs),
+                    ("adv_targ", advantages),
+                    ("norm_adv_targ", normalized_advantages),
+                ]
+            }
+
+            yield {
+                **batch,
+                "observations": self.unflatten_observations(
+                    self._from_storage("observations", observations_batch)
+                ),
+                "memory": self._from_storage("memory", memory_batch),
+                "episode_starts": select_chunks(
+                    episode_starts, 1, cpu_chunks, cpu_samplers, length
+                ),
+                "actions": su.unflatten(self.action_space, batch["actions"]),
+                "prev_actions": su.unflatten(self.action_space, batch["prev_actions"]),
+            }
+
+    def feed_forward_generator(self, advantages: torch.Tensor, num_mini_batch: int):
+        """Generates minibatches of transitions for memoryless models.
+
+        The step and sampler dimensions are flattened into a single dimension
+        of transitions which are shuffled and split into `num_mini_batch`
+        minibatches (which can hence be smaller than a single step of all
+        samplers). Minibatch tensors have shape `[1, transitions, ...]` (i.e.
+        each transition is a single step of a separate "sampler") and are
+        gathered into buffers reused across minibatches (and calls), they are
+        hence only valid until the next minibatch is generated.
+
+        # Parameters
+
+        advantages : Advantages with shape `[steps, samplers, ...]`.
+        num_mini_batch : Number of minibatches the transitions are split into.
+        """
+        assert len(self.memory) == 0, "Memory cannot be split into transitions."
+
+        normalized_advantages = (advantages - advantages.mean()) / (
+            advantages.std() + 1e-5
+        )
+
+        num_steps, num_samplers = self.rewards.shape[:2]
+        num_transitions = num_steps * num_samplers
+        assert num_transitions >= num_mini_batch, (
+            "The number of transitions ({}) "
+            "must be greater than or equal to the number of "
+            "mini batches ({}).".format(num_transitions, num_mini_batch)
+        )
+
+        inds = np.round(
+            np.linspace(0, num_transitions, num_mini_batch + 1, endpoint=True)
+        ).astype(np.int32)
+        permutation = torch.randperm(num_transitions, device=self.device)
+
+        def transitions(tensor: torch.Tensor, sampler_dim: int = 1) -> torch.Tensor:
+            # `[steps, ..., samplers, ...]` to `[steps * samplers, ...]`
+            return _move_dim(tensor, sampler_dim, 1).flatten(0, 1)
+
+        flat_observations = {
+            key: transitions(
+                self.observations.tensor(key)[:-1], self.observations.sampler_dim(key)
             )
-            adv_targ = torch.stack(adv_targ, 1)  # type:ignore
-            norm_adv_targ = torch.stack(norm_adv_targ, 1)  # type:ignore
+            for key in self.observations
+        }
+        flat_tensors = {
+            name: transitions(tensor)
+            for name, tensor in [
+                ("actions", self.actions),
+                ("prev_actions", self.prev_actions[:-1]),
+                ("values", self.value_preds[:-1]),
+                ("returns", self.returns[:-1]),
+                ("masks", self.masks[:-1]),
+                ("old_action_log_probs", self.action_log_probs),
+                ("adv_targ", advantages),
+                ("norm_adv_targ", normalized_advantages),
+            ]
+        }
+
+        for start, end in zip(inds[:-1], inds[1:]):
+            selected = permutation[start:end]
+
+            observations_batch = Memory()
+            for key, tensor in flat_observations.items():
+                sampler_dim = self.observations.sampler_dim(key)
+                observations_batch.check_append(
+                    key,
+                    _move_dim(
+                        self._minibatch_select(
+                            "transitions/observations/" + key, tensor, 0, selected
+                        ).unsqueeze(0),
+                        1,
+                        sampler_dim,
+                    ),
+                    sampler_dim,
+                )
+
+            batch = {
+                name: self._minibatch_select(
+                    "transitions/" + name, tensor, 0, selected
+                ).unsqueeze(0)
+                for name, tensor in flat_tensors.items()
+            }
 
             yield {
-                "observations": observations_batch,
-                "memory": memory_batch,
-                "actions": su.unflatten(self.action_space, actions_batch),
-                "prev_actions": su.unflatten(self.action_space, prev_actions_batch),
-                "values": value_preds_batch,
-                "returns": return_batch,
-                "masks": masks_batch,
-                "old_action_log_probs": old_action_log_probs_batch,
-                "adv_targ": adv_targ,
-                "norm_adv_targ": norm_adv_targ,
+                **batch,
+                "observations": self.unflatten_observations(
+                    self._from_storage("observations", observations_batch)
+                ),
+                "memory": Memory(),
+                "actions": su.unflatten(self.action_space, batch["actions"]),
+                "prev_actions": su.unflatten(self.action_space, batch["prev_actions"]),
             }
 
     def unflatten_observations(self, flattened_batch: Memory) -> ObservationType:
-        result: ObservationType = {}
-        for name in flattened_batch:
-            full_path = self.flattened_to_unflattened["observations"][name]
-            cur_dict = result
-            for part in full_path[:-1]:
-                if part not in cur_dict:
-                    cur_dict[part] = {}
-                cur_dict = cast(ObservationType, cur_dict[part])
-            cur_dict[full_path[-1]] = flattened_batch[name][0]
-        return result
+        if self._observations_unflatten_spec is None:
+            names = list(self.flattened_to_unflattened["observations"].keys())
+            self._observations_unflatten_spec = (
+                names,
+                TreeSpec(
+                    [self.flattened_to_unflattened["observations"][n] for n in names]
+                ),
+            )
+        names, spec = self._observations_unflatten_spec
+        return cast(
+            ObservationType,
+            spec.unflatten([flattened_batch[name][0] for name in names]),
+        )
+
+    def pick_observation_step(
+        self,
+        step: Union[int, Sequence[int]],
+        samplers: Optional[Sequence[int]] = None,
+    ) -> ObservationType:
+        """Observations at the given step (which can be one step per sampler
+        if `samplers` is given)."""
+        if not isinstance(step, int):
+            assert samplers is not None
+            observations = Memory()
+            for key in self.observations:
+                observations.check_append(
+                    key,
+                    self._take_samplers(
+                        self.observations.tensor(key),
+                        self.observations.sampler_dim(key),
+                        step,
+                        samplers,
+                    ).unsqueeze(0),
+                    self.observations.sampler_dim(key),
+                )
+            return self.unflatten_observations(
+                self._from_storage("observations", observations)
+            )
 
-    def pick_observation_step(self, step: int) -> ObservationType:
-        return self.unflatten_observations(self.observations.step_select(step))
+        observations = self.observations.step_select(step)
+        if samplers is not None:
+            observations = observations.sampler_select(samplers)
+        return self.unflatten_observations(
+            self._from_storage("observations", observations)
+        )
+
+    def pick_memory_step(
+        self,
+        step: Union[int, Sequence[int]],
+        samplers: Optional[Sequence[int]] = None,
+    ) -> Memory:
+        if self.only_store_first_and_last_in_memory:
+            step = self._first_and_last_step(step)
+
+        if not isinstance(step, int):
+            assert samplers is not None
+            memory = Memory()
+            for key in self.memory:
+                sampler_dim = self.memory.sampler_dim(key)
+                memory.check_append(
+                    key,
+                    self._take_samplers(
+                        self.memory.tensor(key), sampler_dim, step, samplers
+                    ),
+                    sampler_dim - 1,
+                )
+            return self._from_storage("memory", memory)
+
+        memory = self.memory.step_squeeze(step)
+        if samplers is not None:
+            memory = memory.sampler_select(samplers)
+        return self._from_storage("memory", memory)
 
-    def pick_memory_step(self, step: int) -> Memory:
-        if self.only_store_first_and_last_in_memory and step > 0:
-            step = 1
-        return self.memory.step_squeeze(step)
+    def pick_prev_actions_step(
+        self,
+        step: Union[int, Sequence[int]],
+        samplers: Optional[Sequence[int]] = None,
+    ) -> ActionType:
+        return su.unflatten(
+            self.action_space, self._pick_step(self.prev_actions, step, samplers)
+        )
 
-    def pick_prev_actions_step(self, step: int) -> ActionType:
-        return su.unflatten(self.action_space, self.prev_actions[step : step + 1])
+    def pick_masks_step(
+        self,
+        step: Union[int, Sequence[int]],
+        samplers: Optional[Sequence[int]] = None,
+    ) -> torch.Tensor:
+        return self._pick_step(self.masks, step, samplers)
+
+    def _pick_step(
+        self,
+        tensor: torch.Tensor,
+        step: Union[int, Sequence[int]],
+        samplers: Optional[Sequence[int]],
+    ) -> torch.Tensor:
+        if not isinstance(step, int):
+            assert samplers is not None
+            return self._take_samplers(tensor, 1, step, samplers).unsqueeze(0)
+
+        picked = tensor[step : step + 1]
+        if samplers is not None:
+            picked = picked[:, list(samplers)]
+        return picked
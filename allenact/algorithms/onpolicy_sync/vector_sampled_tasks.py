@@ -2,12 +2,16 @@
 # Modified work Copyright (c) Allen Institute for AI
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
+import functools
+import queue
+import random
+import sys
+import threading
 import time
 import traceback
-from multiprocessing.connection import Connection
+from multiprocessing.connection import Connection, wait as wait_for_connections
 from multiprocessing.context import BaseContext
 from multiprocessing.process import BaseProcess
-from threading import Thread
 from typing import (
     Any,
     Callable,
@@ -23,12 +27,23 @@ from typing import (
     cast,
 )
 
+import gym
 import numpy as np
 from gym.spaces.dict import Dict as SpaceDict
 from setproctitle import setproctitle as ptitle
 
-from allenact.base_abstractions.misc import RLStepResult
-from allenact.base_abstractions.task import TaskSampler
+from allenact.algorithms.onpolicy_sync.out_of_band_connection import (
+    OUT_OF_BAND_PICKLING_AVAILABLE,
+    OutOfBandConnection,
+)
+from allenact.algorithms.onpolicy_sync.shared_memory import SharedMemoryStepBuffers
+from allenact.base_abstractions.misc import (
+    RLStepResult,
+    StackedObservations,
+    StackedStepResults,
+)
+from allenact.base_abstractions.task import Task, TaskSampler, BatchedTaskSampler
+from allenact.utils import spaces_utils as su
 from allenact.utils.misc_utils import partition_sequence
 from allenact.utils.system import get_logger
 from allenact.utils.tensor_utils import tile_images
@@ -45,6 +60,7 @@ except ImportError:
 
 DEFAULT_MP_CONTEXT_TYPE = "forkserver"
 COMPLETE_TASK_METRICS_KEY = "__AFTER_TASK_METRICS__"
+WORKER_TIMINGS_KEY = "__WORKER_TIMINGS__"
 
 STEP_COMMAND = "step"
 NEXT_TASK_COMMAND = "next_task"
@@ -52,6 +68,7 @@ RENDER_COMMAND = "render"
 CLOSE_COMMAND = "close"
 OBSERVATION_SPACE_COMMAND = "observation_space"
 ACTION_SPACE_COMMAND = "action_space"
+SPACES_COMMAND = "spaces"
 CALL_COMMAND = "call"
 SAMPLER_COMMAND = "call_sampler"
 ATTR_COMMAND = "attr"
@@ -60,6 +77,120 @@ RESET_COMMAND = "reset"
 SEED_COMMAND = "seed"
 PAUSE_COMMAND = "pause"
 RESUME_COMMAND = "resume"
+SHARED_MEMORY_COMMAND = "shared_memory"
+LATENCY_STATS_COMMAND = "latency_stats"
+ADD_SAMPLER_COMMAND = "add_sampler"
+REMOVE_SAMPLER_COMMAND = "remove_sampler"
+FLAT_ACTION_SPACE_COMMAND = "flat_action_space"
+
+PIPE_TRANSPORT = "pipe"
+SHARED_MEMORY_TRANSPORT = "shared_memory"
+PICKLE5_TRANSPORT = "pickle5"
+
+
+class SamplerLatencyStats(object):
+    """Step and reset latencies measured for a single task sampler.
+
+    Latencies are accumulated (in seconds) both as totals and as histograms
+    over log-spaced bins, the time taken to sample a new task (whether
+    because the previous one was done, `next_task` was called or the sampler
+    was reset) is counted as a reset.
+
+    # Attributes
+
+    bin_edges : Edges of the histogram bins (in seconds), latencies outside of
+        these are counted in the first/last bin.
+    num_steps : Number of steps taken.
+    num_resets : Number of tasks sampled.
+    step_time : Total time spent stepping.
+    reset_time : Total time spent sampling tasks.
+    step_histogram : Step latency counts per bin.
+    reset_histogram : Reset latency counts per bin.
+    """
+
+    bin_edges = np.logspace(-5, 2, 29)
+
+    def __init__(self):
+        self.num_steps = 0
+        self.num_resets = 0
+        self.step_time = 0.0
+        self.reset_time = 0.0
+        self.step_histogram = np.zeros(len(self.bin_edges) - 1, dtype=np.int64)
+        self.reset_histogram = np.zeros(len(self.bin_edges) - 1, dtype=np.int64)
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def _bin(self, latency: float) -> int:
+        return min(
+            max(int(np.searchsorted(self.bin_edges, latency, side="right")) - 1, 0),
+            len(self.bin_edges) - 2,
+        )
+
+    def add_step(self, latency: float) -> None:
+        self.num_steps += 1
+        self.step_time += latency
+        self.step_histogram[self._bin(latency)] += 1
+
+    def add_reset(self, latency: float) -> None:
+        self.num_resets += 1
+        self.reset_time += latency
+        self.reset_histogram[self._bin(latency)] += 1
+
+    @property
+    def cost_per_step(self) -> Optional[float]:
+        """Average time (in seconds) this sampler takes per step, including
+        the amortized cost of sampling new tasks (`None` if no step was
+        taken)."""
+        if self.num_steps == 0:
+            return None
+        return (self.step_time + self.reset_time) / self.num_steps
+
+
+class WorkerPhaseTimings(object):
+    """Time spent in the hot-path phases of a sampler process.
+
+    Phases are stepping a task (``'step'``), computing observations
+    (``'get_observations'``, also counted within ``'step'`` when called by
+    the task while stepping), sampling a new task (``'next_task'``), waiting
+    for the next command (``'pipe_wait'``) and pickling and sending results
+    (``'send'``).
+
+    # Attributes
+
+    totals : Mapping from phase to its total time (in seconds) and number of
+        calls.
+    """
+
+    def __init__(self):
+        self.totals: Dict[str, List] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        total = self.totals.get(phase)
+        if total is None:
+            self.totals[phase] = [seconds, 1]
+        else:
+            total[0] += seconds
+            total[1] += 1
+
+    def pop(self) -> Dict[str, Tuple[float, int]]:
+        """Returns the (total time, count) pair of every phase and resets the
+        timings."""
+        result = {phase: (total[0], total[1]) for phase, total in self.totals.items()}
+        self.totals = {}
+        return result
+
+    def timed(self, phase: str, fn: Callable) -> Callable:
+        """Wraps `fn` so that the time of every call is added to `phase`."""
+
+        def timed_fn(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - start_time)
+
+        return timed_fn
 
 
 class VectorSampledTasks(object):
@@ -85,16 +216,58 @@ class VectorSampledTasks(object):
         recommended method as it works well with CUDA. If
         ``'fork'`` is used, the subproccess  must be started before
         any other GPU useage.
+    transport : how step results and actions are exchanged with the worker
+        processes. With ``'pipe'`` (the default) everything is pickled through
+        the worker pipes. With ``'shared_memory'`` observations (their `Box`
+        components), rewards, dones and (`Discrete` or `Box`) actions are
+        written to preallocated shared-memory buffers and the pipes only carry
+        small control messages, non-tensor observations and `info`
+        dictionaries. Observations returned by `step` are then views into the
+        shared buffers which are only valid until the next call to `step`.
+        With ``'pickle5'`` messages are pickled with protocol 5 and (contiguous)
+        numpy arrays anywhere in them (observations, `info` payloads, etc.) are
+        sent out-of-band through the pipes (see `OutOfBandConnection`). Step
+        results are received into reused buffers, arrays in them are then only
+        valid until the next step result is read from the same worker (the
+        results of all other calls get freshly allocated buffers). Requires
+        python>=3.8 or the `pickle5` package.
+    parallel_startup : if `True` all worker processes are started at once
+        rather than with a short delay between consecutive processes.
+    forkserver_preload : names of modules (e.g. those imported by the
+        experiment config, see `allenact.utils.system.imported_module_names`)
+        to import in the forkserver so that worker processes do not have to
+        import them again. Only used with the ``'forkserver'`` start method
+        and only effective if the forkserver of the current process has not
+        been started yet.
+    worker_timing_period : if not `None`, the hot-path phases of the workers
+        are timed (see `WorkerPhaseTimings`) and, every `worker_timing_period`
+        steps of each sampler, the timings since the last report are added
+        to the `info` of its step result under `WORKER_TIMINGS_KEY` (as a
+        mapping from phase to `(total time, count)`). If `None` (the default)
+        nothing is timed.
+    make_batched_sampler_fn : if not `None`, each worker creates a single
+        `BatchedTaskSampler` (by calling `make_batched_sampler_fn` with the
+        list of `sampler_fn_args` of its samplers as `sampler_fn_args_list`)
+        standing for all of its samplers, rather than one task sampler per
+        entry of `sampler_fn_args` (`make_sampler_fn` is then unused), see
+        `SingleProcessBatchedSampledTasks`. Samplers of batched task samplers
+        cannot be rebalanced.
+    measure_sampler_latencies : whether the workers measure the step and
+        reset latencies of their samplers (see `latency_stats`), as required
+        by `rebalance`. If `False` (the default) nothing is measured and
+        `latency_stats` returns empty stats.
     """
 
     observation_space: SpaceDict
-    _workers: List[Union[mp.Process, Thread, BaseProcess]]
+    _workers: List[Union[mp.Process, threading.Thread, BaseProcess]]
     _is_waiting: bool
     _num_task_samplers: int
     _auto_resample_when_done: bool
     _mp_ctx: BaseContext
     _connection_read_fns: List[Callable[[], Any]]
     _connection_write_fns: List[Callable[[Any], None]]
+    _step_result_read_fns: Optional[List[Callable[[], Any]]]
+    _parent_connections: List[Connection]
 
     def __init__(
         self,
@@ -105,12 +278,24 @@ class VectorSampledTasks(object):
         mp_ctx: Optional[BaseContext] = None,
         should_log: bool = True,
         max_processes: Optional[int] = None,
+        transport: str = PIPE_TRANSPORT,
+        parallel_startup: bool = False,
+        forkserver_preload: Optional[Sequence[str]] = None,
+        worker_timing_period: Optional[int] = None,
+        make_batched_sampler_fn: Optional[Callable[..., BatchedTaskSampler]] = None,
+        measure_sampler_latencies: bool = False,
     ) -> None:
+        startup_start_time = time.time()
 
         self._is_waiting = False
+        self._waiting_process_inds: Set[int] = set()
         self._is_closed = True
         self.should_log = should_log
         self.max_processes = max_processes
+        self.parallel_startup = parallel_startup
+        self.worker_timing_period = worker_timing_period
+        self.make_batched_sampler_fn = make_batched_sampler_fn
+        self.measure_sampler_latencies = measure_sampler_latencies
 
         assert (
             sampler_fn_args is not None and len(sampler_fn_args) > 0
@@ -136,15 +321,55 @@ class VectorSampledTasks(object):
         else:
             self._mp_ctx = cast(BaseContext, mp_ctx)
 
+        if (
+            forkserver_preload is not None
+            and self._mp_ctx.get_start_method() == "forkserver"
+        ):
+            # `__main__` is preloaded by default
+            self._mp_ctx.set_forkserver_preload(
+                ["__main__"] + [m for m in forkserver_preload if m != "__main__"]
+            )
+
         self.npaused_per_process = [0] * self._num_processes
+        self._sampler_process_inds: List[int] = [
+            process_ind
+            for process_ind, part in enumerate(
+                partition_sequence([1] * self._num_task_samplers, self._num_processes)
+            )
+            for _ in part
+        ]
         self.sampler_index_to_process_ind_and_subprocess_ind: Optional[
             List[List[int]]
         ] = None
         self._reset_sampler_index_to_process_ind_and_subprocess_ind()
 
+        assert transport in [
+            PIPE_TRANSPORT,
+            SHARED_MEMORY_TRANSPORT,
+            PICKLE5_TRANSPORT,
+        ], (
+            f"`transport` must be one of"
+            f" {[PIPE_TRANSPORT, SHARED_MEMORY_TRANSPORT, PICKLE5_TRANSPORT]},"
+            f" got {transport}."
+        )
+        if transport == PICKLE5_TRANSPORT and not OUT_OF_BAND_PICKLING_AVAILABLE:
+            raise ImportError(
+                f"The `{PICKLE5_TRANSPORT}` transport requires python>=3.8 or the"
+                f" `pickle5` package (`pip install pickle5`), running python"
+                f" {sys.version_info.major}.{sys.version_info.minor}."
+            )
+        self.transport = transport
+
         self._workers: Optional[List] = None
         for args in sampler_fn_args:
             args["mp_ctx"] = self._mp_ctx
+        self._sampler_fn_args = list(sampler_fn_args)
+        self._last_seeds: Optional[List[int]] = None
+        # Number of times each sampler was migrated (to derive new seeds)
+        self._num_migrations = [0] * self._num_task_samplers
+        # Read functions for step results if these differ from
+        # `_connection_read_fns` (set by `_spawn_workers`)
+        self._step_result_read_fns = None
         (
             self._connection_read_fns,
             self._connection_write_fns,
@@ -157,12 +382,16 @@ class VectorSampledTasks(object):
 
         self._is_closed = False
 
+        # Workers get ready (and report their spaces) concurrently
         for write_fn in self._connection_write_fns:
-            write_fn((OBSERVATION_SPACE_COMMAND, None))
+            write_fn((SPACES_COMMAND, None))
 
-        observation_spaces = [
-            space for read_fn in self._connection_read_fns for space in read_fn()
-        ]
+        observation_spaces = []
+        self.action_spaces = []
+        for read_fn in self._connection_read_fns:
+            process_observation_spaces, process_action_spaces = read_fn()
+            observation_spaces.extend(process_observation_spaces)
+            self.action_spaces.extend(process_action_spaces)
 
         if any(os is None for os in observation_spaces):
             raise NotImplementedError(
@@ -179,20 +408,50 @@ class VectorSampledTasks(object):
             )
 
         self.observation_space = observation_spaces[0]
-        for write_fn in self._connection_write_fns:
-            write_fn((ACTION_SPACE_COMMAND, None))
-        self.action_spaces = [
-            space for read_fn in self._connection_read_fns for space in read_fn()
-        ]
+
+        self._flat_action_space: Optional[gym.Space] = None
+        self._shared_buffers: Optional[SharedMemoryStepBuffers] = None
+        self._active_slots: List[int] = list(range(self._num_task_samplers))
+        if self.transport == SHARED_MEMORY_TRANSPORT:
+            self._setup_shared_memory()
+
+        if self.should_log:
+            get_logger().info(
+                "{} started {} workers for {} task samplers in {:.2f}s.".format(
+                    type(self).__name__,
+                    self._num_processes,
+                    self._num_task_samplers,
+                    time.time() - startup_start_time,
+                )
+            )
+
+    def _setup_shared_memory(self):
+        """Allocates the shared step buffers and sends them (together with the
+        slots owned by each worker) to the worker processes."""
+        self._shared_buffers = SharedMemoryStepBuffers(
+            num_samplers=self._num_task_samplers,
+            observation_space=self.observation_space,
+            action_spaces=self.action_spaces,
+        )
+
+        for write_fn, slots in zip(
+            self._connection_write_fns,
+            self._partition_to_processes(range(self._num_task_samplers)),
+        ):
+            write_fn((SHARED_MEMORY_COMMAND, (self._shared_buffers, slots)))
+
+        for read_fn in self._connection_read_fns:
+            read_fn()
 
     def _reset_sampler_index_to_process_ind_and_subprocess_ind(self):
-        self.sampler_index_to_process_ind_and_subprocess_ind = [
-            [i, j]
-            for i, part in enumerate(
-                partition_sequence([1] * self._num_task_samplers, self._num_processes)
+        # Within each process, samplers are ordered as their (global) indices
+        num_assigned = [0] * self._num_processes
+        self.sampler_index_to_process_ind_and_subprocess_ind = []
+        for process_ind in self._sampler_process_inds:
+            self.sampler_index_to_process_ind_and_subprocess_ind.append(
+                [process_ind, num_assigned[process_ind]]
             )
-            for j in range(len(part))
-        ]
+            num_assigned[process_ind] += 1
 
     def _partition_to_processes(self, seq: Union[Iterator, Sequence]):
         subparts_list: List[List] = [[] for _ in range(self._num_processes)]
@@ -208,11 +467,47 @@ class VectorSampledTasks(object):
 
         return subparts_list
 
+    def _partition_array_to_processes(
+        self, array: np.ndarray, process_inds: Sequence[int]
+    ) -> List[np.ndarray]:
+        """Splits an array with one row per unpaused sampler (in sampler
+        order) into the rows of the samplers of each of the given processes.
+        The rows of a process are a view into `array` whenever its samplers
+        have consecutive indices (as is the case unless samplers have been
+        rebalanced)."""
+        parts = []
+        for sampler_inds in self.sampler_indices_for_processes(process_inds):
+            if (
+                len(sampler_inds) > 0
+                and sampler_inds[-1] - sampler_inds[0] + 1 == len(sampler_inds)
+            ):
+                parts.append(array[sampler_inds[0] : sampler_inds[-1] + 1])
+            else:
+                parts.append(array[sampler_inds])
+        return parts
+
+    def _unpartition_from_processes(self, subparts_list: Sequence[Sequence]) -> List:
+        """Inverse of `_partition_to_processes`: flattens per-process lists
+        (with one entry per unpaused sampler) into a list ordered by sampler
+        index."""
+        return [
+            subparts_list[process_ind][subprocess_ind]
+            for (
+                process_ind,
+                subprocess_ind,
+            ) in self.sampler_index_to_process_ind_and_subprocess_ind
+        ]
+
     @property
     def is_closed(self) -> bool:
         """Has the vector task been closed."""
         return self._is_closed
 
+    @property
+    def num_processes(self) -> int:
+        """Number of worker processes."""
+        return self._num_processes
+
     @property
     def num_unpaused_tasks(self) -> int:
         """Number of unpaused processes.
@@ -223,6 +518,31 @@ class VectorSampledTasks(object):
         """
         return self._num_task_samplers - sum(self.npaused_per_process)
 
+    def sampler_indices_for_processes(
+        self, process_inds: Sequence[int]
+    ) -> List[List[int]]:
+        """The (current, i.e. accounting for paused samplers) indices of the
+        unpaused task samplers run by each of the given worker processes.
+
+        # Parameters
+
+        process_inds : Indices of the worker processes.
+
+        # Returns
+
+        List with, for each process in `process_inds`, the list of indices of
+        its unpaused samplers.
+        """
+        process_to_sampler_inds: Dict[int, List[int]] = {
+            process_ind: [] for process_ind in process_inds
+        }
+        for sampler_index, (process_ind, _) in enumerate(
+            self.sampler_index_to_process_ind_and_subprocess_ind
+        ):
+            if process_ind in process_to_sampler_inds:
+                process_to_sampler_inds[process_ind].append(sampler_index)
+        return [process_to_sampler_inds[process_ind] for process_ind in process_inds]
+
     @property
     def mp_ctx(self):
         """Get the multiprocessing process used by the vector task.
@@ -244,21 +564,52 @@ class VectorSampledTasks(object):
         should_log: bool,
         child_pipe: Optional[Connection] = None,
         parent_pipe: Optional[Connection] = None,
+        set_process_title: bool = True,
+        timing_period: Optional[int] = None,
+        make_batched_sampler_fn: Optional[Callable[..., BatchedTaskSampler]] = None,
+        measure_latencies: bool = False,
     ) -> None:
         """process worker for creating and interacting with the
         Tasks/TaskSampler."""
 
-        ptitle("VectorSampledTask: {}".format(worker_id))
+        if set_process_title:
+            ptitle("VectorSampledTask: {}".format(worker_id))
 
-        sp_vector_sampled_tasks = SingleProcessVectorSampledTasks(
-            make_sampler_fn=make_sampler_fn,
-            sampler_fn_args_list=sampler_fn_args_list,
-            auto_resample_when_done=auto_resample_when_done,
-            should_log=should_log,
-        )
+        sp_vector_sampled_tasks: Union[
+            SingleProcessVectorSampledTasks, SingleProcessBatchedSampledTasks
+        ]
+        if make_batched_sampler_fn is not None:
+            sp_vector_sampled_tasks = SingleProcessBatchedSampledTasks(
+                make_batched_sampler_fn=make_batched_sampler_fn,
+                sampler_fn_args_list=sampler_fn_args_list,
+                auto_resample_when_done=auto_resample_when_done,
+                should_log=should_log,
+                timing_period=timing_period,
+                measure_latencies=measure_latencies,
+            )
+        else:
+            sp_vector_sampled_tasks = SingleProcessVectorSampledTasks(
+                make_sampler_fn=make_sampler_fn,
+                sampler_fn_args_list=sampler_fn_args_list,
+                auto_resample_when_done=auto_resample_when_done,
+                should_log=should_log,
+                timing_period=timing_period,
+                measure_latencies=measure_latencies,
+            )
+
+        worker_timings: Optional[WorkerPhaseTimings] = None
+        if timing_period is not None:
+            worker_timings = WorkerPhaseTimings()
+            connection_read_fn = worker_timings.timed("pipe_wait", connection_read_fn)
+            connection_write_fn = worker_timings.timed("send", connection_write_fn)
 
         if parent_pipe is not None:
             parent_pipe.close()
+
+        flat_action_spec: Optional[su.SpaceSpec] = None
+        shared_buffers: Optional[SharedMemoryStepBuffers] = None
+        all_slots: List[int] = []
+        active_slots: List[int] = []
         try:
             while True:
                 read_input = connection_read_fn()
@@ -273,7 +624,29 @@ class VectorSampledTasks(object):
 
                     if command == PAUSE_COMMAND:
                         sp_vector_sampled_tasks.pause_at(sampler_index=sampler_index)
+                        if shared_buffers is not None:
+                            active_slots.pop(sampler_index)
+                        connection_write_fn("done")
+                    elif command == ADD_SAMPLER_COMMAND:
+                        sampler_fn_args, seed, state, slot = data
+                        sp_vector_sampled_tasks.add_sampler(
+                            sampler_index=sampler_index,
+                            sampler_fn_args=sampler_fn_args,
+                            seed=seed,
+                            state=state,
+                        )
+                        if shared_buffers is not None:
+                            active_slots.insert(sampler_index, slot)
+                            all_slots.insert(sampler_index, slot)
                         connection_write_fn("done")
+                    elif command == REMOVE_SAMPLER_COMMAND:
+                        state = sp_vector_sampled_tasks.remove_sampler(
+                            sampler_index=sampler_index
+                        )
+                        if shared_buffers is not None:
+                            active_slots.pop(sampler_index)
+                            all_slots.pop(sampler_index)
+                        connection_write_fn(state)
                     else:
                         connection_write_fn(
                             sp_vector_sampled_tasks.command_at(
@@ -287,23 +660,63 @@ class VectorSampledTasks(object):
                         commands != PAUSE_COMMAND
                     ), "Cannot pause all task samplers at once."
 
+                    if commands == STEP_COMMAND and isinstance(data_list, np.ndarray):
+                        # Flattened actions of this worker's samplers
+                        data_list = flat_action_spec.batch_action_list(data_list)
+
                     if commands == CLOSE_COMMAND:
                         sp_vector_sampled_tasks.close()
                         break
                     elif commands == RESUME_COMMAND:
                         sp_vector_sampled_tasks.resume_all()
+                        active_slots = list(all_slots)
                         connection_write_fn("done")
+                    elif commands == SPACES_COMMAND:
+                        connection_write_fn(
+                            (
+                                sp_vector_sampled_tasks.command(
+                                    commands=OBSERVATION_SPACE_COMMAND, data_list=None
+                                ),
+                                sp_vector_sampled_tasks.command(
+                                    commands=ACTION_SPACE_COMMAND, data_list=None
+                                ),
+                            )
+                        )
+                    elif commands == FLAT_ACTION_SPACE_COMMAND:
+                        # No reply, this is sent ahead of the steps using it
+                        flat_action_spec = su.space_spec(data_list)
+                    elif commands == SHARED_MEMORY_COMMAND:
+                        shared_buffers, all_slots = data_list
+                        active_slots = list(all_slots)
+                        connection_write_fn("done")
+                    elif commands == STEP_COMMAND and shared_buffers is not None:
+                        if data_list is None:
+                            data_list = shared_buffers.read_actions(active_slots)
+                        step_results = sp_vector_sampled_tasks.step(data_list)
+                        if worker_timings is not None:
+                            VectorSampledTasks._report_worker_timings(
+                                step_results, worker_timings
+                            )
+                        connection_write_fn(
+                            shared_buffers.write_step_results(
+                                step_results, active_slots
+                            )
+                        )
                     else:
+                        is_step = commands == STEP_COMMAND
                         if isinstance(commands, str):
                             commands = [
                                 commands
                             ] * sp_vector_sampled_tasks.num_unpaused_tasks
 
-                        connection_write_fn(
-                            sp_vector_sampled_tasks.command(
-                                commands=commands, data_list=data_list
-                            )
+                        results = sp_vector_sampled_tasks.command(
+                            commands=commands, data_list=data_list
                         )
+                        if is_step and worker_timings is not None:
+                            VectorSampledTasks._report_worker_timings(
+                                results, worker_timings
+                            )
+                        connection_write_fn(results)
 
         except KeyboardInterrupt as e:
             if should_log:
@@ -318,6 +731,22 @@ class VectorSampledTasks(object):
             if should_log:
                 get_logger().info("""Worker {} closing.""".format(worker_id))
 
+    @staticmethod
+    def _report_worker_timings(
+        step_results: Sequence[RLStepResult], worker_timings: WorkerPhaseTimings
+    ) -> None:
+        """Adds the process-level timings to the first step result carrying
+        sampler timings (so that they are reported at the same rate)."""
+        infos = (
+            step_results.infos
+            if isinstance(step_results, StackedStepResults)
+            else [step_result.info for step_result in step_results]
+        )
+        for info in infos:
+            if WORKER_TIMINGS_KEY in info:
+                info[WORKER_TIMINGS_KEY].update(worker_timings.pop())
+                break
+
     def _spawn_workers(
         self,
         make_sampler_fn: Callable[..., TaskSampler],
@@ -326,6 +755,7 @@ class VectorSampledTasks(object):
         parent_connections, worker_connections = zip(
             *[self._mp_ctx.Pipe(duplex=True) for _ in range(self._num_processes)]
         )
+        self._parent_connections = list(parent_connections)
         self._workers = []
         k = 0
         id: Union[int, str]
@@ -346,12 +776,17 @@ class VectorSampledTasks(object):
                         id, current_sampler_fn_args_list
                     )
                 )
+            worker_io = (
+                OutOfBandConnection(worker_conn)
+                if self.transport == PICKLE5_TRANSPORT
+                else worker_conn
+            )
             ps = self._mp_ctx.Process(  # type: ignore
                 target=self._task_sampling_loop_worker,
                 args=(
                     id,
-                    worker_conn.recv,
-                    worker_conn.send,
+                    worker_io.recv,
+                    worker_io.send,
                     make_sampler_fn,
                     current_sampler_fn_args_list,
                     self._auto_resample_when_done,
@@ -359,17 +794,33 @@ class VectorSampledTasks(object):
                     worker_conn,
                     parent_conn,
                 ),
+                kwargs=dict(
+                    timing_period=self.worker_timing_period,
+                    make_batched_sampler_fn=self.make_batched_sampler_fn,
+                    measure_latencies=self.measure_sampler_latencies,
+                ),
             )
             self._workers.append(ps)
             ps.daemon = True
             ps.start()
             worker_conn.close()
-            time.sleep(
-                0.1
-            )  # Useful to ensure things don't lock up when spawning many envs
+            if not self.parallel_startup:
+                time.sleep(
+                    0.1
+                )  # Useful to ensure things don't lock up when spawning many envs
+        parent_ios = [
+            OutOfBandConnection(p) if self.transport == PICKLE5_TRANSPORT else p
+            for p in parent_connections
+        ]
+        if self.transport == PICKLE5_TRANSPORT:
+            # Step results are batched right away (see `wait_step`), so they can
+            # be received into reused buffers
+            self._step_result_read_fns = [
+                functools.partial(p.recv, reuse_buffers=True) for p in parent_ios
+            ]
         return (
-            [p.recv for p in parent_connections],
-            [p.send for p in parent_connections],
+            [p.recv for p in parent_ios],
+            [p.send for p in parent_ios],
         )
 
     def next_task(self, **kwargs):
@@ -479,39 +930,235 @@ class VectorSampledTasks(object):
             )
         ]
 
-    def async_step(self, actions: Sequence[Any]) -> None:
+    def async_step(
+        self,
+        actions: Union[Sequence[Any], np.ndarray],
+        process_inds: Optional[Sequence[int]] = None,
+        flat_action_space: Optional[gym.Space] = None,
+    ) -> None:
         """Asynchronously step in the vectorized Tasks.
 
         # Parameters
 
-        actions : actions to be performed in the vectorized Tasks.
+        actions : actions to be performed in the vectorized Tasks. If
+            `process_inds` is given, only the actions for the (unpaused) samplers
+            of these processes (ordered as in `sampler_indices_for_processes`).
+            If `flat_action_space` is given, a `[samplers, flatdim]` array of
+            flattened actions (see `allenact.utils.spaces_utils.flatten`).
+        process_inds : Optional indices of the worker processes to step, all
+            processes are stepped if `None`. Different process groups can have
+            pending steps at the same time as long as each is collected
+            with a matching `wait_step` call.
+        flat_action_space : The action space of flattened `actions`. Each
+            worker is then sent the rows of its samplers (or, with the shared
+            memory transport, the rows are copied into the shared action
+            buffer at once) and converts them to actions locally, rather than
+            the main process converting the actions one sampler at a time.
         """
+        if flat_action_space is not None:
+            self._send_flat_action_space(flat_action_space)
+
+        if process_inds is None:
+            # All processes, actions are given in sampler order
+            process_inds = list(range(self._num_processes))
+            slots = self._active_slots
+            if flat_action_space is None:
+                actions_per_process = self._partition_to_processes(actions)
+            else:
+                actions_per_process = self._partition_array_to_processes(
+                    actions, process_inds
+                )
+        else:
+            process_inds = list(process_inds)
+            sampler_inds_per_process = self.sampler_indices_for_processes(process_inds)
+            assert len(actions) == sum(len(inds) for inds in sampler_inds_per_process)
+            slots = [
+                self._active_slots[sampler_index]
+                for inds in sampler_inds_per_process
+                for sampler_index in inds
+            ]
+            actions_per_process = []
+            start = 0
+            for sampler_inds in sampler_inds_per_process:
+                process_actions = actions[start : start + len(sampler_inds)]
+                actions_per_process.append(
+                    process_actions
+                    if flat_action_space is not None
+                    else list(process_actions)
+                )
+                start += len(sampler_inds)
+
+        assert self._waiting_process_inds.isdisjoint(
+            process_inds
+        ), "Cannot step processes that are still waiting for a previous step."
+
         self._is_waiting = True
-        for write_fn, action in zip(
-            self._connection_write_fns, self._partition_to_processes(actions)
-        ):
-            write_fn((STEP_COMMAND, action))
+        self._waiting_process_inds.update(process_inds)
 
-    def wait_step(self) -> List[Dict[str, Any]]:
-        """Wait until all the asynchronized processes have synchronized."""
-        observations = []
-        for read_fn in self._connection_read_fns:
-            observations.extend(read_fn())
-        self._is_waiting = False
+        if self._shared_buffers is not None and self._shared_buffers.has_action_buffer:
+            if flat_action_space is not None:
+                self._shared_buffers.write_flat_actions(actions, slots)
+            else:
+                self._shared_buffers.write_actions(actions, slots)
+            for process_ind in process_inds:
+                self._connection_write_fns[process_ind]((STEP_COMMAND, None))
+            return
+
+        for process_ind, process_actions in zip(process_inds, actions_per_process):
+            self._connection_write_fns[process_ind]((STEP_COMMAND, process_actions))
+
+    def _send_flat_action_space(self, action_space: gym.Space) -> None:
+        """Sends the action space of flattened actions to the workers (once,
+        or when it changes) so that they can decode the actions they get."""
+        if self._flat_action_space is action_space:
+            return
+        for write_fn in self._connection_write_fns:
+            write_fn((FLAT_ACTION_SPACE_COMMAND, action_space))
+        self._flat_action_space = action_space
+
+    def wait_step(
+        self, process_inds: Optional[Sequence[int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Wait until all the asynchronized processes have synchronized.
+
+        # Parameters
+
+        process_inds : Optional indices of the worker processes to wait for
+            (these must have been stepped with `async_step`), all processes
+            if `None`.
+
+        # Returns
+
+        The step results of the unpaused samplers of the processes, ordered as
+        in `sampler_indices_for_processes(process_inds)` (i.e. in sampler
+        order if `process_inds` is `None`). The results of batched task
+        samplers are returned as (concatenated) `StackedStepResults`.
+        """
+        all_processes = process_inds is None
+        if all_processes:
+            process_inds = list(range(self._num_processes))
+        process_inds = list(process_inds)
+
+        read_fns = self._step_result_read_fns or self._connection_read_fns
+        results_per_process = []
+        for process_ind in process_inds:
+            results_per_process.append(read_fns[process_ind]())
+            self._waiting_process_inds.discard(process_ind)
+        self._is_waiting = len(self._waiting_process_inds) > 0
+
+        if all(isinstance(r, StackedStepResults) for r in results_per_process):
+            return self._concatenate_stacked_results(
+                results_per_process, all_processes
+            )
+
+        if all_processes:
+            observations = self._unpartition_from_processes(results_per_process)
+            slots = self._active_slots
+        else:
+            observations = [r for results in results_per_process for r in results]
+            slots = [
+                self._active_slots[sampler_index]
+                for inds in self.sampler_indices_for_processes(process_inds)
+                for sampler_index in inds
+            ]
+
+        if self._shared_buffers is not None:
+            observations = self._shared_buffers.read_step_results(observations, slots)
         return observations
 
-    def step(self, actions: Sequence[Any]):
+    def _concatenate_stacked_results(
+        self, results_per_process: List[StackedStepResults], all_processes: bool
+    ) -> StackedStepResults:
+        """Concatenates the step results of batched task samplers without
+        splitting them per sampler (see `wait_step`)."""
+        results = StackedStepResults.concatenate(results_per_process)
+        if all_processes:
+            offsets = np.cumsum([0] + [len(r) for r in results_per_process])
+            order = [
+                offsets[process_ind] + subprocess_ind
+                for (
+                    process_ind,
+                    subprocess_ind,
+                ) in self.sampler_index_to_process_ind_and_subprocess_ind
+            ]
+            if order != list(range(len(results))):
+                results = results.select(order)
+        return results
+
+    def wait_step_ready(
+        self, timeout: Optional[float] = None
+    ) -> List[Tuple[int, List[RLStepResult]]]:
+        """Wait until at least one of the processes with a pending
+        `async_step` is done and return the results of all processes that are
+        done (rather than waiting for every process as in `wait_step`).
+
+        # Parameters
+
+        timeout : Maximum time (in seconds) to wait, if `None` wait until
+            at least one process is ready.
+
+        # Returns
+
+        List of `(process_ind, step_results)` pairs, one for each of the ready
+        processes (in increasing process index order), where `step_results` are
+        the step results of the unpaused samplers of the process (ordered as in
+        `sampler_indices_for_processes([process_ind])`). The list is empty if
+        the timeout expired.
+        """
+        assert (
+            len(self._waiting_process_inds) > 0
+        ), "There are no pending steps to wait for."
+
+        connection_to_process_ind = {
+            self._parent_connections[process_ind]: process_ind
+            for process_ind in self._waiting_process_inds
+        }
+        ready_process_inds = sorted(
+            connection_to_process_ind[conn]
+            for conn in wait_for_connections(
+                list(connection_to_process_ind.keys()), timeout=timeout
+            )
+        )
+
+        return [
+            (process_ind, self.wait_step([process_ind]))
+            for process_ind in ready_process_inds
+        ]
+
+    def _read_pending_results(self):
+        """Reads (and discards) the results of all pending asynchronous
+        calls."""
+        pending = (
+            sorted(self._waiting_process_inds)
+            if len(self._waiting_process_inds) > 0
+            else range(self._num_processes)
+        )
+        for process_ind in pending:
+            try:
+                self._connection_read_fns[process_ind]()
+            except:
+                pass
+        self._waiting_process_inds.clear()
+        self._is_waiting = False
+
+    def step(
+        self,
+        actions: Union[Sequence[Any], np.ndarray],
+        flat_action_space: Optional[gym.Space] = None,
+    ):
         """Perform actions in the vectorized tasks.
 
         # Parameters
 
-        actions: List of size _num_samplers containing action to be taken in each task.
+        actions: List of size _num_samplers containing action to be taken in each task
+            (or array of flattened actions, see `async_step`).
+        flat_action_space: The action space of flattened `actions` (see `async_step`).
 
         # Returns
 
         List of outputs from the step method of tasks.
         """
-        self.async_step(actions)
+        self.async_step(actions, flat_action_space=flat_action_space)
         return self.wait_step()
 
     def reset_all(self):
@@ -527,17 +1174,16 @@ class VectorSampledTasks(object):
         seeds: List of size _num_samplers containing new RNG seeds.
         """
         self.command(commands=SEED_COMMAND, data_list=seeds)
+        if len(seeds) == self._num_task_samplers:
+            # Used to derive seeds for samplers recreated when rebalancing
+            self._last_seeds = list(seeds)
 
     def close(self) -> None:
         if self._is_closed:
             return
 
         if self._is_waiting:
-            for read_fn in self._connection_read_fns:
-                try:
-                    read_fn()
-                except:
-                    pass
+            self._read_pending_results()
 
         for write_fn in self._connection_write_fns:
             try:
@@ -565,8 +1211,7 @@ class VectorSampledTasks(object):
             one will be shifted down by one.
         """
         if self._is_waiting:
-            for read_fn in self._connection_read_fns:
-                read_fn()
+            self._read_pending_results()
 
         (
             process_ind,
@@ -583,10 +1228,9 @@ class VectorSampledTasks(object):
             ]
             if other_process_and_sub_process_inds[0] == process_ind:
                 other_process_and_sub_process_inds[1] -= 1
-            else:
-                break
 
         self.sampler_index_to_process_ind_and_subprocess_ind.pop(sampler_index)
+        self._active_slots.pop(sampler_index)
 
         self.npaused_per_process[process_ind] += 1
 
@@ -602,10 +1246,189 @@ class VectorSampledTasks(object):
         self._is_waiting = False
 
         self._reset_sampler_index_to_process_ind_and_subprocess_ind()
+        self._active_slots = list(range(self._num_task_samplers))
 
         for i in range(len(self.npaused_per_process)):
             self.npaused_per_process[i] = 0
 
+    def latency_stats(self, reset: bool = False) -> List[SamplerLatencyStats]:
+        """Step and reset latencies measured (since the start or the last
+        reset) for the unpaused samplers, empty unless
+        `measure_sampler_latencies` is `True`.
+
+        # Parameters
+
+        reset : Whether to restart the measurements after reading them.
+
+        # Returns
+
+        List with the `SamplerLatencyStats` of each unpaused sampler.
+        """
+        return self.command(
+            commands=LATENCY_STATS_COMMAND, data_list=[reset] * self.num_unpaused_tasks
+        )
+
+    def latency_histograms(self) -> Dict[str, np.ndarray]:
+        """Step and reset latency histograms aggregated over the unpaused
+        samplers.
+
+        # Returns
+
+        Dictionary with the `bin_edges` (in seconds, shared by both
+        histograms) and the `step` and `reset` counts per bin.
+        """
+        all_stats = self.latency_stats()
+        return {
+            "bin_edges": SamplerLatencyStats.bin_edges.copy(),
+            "step": sum(stats.step_histogram for stats in all_stats),
+            "reset": sum(stats.reset_histogram for stats in all_stats),
+        }
+
+    def rebalance(
+        self, min_relative_improvement: float = 0.1, max_migrations: Optional[int] = None
+    ) -> List[int]:
+        """Migrates task samplers between worker processes so that the
+        (measured) time each process takes per step evens out.
+
+        The cost of a sampler is its average step latency (including the
+        amortized cost of sampling new tasks) since the last rebalance and
+        the cost of a process is the sum of the costs of its samplers. Samplers
+        are greedily moved from the most to the least loaded process (as long
+        as every move reduces the cost of the most loaded process by at least
+        `min_relative_improvement`) and, if this reduces the largest process
+        cost by at least `min_relative_improvement`, migrated samplers are
+        closed and recreated in their new process with the same
+        `sampler_fn_args` and the state of the closed sampler (see
+        `TaskSampler.get_state`) or, for samplers not supporting it, a new seed
+        derived from the last seed given to `set_seeds` (so that they do not
+        sample the same tasks again). Sampler indices do not change but
+        migrated samplers start from a new task, their current observations
+        must hence be fetched again (e.g. with `get_observations`). Latency
+        measurements are restarted after every call.
+
+        # Parameters
+
+        min_relative_improvement : Minimal relative reduction of the cost of
+            the most loaded process for a sampler to be migrated.
+        max_migrations : Maximal number of samplers to migrate (unbounded if
+            `None`).
+
+        # Returns
+
+        The (sorted) indices of the migrated samplers.
+        """
+        assert (
+            self.make_batched_sampler_fn is None
+        ), "Samplers of batched task samplers cannot be rebalanced."
+        assert (
+            sum(self.npaused_per_process) == 0
+        ), "Cannot rebalance while some samplers are paused."
+        assert not self._is_waiting, "Cannot rebalance with pending steps."
+        assert (
+            self.measure_sampler_latencies
+        ), "Rebalancing requires `measure_sampler_latencies=True`."
+
+        costs = [stats.cost_per_step for stats in self.latency_stats(reset=True)]
+        if self._num_processes == 1 or any(cost is None for cost in costs):
+            return []
+
+        process_inds = list(self._sampler_process_inds)
+        loads = [0.0] * self._num_processes
+        for sampler_index, process_ind in enumerate(process_inds):
+            loads[process_ind] += costs[sampler_index]
+        initial_makespan = max(loads)
+
+        moved: Set[int] = set()
+        while max_migrations is None or len(moved) < max_migrations:
+            src = int(np.argmax(loads))
+            dst = int(np.argmin(loads))
+            # The original samplers of `src` (those it gains are only added
+            # after all removals, see below), one of which it must keep
+            candidates = [
+                sampler_index
+                for sampler_index, process_ind in enumerate(process_inds)
+                if process_ind == src and sampler_index not in moved
+            ]
+            if len(candidates) <= 1:
+                break
+            best = min(
+                candidates,
+                key=lambda i: max(loads[src] - costs[i], loads[dst] + costs[i]),
+            )
+            if max(
+                loads[src] - costs[best], loads[dst] + costs[best]
+            ) > (1 - min_relative_improvement) * loads[src]:
+                break
+            process_inds[best] = dst
+            loads[src] -= costs[best]
+            loads[dst] += costs[best]
+            moved.add(best)
+
+        if initial_makespan - max(loads) < min_relative_improvement * initial_makespan:
+            return []
+
+        migrated = sorted(moved)
+        if self.should_log:
+            get_logger().info(
+                "Rebalancing samplers {} (largest process cost per step {:.4g}s -> {:.4g}s)".format(
+                    migrated, initial_makespan, max(loads)
+                )
+            )
+
+        # Close migrated samplers, highest position within each process first
+        states: Dict[int, Any] = {}
+        for sampler_index in sorted(
+            migrated,
+            key=lambda i: -self.sampler_index_to_process_ind_and_subprocess_ind[i][1],
+        ):
+            (
+                process_ind,
+                subprocess_ind,
+            ) = self.sampler_index_to_process_ind_and_subprocess_ind[sampler_index]
+            self._connection_write_fns[process_ind](
+                (subprocess_ind, REMOVE_SAMPLER_COMMAND, None)
+            )
+            states[sampler_index] = self._connection_read_fns[process_ind]()
+
+        self._sampler_process_inds = process_inds
+        self._reset_sampler_index_to_process_ind_and_subprocess_ind()
+
+        # Recreate them, lowest position within each process first
+        for sampler_index in migrated:
+            (
+                process_ind,
+                subprocess_ind,
+            ) = self.sampler_index_to_process_ind_and_subprocess_ind[sampler_index]
+            state = states[sampler_index]
+            self._connection_write_fns[process_ind](
+                (
+                    subprocess_ind,
+                    ADD_SAMPLER_COMMAND,
+                    (
+                        self._sampler_fn_args[sampler_index],
+                        self._migration_seed(sampler_index) if state is None else None,
+                        state,
+                        self._active_slots[sampler_index],
+                    ),
+                )
+            )
+            self._connection_read_fns[process_ind]()
+
+        return migrated
+
+    def _migration_seed(self, sampler_index: int) -> int:
+        """A new seed for a migrated sampler whose state cannot be transferred,
+        derived from its last seed and number of migrations."""
+        self._num_migrations[sampler_index] += 1
+        base_seed = (
+            sampler_index
+            if self._last_seeds is None
+            else self._last_seeds[sampler_index]
+        )
+        return random.Random(
+            base_seed * 1000003 + self._num_migrations[sampler_index]
+        ).randint(0, 2 ** 31 - 1)
+
     def command(
         self, commands: Union[List[str], str], data_list: Optional[List]
     ) -> List[Any]:
@@ -623,10 +1446,10 @@ class VectorSampledTasks(object):
             self._partition_to_processes(commands),
             self._partition_to_processes(data_list),
         ):
-            write_fn((subcommands, data_list))
-        results = []
-        for read_fn in self._connection_read_fns:
-            results.extend(read_fn())
+            write_fn((subcommands, subdata_list))
+        results = self._unpartition_from_processes(
+            [read_fn() for read_fn in self._connection_read_fns]
+        )
         self._is_waiting = False
         return results
 
@@ -662,9 +1485,9 @@ class VectorSampledTasks(object):
             self._partition_to_processes(func_names_and_args_list),
         ):
             write_fn((CALL_COMMAND, func_names_and_args))
-        results = []
-        for read_fn in self._connection_read_fns:
-            results.extend(read_fn())
+        results = self._unpartition_from_processes(
+            [read_fn() for read_fn in self._connection_read_fns]
+        )
         self._is_waiting = False
         return results
 
@@ -739,6 +1562,132 @@ class VectorSampledTasks(object):
         self.close()
 
 
+class _WorkerThreadError(object):
+    """Sent by a failing `ThreadedVectorSampledTasks` worker in place of a
+    result."""
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+class ThreadedVectorSampledTasks(VectorSampledTasks):
+    """Vectorized collection of tasks run by threads (rather than processes)
+    of the main process.
+
+    Uses the same command protocol as `VectorSampledTasks` (each thread runs a
+    `SingleProcessVectorSampledTasks` over its share of the task samplers) but
+    commands and results are passed through in-memory queues, so nothing is
+    pickled, no process memory is duplicated and there is no process startup
+    cost. This only pays off with simulators that release the GIL while
+    stepping (e.g. waiting on a socket or rendering in native code), pure
+    Python task samplers will be serialized by the GIL.
+
+    Step results (and all other command results) are not copied, task samplers
+    must hence not modify returned observations in-place afterwards.
+
+    See `VectorSampledTasks` for the attributes, `multiprocessing_start_method`
+    and `mp_ctx` are only used to set the `mp_ctx` argument of the task samplers.
+    """
+
+    def _spawn_workers(
+        self,
+        make_sampler_fn: Callable[..., TaskSampler],
+        sampler_fn_args_list: Sequence[Sequence[Dict[str, Any]]],
+    ) -> Tuple[List[Callable[[], Any]], List[Callable[[Any], None]]]:
+        self._results_ready = threading.Condition()
+        command_queues: List[queue.Queue] = [
+            queue.Queue() for _ in range(self._num_processes)
+        ]
+        self._result_queues: List[queue.Queue] = [
+            queue.Queue() for _ in range(self._num_processes)
+        ]
+
+        def make_write_result_fn(result_queue: queue.Queue) -> Callable[[Any], None]:
+            def write_result(result: Any) -> None:
+                with self._results_ready:
+                    result_queue.put(result)
+                    self._results_ready.notify_all()
+
+            return write_result
+
+        def make_read_result_fn(result_queue: queue.Queue) -> Callable[[], Any]:
+            def read_result() -> Any:
+                result = result_queue.get()
+                if isinstance(result, _WorkerThreadError):
+                    raise RuntimeError(
+                        "ThreadedVectorSampledTasks worker failed."
+                    ) from result.exception
+                return result
+
+            return read_result
+
+        def run_worker(**kwargs) -> None:
+            try:
+                self._task_sampling_loop_worker(**kwargs)
+            except BaseException as e:
+                # Unblock the main thread (the traceback has already been logged)
+                kwargs["connection_write_fn"](_WorkerThreadError(e))
+
+        self._workers = []
+        for id, stuff in enumerate(
+            zip(command_queues, self._result_queues, sampler_fn_args_list)
+        ):
+            command_queue, result_queue, current_sampler_fn_args_list = stuff
+
+            if self.should_log:
+                get_logger().info(
+                    "Starting {}-th ThreadedVectorSampledTasks worker with args {}".format(
+                        id, current_sampler_fn_args_list
+                    )
+                )
+            thread = threading.Thread(
+                target=run_worker,
+                kwargs=dict(
+                    worker_id=id,
+                    connection_read_fn=command_queue.get,
+                    connection_write_fn=make_write_result_fn(result_queue),
+                    make_sampler_fn=make_sampler_fn,
+                    sampler_fn_args_list=current_sampler_fn_args_list,
+                    auto_resample_when_done=self._auto_resample_when_done,
+                    should_log=self.should_log,
+                    set_process_title=False,
+                    timing_period=self.worker_timing_period,
+                    make_batched_sampler_fn=self.make_batched_sampler_fn,
+                    measure_latencies=self.measure_sampler_latencies,
+                ),
+                name="VectorSampledTask: {}".format(id),
+                daemon=True,
+            )
+            self._workers.append(thread)
+            thread.start()
+
+        return (
+            [make_read_result_fn(q) for q in self._result_queues],
+            [q.put for q in command_queues],
+        )
+
+    def wait_step_ready(
+        self, timeout: Optional[float] = None
+    ) -> List[Tuple[int, List[RLStepResult]]]:
+        """See `VectorSampledTasks.wait_step_ready`."""
+        assert (
+            len(self._waiting_process_inds) > 0
+        ), "There are no pending steps to wait for."
+
+        waiting = sorted(self._waiting_process_inds)
+        with self._results_ready:
+            self._results_ready.wait_for(
+                lambda: any(not self._result_queues[p].empty() for p in waiting),
+                timeout=timeout,
+            )
+        ready_process_inds = [p for p in waiting if not self._result_queues[p].empty()]
+
+        return [
+            (process_ind, self.wait_step([process_ind]))
+            for process_ind in ready_process_inds
+        ]
+
+
 class SingleProcessVectorSampledTasks(object):
     """Vectorized collection of tasks.
 
@@ -769,6 +1718,8 @@ class SingleProcessVectorSampledTasks(object):
         sampler_fn_args_list: Sequence[Dict[str, Any]] = None,
         auto_resample_when_done: bool = True,
         should_log: bool = True,
+        timing_period: Optional[int] = None,
+        measure_latencies: bool = False,
     ) -> None:
 
         self._is_closed = True
@@ -781,7 +1732,11 @@ class SingleProcessVectorSampledTasks(object):
         self._auto_resample_when_done = auto_resample_when_done
 
         self.should_log = should_log
+        self.timing_period = timing_period
+        self.measure_latencies = measure_latencies
 
+        self._make_sampler_fn = make_sampler_fn
+        self._num_created_generators = 0
         self._vector_task_generators: List[Generator] = self._create_generators(
             make_sampler_fn=make_sampler_fn,
             sampler_fn_args=[{"mp_ctx": None, **args} for args in sampler_fn_args_list],
@@ -841,11 +1796,37 @@ class SingleProcessVectorSampledTasks(object):
         sampler_fn_args: Dict[str, Any],
         auto_resample_when_done: bool,
         should_log: bool,
+        timing_period: Optional[int] = None,
+        measure_latencies: bool = False,
     ) -> Generator:
         """Generator for working with Tasks/TaskSampler."""
 
+        # Stays empty unless `measure_latencies`
+        latency_stats = SamplerLatencyStats()
+        timings: Optional[WorkerPhaseTimings] = None
+        if timing_period is not None:
+            timings = WorkerPhaseTimings()
+            num_steps_since_report = 0
+        timed = measure_latencies or timings is not None
+
+        def next_task(**kwargs) -> Optional[Task]:
+            if not timed:
+                return task_sampler.next_task(**kwargs)
+            start_time = time.perf_counter()
+            task = task_sampler.next_task(**kwargs)
+            latency = time.perf_counter() - start_time
+            if measure_latencies:
+                latency_stats.add_reset(latency)
+            if timings is not None:
+                timings.add("next_task", latency)
+                if task is not None:
+                    task.get_observations = timings.timed(
+                        "get_observations", task.get_observations
+                    )
+            return task
+
         task_sampler = make_sampler_fn(**sampler_fn_args)
-        current_task = task_sampler.next_task()
+        current_task = next_task()
 
         if current_task is None:
             raise RuntimeError(
@@ -860,14 +1841,23 @@ class SingleProcessVectorSampledTasks(object):
 
             while command != CLOSE_COMMAND:
                 if command == STEP_COMMAND:
-                    step_result: RLStepResult = current_task.step(data)
+                    if timed:
+                        start_time = time.perf_counter()
+                        step_result: RLStepResult = current_task.step(data)
+                        latency = time.perf_counter() - start_time
+                        if measure_latencies:
+                            latency_stats.add_step(latency)
+                        if timings is not None:
+                            timings.add("step", latency)
+                    else:
+                        step_result = current_task.step(data)
                     if current_task.is_done():
                         metrics = current_task.metrics()
                         if metrics is not None and len(metrics) != 0:
                             step_result.info[COMPLETE_TASK_METRICS_KEY] = metrics
 
                         if auto_resample_when_done:
-                            current_task = task_sampler.next_task()
+                            current_task = next_task()
                             if current_task is None:
                                 step_result = step_result.clone({"observation": None})
                             else:
@@ -875,13 +1865,19 @@ class SingleProcessVectorSampledTasks(object):
                                     {"observation": current_task.get_observations()}
                                 )
 
+                    if timings is not None:
+                        num_steps_since_report += 1
+                        if num_steps_since_report == timing_period:
+                            step_result.info[WORKER_TIMINGS_KEY] = timings.pop()
+                            num_steps_since_report = 0
+
                     command, data = yield step_result
 
                 elif command == NEXT_TASK_COMMAND:
                     if data is not None:
-                        current_task = task_sampler.next_task(**data)
+                        current_task = next_task(**data)
                     else:
-                        current_task = task_sampler.next_task()
+                        current_task = next_task()
                     observations = current_task.get_observations()
 
                     command, data = yield observations
@@ -927,7 +1923,7 @@ class SingleProcessVectorSampledTasks(object):
 
                 elif command == RESET_COMMAND:
                     task_sampler.reset()
-                    current_task = task_sampler.next_task()
+                    current_task = next_task()
 
                     if current_task is None:
                         raise RuntimeError(
@@ -943,6 +1939,12 @@ class SingleProcessVectorSampledTasks(object):
                     task_sampler.set_seed(data)
 
                     command, data = yield "done"
+                elif command == LATENCY_STATS_COMMAND:
+                    result = latency_stats
+                    if data:
+                        latency_stats = SamplerLatencyStats()
+
+                    command, data = yield result
                 else:
                     raise NotImplementedError()
 
@@ -963,34 +1965,123 @@ class SingleProcessVectorSampledTasks(object):
                 )
             task_sampler.close()
 
+    def _create_generator(
+        self,
+        make_sampler_fn: Callable[..., TaskSampler],
+        sampler_fn_args: Dict[str, Any],
+    ) -> Generator:
+        id = self._num_created_generators
+        self._num_created_generators += 1
+
+        if self.should_log:
+            get_logger().info(
+                "Starting {}-th SingleProcessVectorSampledTasks generator with args {}".format(
+                    id, sampler_fn_args
+                )
+            )
+        generator = self._task_sampling_loop_generator_fn(
+            worker_id=id,
+            make_sampler_fn=make_sampler_fn,
+            sampler_fn_args=sampler_fn_args,
+            auto_resample_when_done=self._auto_resample_when_done,
+            should_log=self.should_log,
+            timing_period=self.timing_period,
+            measure_latencies=self.measure_latencies,
+        )
+
+        if next(generator) != "started":
+            raise RuntimeError("Generator failed to start.")
+
+        return generator
+
     def _create_generators(
         self,
         make_sampler_fn: Callable[..., TaskSampler],
         sampler_fn_args: Sequence[Dict[str, Any]],
     ) -> List[Generator]:
-
-        generators = []
-        for id, current_sampler_fn_args in enumerate(sampler_fn_args):
-            if self.should_log:
-                get_logger().info(
-                    "Starting {}-th SingleProcessVectorSampledTasks generator with args {}".format(
-                        id, current_sampler_fn_args
-                    )
-                )
-            generators.append(
-                self._task_sampling_loop_generator_fn(
-                    worker_id=id,
-                    make_sampler_fn=make_sampler_fn,
-                    sampler_fn_args=current_sampler_fn_args,
-                    auto_resample_when_done=self._auto_resample_when_done,
-                    should_log=self.should_log,
-                )
+        return [
+            self._create_generator(
+                make_sampler_fn=make_sampler_fn,
+                sampler_fn_args=current_sampler_fn_args,
             )
+            for current_sampler_fn_args in sampler_fn_args
+        ]
 
-            if next(generators[-1]) != "started":
-                raise RuntimeError("Generator failed to start.")
+    def add_sampler(
+        self,
+        sampler_index: int,
+        sampler_fn_args: Dict[str, Any],
+        seed: Optional[int] = None,
+        state: Optional[Any] = None,
+    ) -> None:
+        """Creates a new task sampler (with the `make_sampler_fn` given at
+        construction) and inserts it at position `sampler_index`.
 
-        return generators
+        # Parameters
+
+        sampler_index : Position of the new sampler, all samplers from this
+            index onwards will be shifted up by one.
+        sampler_fn_args : Arguments to pass to `make_sampler_fn`.
+        seed : If not `None`, the new sampler's seed is set to this value and
+            its first task is sampled after seeding.
+        state : If not `None`, the new sampler's state is set to this value
+            (see `TaskSampler.set_state`) and its first task is sampled after
+            setting it.
+        """
+        assert len(self._paused) == 0, "Cannot add samplers while some are paused."
+
+        generator = self._create_generator(
+            make_sampler_fn=self._make_sampler_fn,
+            sampler_fn_args={"mp_ctx": None, **sampler_fn_args},
+        )
+        if state is not None:
+            generator.send((SAMPLER_COMMAND, ("set_state", [state])))
+            generator.send((NEXT_TASK_COMMAND, None))
+        elif seed is not None:
+            generator.send((SEED_COMMAND, seed))
+            generator.send((NEXT_TASK_COMMAND, None))
+
+        self._vector_task_generators.insert(sampler_index, generator)
+        self._num_task_samplers += 1
+
+    def remove_sampler(self, sampler_index: int) -> Optional[Any]:
+        """Closes and removes the task sampler at position `sampler_index`.
+
+        # Parameters
+
+        sampler_index : Which sampler to remove. All indices after this one
+            will be shifted down by one.
+
+        # Returns
+
+        The state of the removed sampler (see `TaskSampler.get_state`).
+        """
+        assert len(self._paused) == 0, "Cannot remove samplers while some are paused."
+        assert self._num_task_samplers > 1, "Cannot remove the last sampler."
+
+        generator = self._vector_task_generators.pop(sampler_index)
+        state = generator.send((SAMPLER_COMMAND, ("get_state", None)))
+        try:
+            generator.send((CLOSE_COMMAND, None))
+        except StopIteration:
+            pass
+        self._num_task_samplers -= 1
+        return state
+
+    def latency_stats(self, reset: bool = False) -> List[SamplerLatencyStats]:
+        """Step and reset latencies measured for the unpaused samplers.
+
+        # Parameters
+
+        reset : Whether to restart the measurements after reading them.
+
+        # Returns
+
+        List with the `SamplerLatencyStats` of each unpaused sampler.
+        """
+        return self.command(
+            commands=LATENCY_STATS_COMMAND, data_list=[reset] * self.num_unpaused_tasks
+        )
 
     def next_task(self, **kwargs):
         """Move to the the next Task for all TaskSamplers.
@@ -1275,3 +2366,243 @@ class SingleProcessVectorSampledTasks(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
+
+
+class SingleProcessBatchedSampledTasks(object):
+    """Runs a single `BatchedTaskSampler` standing for as many task samplers
+    as it has environments.
+
+    Implements the interface of `SingleProcessVectorSampledTasks` used by the
+    `VectorSampledTasks` workers (when created with a
+    `make_batched_sampler_fn`): a step of all unpaused samplers is a single
+    call to `BatchedTaskSampler.step` (for the environments of the unpaused
+    samplers) whose results are returned as `StackedStepResults`, keeping
+    the stacked arrays of the batched sampler. Tasks are always resampled
+    when done.
+
+    Calls to task functions (other than `get_observations`) are forwarded to
+    the batched sampler with the environment index as first argument, and
+    task/sampler attributes which are arrays (or lists) with one entry per
+    environment are indexed by environment.
+    """
+
+    def __init__(
+        self,
+        make_batched_sampler_fn: Callable[..., BatchedTaskSampler],
+        sampler_fn_args_list: Sequence[Dict[str, Any]] = None,
+        auto_resample_when_done: bool = True,
+        should_log: bool = True,
+        timing_period: Optional[int] = None,
+        measure_latencies: bool = False,
+    ) -> None:
+        assert (
+            auto_resample_when_done
+        ), "Batched task samplers always resample tasks when done."
+        assert (
+            sampler_fn_args_list is not None and len(sampler_fn_args_list) > 0
+        ), "number of environments to be created should be greater than 0"
+
+        self.should_log = should_log
+        self.timing_period = timing_period
+        self.measure_latencies = measure_latencies
+
+        self._is_closed = True
+        self._sampler = make_batched_sampler_fn(
+            sampler_fn_args_list=[
+                {"mp_ctx": None, **args} for args in sampler_fn_args_list
+            ]
+        )
+        assert self._sampler.num_envs == len(sampler_fn_args_list), (
+            f"The batched task sampler has {self._sampler.num_envs} environments"
+            f" but was given {len(sampler_fn_args_list)} sets of arguments."
+        )
+        self._is_closed = False
+
+        self._num_task_samplers = self._sampler.num_envs
+        self._unpaused: List[int] = list(range(self._num_task_samplers))
+        self._latency_stats = [
+            SamplerLatencyStats() for _ in range(self._num_task_samplers)
+        ]
+        self._timings: Optional[WorkerPhaseTimings] = None
+        self._num_steps_since_report = 0
+        if timing_period is not None:
+            self._timings = WorkerPhaseTimings()
+
+        self.observation_space = self._sampler.observation_space
+        self.action_spaces = [self._sampler.action_space] * self._num_task_samplers
+
+    @property
+    def is_closed(self) -> bool:
+        """Has the vector task been closed."""
+        return self._is_closed
+
+    @property
+    def num_unpaused_tasks(self) -> int:
+        """Number of unpaused environments."""
+        return len(self._unpaused)
+
+    def _env_value(self, value: Any, env_index: int) -> Any:
+        if (
+            isinstance(value, (np.ndarray, list))
+            and len(value) == self._num_task_samplers
+        ):
+            return value[env_index]
+        return value
+
+    def _observations(self, env_indices: Sequence[int]) -> List[Any]:
+        observations = StackedObservations(self._sampler.get_observations())
+        return [observations[env] for env in env_indices]
+
+    def step(self, actions: Sequence[Any]) -> StackedStepResults:
+        """Steps the environments of the unpaused samplers with `actions`
+        (paused environments are not stepped)."""
+        all_unpaused = len(self._unpaused) == self._num_task_samplers
+        timed = self.measure_latencies or self._timings is not None
+
+        if timed:
+            start_time = time.perf_counter()
+        result = self._sampler.step(
+            np.asarray(actions), env_indices=None if all_unpaused else self._unpaused
+        )
+        if timed:
+            latency = time.perf_counter() - start_time
+        if self.measure_latencies:
+            for env in self._unpaused:
+                self._latency_stats[env].add_step(latency / len(self._unpaused))
+
+        infos = list(result.infos)
+        for info, metrics in zip(infos, result.metrics):
+            if metrics is not None and len(metrics) != 0:
+                info[COMPLETE_TASK_METRICS_KEY] = metrics
+
+        has_task = self._sampler.has_task
+        step_results = StackedStepResults(
+            observations=StackedObservations(
+                stacked=result.observations,
+                present=has_task if all_unpaused else has_task[self._unpaused],
+            ),
+            rewards=result.rewards,
+            dones=result.dones,
+            infos=infos,
+        )
+
+        if self._timings is not None:
+            self._timings.add("step", latency)
+            self._num_steps_since_report += 1
+            if self._num_steps_since_report == self.timing_period:
+                infos[0][WORKER_TIMINGS_KEY] = self._timings.pop()
+                self._num_steps_since_report = 0
+
+        return step_results
+
+    def command_at(
+        self, sampler_index: int, command: str, data: Optional[Any] = None
+    ) -> Any:
+        env = self._unpaused[sampler_index]
+
+        if command == STEP_COMMAND:
+            raise NotImplementedError(
+                "Batched task samplers can only step all environments at once."
+            )
+        elif command == NEXT_TASK_COMMAND:
+            self._sampler.next_task([env], **(data if data is not None else {}))
+            return self._observations([env])[0]
+        elif command == RENDER_COMMAND:
+            return self._sampler.render(env, *data[0], **data[1])
+        elif command == OBSERVATION_SPACE_COMMAND or command == ACTION_SPACE_COMMAND:
+            return getattr(self._sampler, command)
+        elif command == CALL_COMMAND:
+            function_name, function_args = data
+            if function_name == "get_observations":
+                return self._observations([env])[0]
+            return getattr(self._sampler, function_name)(
+                env, *(function_args if function_args is not None else [])
+            )
+        elif command == SAMPLER_COMMAND:
+            function_name, function_args = data
+            return self._env_value(
+                getattr(self._sampler, function_name)(
+                    *(function_args if function_args is not None else [])
+                ),
+                env,
+            )
+        elif command == ATTR_COMMAND or command == SAMPLER_ATTR_COMMAND:
+            return self._env_value(getattr(self._sampler, data), env)
+        elif command == SEED_COMMAND:
+            self._sampler.set_seeds([env], [data])
+            return "done"
+        elif command == LATENCY_STATS_COMMAND:
+            result = self._latency_stats[env]
+            if data:
+                self._latency_stats[env] = SamplerLatencyStats()
+            return result
+        else:
+            raise NotImplementedError()
+
+    def command(
+        self, commands: Union[List[str], str], data_list: Optional[List]
+    ) -> List[Any]:
+        if isinstance(commands, str):
+            commands = [commands] * self.num_unpaused_tasks
+
+        if data_list is None:
+            data_list = [None] * self.num_unpaused_tasks
+
+        if len(commands) > 0 and all(c == commands[0] for c in commands):
+            command = commands[0]
+            if command == STEP_COMMAND:
+                return self.step(data_list)
+            elif command == NEXT_TASK_COMMAND:
+                kwargs = data_list[0] if data_list[0] is not None else {}
+                self._sampler.next_task(list(self._unpaused), **kwargs)
+                return self._observations(self._unpaused)
+            elif command == RESET_COMMAND:
+                self._sampler.reset()
+                return ["done"] * self.num_unpaused_tasks
+            elif command == SEED_COMMAND:
+                self._sampler.set_seeds(list(self._unpaused), data_list)
+                return ["done"] * self.num_unpaused_tasks
+            elif command == CALL_COMMAND and all(
+                data[0] == "get_observations" and not data[1] for data in data_list
+            ):
+                return self._observations(self._unpaused)
+
+        return [
+            self.command_at(sampler_index=sampler_index, command=command, data=data)
+            for sampler_index, (command, data) in enumerate(zip(commands, data_list))
+        ]
+
+    def pause_at(self, sampler_index: int) -> None:
+        """Pauses the environment at (unpaused) index `sampler_index`, it is
+        no longer stepped until resumed."""
+        self._unpaused.pop(sampler_index)
+
+    def resume_all(self) -> None:
+        """Resumes any paused environments."""
+        self._unpaused = list(range(self._num_task_samplers))
+
+    def add_sampler(self, *args, **kwargs) -> None:
+        raise NotImplementedError(
+            "Environments of batched task samplers cannot be migrated."
+        )
+
+    def remove_sampler(self, *args, **kwargs) -> None:
+        raise NotImplementedError(
+            "Environments of batched task samplers cannot be migrated."
+        )
+
+    def close(self) -> None:
+        if self._is_closed:
+            return
+
+        self._sampler.close()
+        self._is_closed = True
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
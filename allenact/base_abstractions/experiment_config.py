@@ -7,8 +7,9 @@ from typing import Dict, Any, Optional, List, Union, Sequence, Tuple, cast
 import torch
 import torch.nn as nn
 
+from allenact.algorithms.onpolicy_sync.storage import StorageDtypesType
 from allenact.base_abstractions.preprocessor import SensorPreprocessorGraph
-from allenact.base_abstractions.task import TaskSampler
+from allenact.base_abstractions.task import TaskSampler, BatchedTaskSampler
 from allenact.utils.experiment_utils import TrainingPipeline, Builder
 from allenact.utils.system import get_logger
 from allenact.utils.viz_utils import VizSuite
@@ -39,6 +40,25 @@ class MachineParams(object):
         ] = None,
         visualizer: Optional[Union[VizSuite, Builder[VizSuite]]] = None,
         gpu_ids: Union[int, Sequence[int]] = None,
+        sampler_transport: str = "pipe",
+        sampler_backend: str = "process",
+        rollout_collection_mode: str = "sync",
+        num_rollout_groups: int = 2,
+        sampler_rebalance_period: Optional[int] = None,
+        fast_sampler_startup: bool = False,
+        sampler_timing_period: Optional[int] = None,
+        profile_phases: bool = False,
+        profile_synchronize: bool = False,
+        profile_trace_rollouts: Optional[Tuple[int, int]] = None,
+        batched_samplers: bool = False,
+        rollout_observation_dtypes: Optional[StorageDtypesType] = None,
+        rollout_memory_dtypes: Optional[StorageDtypesType] = None,
+        paused_sampler_compaction_threshold: Optional[float] = None,
+        gradient_bucket_size_mb: Optional[float] = 25.0,
+        overlap_gradient_reduction: bool = False,
+        async_rollouts: bool = False,
+        async_rollout_queue_size: int = 1,
+        async_weights_refresh_period: int = 1,
     ):
         assert (
             gpu_ids is None or devices is None
@@ -65,6 +85,86 @@ class MachineParams(object):
         )
         self._visualizer_maybe_builder = visualizer
 
+        # How step results and actions are exchanged with the sampler processes,
+        # see `VectorSampledTasks` (one of "pipe", "shared_memory" or "pickle5").
+        self.sampler_transport = sampler_transport
+
+        # Whether task samplers run in worker processes ("process") or in threads of
+        # the training/inference worker ("thread", see `ThreadedVectorSampledTasks`).
+        self.sampler_backend = sampler_backend
+
+        # With "split_groups", samplers (grouped by sampler process) are split into
+        # `num_rollout_groups` groups during training so that policy inference for
+        # one group overlaps with environment steps of the others. With
+        # "ready_subsets", inference runs for whichever sampler processes are done
+        # stepping so that slow processes do not stall the others at every step.
+        self.rollout_collection_mode = rollout_collection_mode
+        self.num_rollout_groups = num_rollout_groups
+
+        # If not None, training samplers are migrated between sampler processes
+        # every `sampler_rebalance_period` rollouts so that the measured step
+        # latency of every process evens out (only useful if there are fewer
+        # processes than samplers, see `VectorSampledTasks.rebalance`).
+        self.sampler_rebalance_period = sampler_rebalance_period
+
+        # If True, all sampler processes are started at once and the modules
+        # imported by the experiment config are preloaded into the forkserver (so
+        # that sampler processes do not import them again).
+        self.fast_sampler_startup = fast_sampler_startup
+
+        # If not None, the hot-path phases of the sampler processes are timed and
+        # reported (as `perf/worker/*` training scalars) every
+        # `sampler_timing_period` steps of each sampler.
+        self.sampler_timing_period = sampler_timing_period
+
+        # Whether to time the phases of the training loop (acting, stepping,
+        # updating, etc., logged as `perf/engine/*` training scalars), whether to
+        # synchronize CUDA devices around each phase for accurate (but slower)
+        # timing and an optional `(first_rollout, num_rollouts)` window of rollouts
+        # for which to save an autograd profiler trace, see `PhaseProfiler`.
+        self.profile_phases = profile_phases
+        self.profile_synchronize = profile_synchronize
+        self.profile_trace_rollouts = profile_trace_rollouts
+
+        # If True, each sampler process creates a single batched task sampler
+        # (with `ExperimentConfig.make_batched_sampler_fn`) standing for all of
+        # its task samplers, stepping them with a single (vectorized) call.
+        self.batched_samplers = batched_samplers
+
+        # Compact dtypes in which to store observations (by uuid, with nested
+        # observations given by their path joined with "/") and memory tensors
+        # (by memory key) in the rollout storage, e.g.
+        # `{"rgb": StorageDtype(torch.uint8, 255.0), "resnet": torch.float16}`.
+        # Stored values are converted back to their original dtype when read,
+        # see `RolloutStorage`.
+        self.rollout_observation_dtypes = rollout_observation_dtypes
+        self.rollout_memory_dtypes = rollout_memory_dtypes
+
+        # If not None, during evaluation samplers which run out of tasks are masked
+        # out of the rollout storage (which keeps its size) rather than removed
+        # from it, until the fraction of running samplers drops below this
+        # threshold (e.g. 0.5) and the storage is compacted. If None (the
+        # default), the storage is compacted whenever a sampler pauses.
+        self.paused_sampler_compaction_threshold = paused_sampler_compaction_threshold
+
+        # When training with multiple workers, gradients are all-reduced in flat
+        # buckets of at most `gradient_bucket_size_mb` MiB (one collective per
+        # parameter if None) and, if `overlap_gradient_reduction`, buckets are
+        # all-reduced during the backward pass as soon as their gradients are
+        # ready, see `BucketedGradientReducer`.
+        self.gradient_bucket_size_mb = gradient_bucket_size_mb
+        self.overlap_gradient_reduction = overlap_gradient_reduction
+
+        # If True, training rollouts are collected in a background thread by a copy
+        # of the model (refreshed with the learner weights every
+        # `async_weights_refresh_period` updates) while the learner updates on
+        # previously collected rollouts (at most `async_rollout_queue_size` of which
+        # are waiting), correcting for the policy lag with V-trace, see
+        # `AsyncRolloutCollector` and `TrainingPipeline.vtrace_rho_clip`.
+        self.async_rollouts = async_rollouts
+        self.async_rollout_queue_size = async_rollout_queue_size
+        self.async_weights_refresh_period = async_weights_refresh_period
+
         self._sensor_preprocessor_graph_cached: Optional[SensorPreprocessorGraph] = None
         self._visualizer_cached: Optional[VizSuite] = None
 
@@ -244,6 +344,21 @@ class ExperimentConfig(metaclass=FrozenClassVariables):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def make_batched_sampler_fn(
+        cls, sampler_fn_args_list: List[Dict[str, Any]], **kwargs
+    ) -> BatchedTaskSampler:
+        """Create a `BatchedTaskSampler` standing for `len(sampler_fn_args_list)`
+        task samplers.
+
+        Only used if `MachineParams.batched_samplers` is True, in which case it
+        is called (in each sampler process) with the list of the arguments
+        (generated by `ExperimentConfig.train_task_sampler_args`, etc.)
+        that would otherwise have been passed to `make_sampler_fn` for each of
+        the task samplers of the process.
+        """
+        raise NotImplementedError()
+
     def train_task_sampler_args(
         self,
         process_ind: int,
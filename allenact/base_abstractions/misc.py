@@ -2,6 +2,7 @@ import abc
 import typing
 from typing import Dict, Any, TypeVar, Sequence, NamedTuple, Optional, List, Union
 
+import numpy as np
 import torch
 
 EnvType = TypeVar("EnvType")
@@ -38,6 +39,171 @@ class RLStepResult(NamedTuple):
         )
 
 
+class BatchedStepResult(NamedTuple):
+    """Result of stepping (some of) the environments of a
+    `BatchedTaskSampler`.
+
+    # Attributes
+
+    observations : Observations of the stepped environments, stacked along a
+        leading `[num_stepped_envs]` dimension (e.g. a, possibly nested,
+        dictionary of arrays). The observations of environments whose task is
+        done are the first observations of their new task.
+    rewards : Array of shape `[num_stepped_envs]`.
+    dones : Boolean array of shape `[num_stepped_envs]`.
+    infos : One info dictionary per stepped environment.
+    metrics : One entry per stepped environment, the metrics of its task if it
+        was completed by this step (see `Task.metrics`) and `None` otherwise.
+    """
+
+    observations: Any
+    rewards: Any
+    dones: Any
+    infos: List[Dict[str, Any]]
+    metrics: List[Optional[Dict[str, Any]]]
+
+
+def _map_tree(fn: typing.Callable[[Any], Any], tree: Any) -> Any:
+    if isinstance(tree, Dict):
+        return {k: _map_tree(fn, v) for k, v in tree.items()}
+    return fn(tree)
+
+
+def _concatenate_trees(trees: Sequence[Any]) -> Any:
+    if isinstance(trees[0], Dict):
+        return {k: _concatenate_trees([t[k] for t in trees]) for k in trees[0]}
+    if torch.is_tensor(trees[0]):
+        return torch.cat(list(trees))
+    return np.concatenate(trees)
+
+
+class StackedObservations(Sequence[Optional[Dict[str, Any]]]):
+    """Observations of several samplers stacked along a leading `[samplers]`
+    dimension (as returned by a `BatchedTaskSampler`), which
+    `ObservationBatcher` batches without splitting them into one observation
+    per sampler.
+
+    As a sequence, its entries are the observations of the individual samplers
+    (views into the stacked arrays), or `None` for samplers without an
+    observation.
+
+    # Attributes
+
+    stacked : (Possibly nested) dictionary of arrays (or tensors) of shape
+        `[samplers, ...]`.
+    present : Boolean array of shape `[samplers]`, `False` for samplers
+        without an observation (e.g. whose task sampler ran out of tasks),
+        whose entries in `stacked` are meaningless.
+    """
+
+    def __init__(self, stacked: Dict[str, Any], present: Optional[Any] = None):
+        self.stacked = stacked
+        if present is None:
+            leaf: Any = stacked
+            while isinstance(leaf, Dict):
+                leaf = next(iter(leaf.values()))
+            present = np.ones(len(leaf), dtype=np.bool_)
+        self.present: np.ndarray = np.asarray(present, dtype=np.bool_)
+
+    def __len__(self) -> int:
+        return len(self.present)
+
+    def __getitem__(self, index: int) -> Optional[Dict[str, Any]]:  # type:ignore
+        if not self.present[index]:
+            return None
+        return _map_tree(lambda v: v[index], self.stacked)
+
+    @property
+    def num_missing(self) -> int:
+        """Number of samplers without an observation."""
+        return len(self.present) - int(self.present.sum())
+
+    def select(self, indices: Sequence[int]) -> "StackedObservations":
+        """The (copied) observations of the samplers at `indices`."""
+        indices = list(indices)
+        return StackedObservations(
+            stacked=_map_tree(lambda v: v[indices], self.stacked),
+            present=self.present[indices],
+        )
+
+    @classmethod
+    def concatenate(
+        cls, parts: Sequence["StackedObservations"]
+    ) -> "StackedObservations":
+        """The observations of the samplers of all `parts` (in order)."""
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            stacked=_concatenate_trees([p.stacked for p in parts]),
+            present=np.concatenate([p.present for p in parts]),
+        )
+
+
+class StackedStepResults(Sequence[RLStepResult]):
+    """Step results of several samplers with stacked observations, rewards and
+    dones (as sent for the environments of a `BatchedTaskSampler`), so that
+    they can be batched without splitting them into one `RLStepResult` per
+    sampler.
+
+    As a sequence, its entries are the `RLStepResult`s of the individual
+    samplers.
+
+    # Attributes
+
+    observations : The stacked observations.
+    rewards : Array of shape `[samplers]`.
+    dones : Boolean array of shape `[samplers]`.
+    infos : One info dictionary per sampler.
+    """
+
+    def __init__(
+        self,
+        observations: StackedObservations,
+        rewards: Any,
+        dones: Any,
+        infos: List[Dict[str, Any]],
+    ):
+        self.observations = observations
+        self.rewards: np.ndarray = np.asarray(rewards)
+        self.dones: np.ndarray = np.asarray(dones, dtype=np.bool_)
+        self.infos = infos
+
+    def __len__(self) -> int:
+        return len(self.infos)
+
+    def __getitem__(self, index: int) -> RLStepResult:  # type:ignore
+        return RLStepResult(
+            observation=self.observations[index],
+            reward=self.rewards[index].tolist(),
+            done=bool(self.dones[index]),
+            info=self.infos[index],
+        )
+
+    def select(self, indices: Sequence[int]) -> "StackedStepResults":
+        """The (copied) step results of the samplers at `indices`."""
+        indices = list(indices)
+        return StackedStepResults(
+            observations=self.observations.select(indices),
+            rewards=self.rewards[indices],
+            dones=self.dones[indices],
+            infos=[self.infos[i] for i in indices],
+        )
+
+    @classmethod
+    def concatenate(cls, parts: Sequence["StackedStepResults"]) -> "StackedStepResults":
+        """The step results of the samplers of all `parts` (in order)."""
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            observations=StackedObservations.concatenate(
+                [p.observations for p in parts]
+            ),
+            rewards=np.concatenate([p.rewards for p in parts]),
+            dones=np.concatenate([p.dones for p in parts]),
+            infos=[info for p in parts for info in p.infos],
+        )
+
+
 class ActorCriticOutput(tuple, typing.Generic[DistributionType]):
     distributions: DistributionType
     values: torch.FloatTensor
@@ -15,7 +15,7 @@ import numpy as np
 from gym.spaces.dict import Dict as SpaceDict
 import torch
 
-from allenact.base_abstractions.misc import RLStepResult
+from allenact.base_abstractions.misc import RLStepResult, BatchedStepResult
 from allenact.base_abstractions.sensor import Sensor, SensorSuite
 
 EnvType = TypeVar("EnvType")
@@ -358,3 +358,129 @@ class TaskSampler(abc.ABC):
         seed : New seed.
         """
         raise NotImplementedError()
+
+    def get_state(self) -> Optional[Any]:
+        """Gets the (picklable) state determining the next tasks to be sampled
+        (e.g. the RNG state), if supported.
+
+        Used to migrate task samplers between processes (see
+        `VectorSampledTasks.rebalance`): a sampler created with the same
+        arguments and given this state with `set_state` continues sampling
+        tasks where this sampler left off.
+
+        # Returns
+
+        The state or `None` if not supported (the default).
+        """
+        return None
+
+    def set_state(self, state: Any) -> None:
+        """Sets the state returned by `get_state` (of a sampler created with
+        the same arguments).
+
+        # Parameters
+
+        state : The state.
+        """
+        raise NotImplementedError()
+
+
+class BatchedTaskSampler(abc.ABC):
+    """Abstract class for task samplers owning several environments which are
+    stepped together (with vectorized operations, e.g. a batch of numpy grid
+    worlds) rather than one `Task` at a time.
+
+    A batched task sampler is created from a list of task sampler arguments
+    (one per environment, as returned by e.g.
+    `ExperimentConfig.train_task_sampler_args`) and stands for as many task
+    samplers in `VectorSampledTasks`. Tasks are automatically resampled when
+    done, environments for which no new task can be sampled are reported
+    through `has_task` and must ignore any actions from then on (they are no
+    longer stepped once their samplers are paused).
+    """
+
+    @property
+    @abstractmethod
+    def num_envs(self) -> int:
+        """Number of environments."""
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def observation_space(self) -> gym.Space:
+        """Observation space of a single environment."""
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def action_space(self) -> gym.Space:
+        """Action space of a single environment."""
+        raise NotImplementedError()
+
+    @property
+    def has_task(self) -> np.ndarray:
+        """Boolean array of shape `[num_envs]`, `False` for environments whose
+        last task is done and for which no new task could be sampled."""
+        return np.ones(self.num_envs, dtype=np.bool_)
+
+    @property
+    def length(self) -> Union[int, float, np.ndarray]:
+        """Number of total tasks remaining that can be sampled (for all
+        environments or as an array of shape `[num_envs]`), can be
+        float('inf')."""
+        return float("inf")
+
+    @abstractmethod
+    def get_observations(self) -> Any:
+        """Current observations of all environments (stacked as in
+        `BatchedStepResult.observations`)."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def step(
+        self, actions: np.ndarray, env_indices: Optional[Sequence[int]] = None
+    ) -> BatchedStepResult:
+        """Takes one step in the given environments, the others (e.g. those of
+        paused samplers) are left untouched.
+
+        # Parameters
+
+        actions : Array of shape `[len(env_indices), ...]` with one action (from
+            `action_space`) per stepped environment.
+        env_indices : Indices of the environments to step (in increasing
+            order), all environments if `None`.
+
+        # Returns
+
+        The results of the stepped environments (in the order of
+        `env_indices`).
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def next_task(
+        self, env_indices: Sequence[int], force_advance_scene: bool = False
+    ) -> None:
+        """Abandons the current tasks of the given environments and samples
+        new ones (see `TaskSampler.next_task`)."""
+        raise NotImplementedError()
+
+    def render(self, env_index: int, mode: str = "rgb", *args, **kwargs) -> np.ndarray:
+        """Renders the given environment."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Resets the sampler (and the tasks of all environments) to its
+        original state (except for any seed)."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def set_seeds(self, env_indices: Sequence[int], seeds: Sequence[int]) -> None:
+        """Sets new RNG seeds for the given environments."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def close(self) -> None:
+        """Closes all environments."""
+        raise NotImplementedError()
@@ -491,11 +491,17 @@ class RNNStateEncoder(nn.Module):
         x: torch.FloatTensor,
         hidden_states: torch.FloatTensor,
         masks: torch.FloatTensor,
+        episode_starts: Optional[torch.Tensor] = None,
     ) -> Tuple[
         torch.FloatTensor, Union[torch.FloatTensor, Tuple[torch.FloatTensor, ...]]
     ]:
         """Forward for a sequence of length T.
 
+        If no episode starts after the first step, the whole sequence is
+        processed with a single call to the RNN. Otherwise the sequence of
+        every sampler is split into its episodes, which are processed
+        together (still with a single call) as a packed sequence.
+
         # Parameters
 
         x : (Steps, Samplers, Agents, -1) tensor.
@@ -503,6 +509,9 @@ class RNNStateEncoder(nn.Module):
         masks : A (Steps, Samplers, Agents) tensor.
             The masks to be applied to hidden state at every timestep, equal to 0 whenever the previous step finalized
             the task, 1 elsewhere.
+        episode_starts : Optional boolean (Steps, Samplers) CPU tensor equal to `masks == 0` (e.g. as given by
+            `RolloutStorage.episode_starts`). If `None`, it is computed from `masks`, which requires copying the
+            masks to the CPU.
         """
         (
             x,
@@ -515,41 +524,41 @@ class RNNStateEncoder(nn.Module):
             nagents,
         ) = self.adapt_input(x, hidden_states, masks)
 
-        # steps in sequence which have zero for any episode. Assume t=0 has
-        # a zero in it.
-        has_zeros = (masks[1:] == 0.0).any(dim=-1).nonzero().squeeze().cpu()
-        # +1 to correct the masks[1:]
-        if has_zeros.dim() == 0:
-            # handle scalar
-            has_zeros = [has_zeros.item() + 1]  # type: ignore
+        if episode_starts is None:
+            episode_starts = (masks == 0.0).cpu()
         else:
-            has_zeros = (has_zeros + 1).numpy().tolist()
-        # add t=0 and t=T to the list
-        has_zeros = cast(List[int], [0] + has_zeros + [nsteps])
+            episode_starts = episode_starts.view(nsteps, nsamplers, 1).expand(
+                -1, -1, nagents
+            )
+        episode_starts = episode_starts.reshape(nsteps, nsamplers * nagents)
 
         unpacked_hidden_states = self._unpack_hidden(
             cast(torch.FloatTensor, hidden_states)
         )
 
-        outputs = []
-        for i in range(len(has_zeros) - 1):
-            # process steps that don't have any zeros in masks together
-            start_idx = int(has_zeros[i])
-            end_idx = int(has_zeros[i + 1])
+        # Episodes starting after the first step split the sequence of their sampler
+        split_steps, split_samplers = episode_starts[1:].nonzero(as_tuple=True)
 
+        if len(split_steps) == 0:
             # noinspection PyTypeChecker
-            rnn_scores, unpacked_hidden_states = self.rnn(
-                x[start_idx:end_idx],
+            outputs, unpacked_hidden_states = self.rnn(
+                x,
                 self._mask_hidden(
                     unpacked_hidden_states,
-                    cast(torch.FloatTensor, masks[start_idx].view(1, -1, 1)),
+                    cast(torch.FloatTensor, masks[0].view(1, -1, 1)),
                 ),
             )
-
-            outputs.append(rnn_scores)
+        else:
+            outputs, unpacked_hidden_states = self._packed_seq_forward(
+                x,
+                unpacked_hidden_states,
+                masks,
+                split_steps.numpy() + 1,
+                split_samplers.numpy(),
+            )
 
         return self.adapt_result(
-            cast(torch.FloatTensor, torch.cat(outputs, dim=0)),
+            cast(torch.FloatTensor, outputs),
             self._pack_hidden(unpacked_hidden_states),
             mem_agent,
             obs_agent,
@@ -558,18 +567,105 @@ class RNNStateEncoder(nn.Module):
             nagents,
         )
 
+    def _packed_seq_forward(
+        self,
+        x: torch.FloatTensor,
+        unpacked_hidden_states: Union[torch.FloatTensor, Tuple[torch.FloatTensor, ...]],
+        masks: torch.FloatTensor,
+        split_steps: np.ndarray,
+        split_samplers: np.ndarray,
+    ) -> Tuple[
+        torch.FloatTensor, Union[torch.FloatTensor, Tuple[torch.FloatTensor, ...]]
+    ]:
+        """Runs the RNN over every episode segment of the (adapted) input
+        sequence with a single call, by packing the segments of all samplers
+        into a `PackedSequence`.
+
+        # Parameters
+
+        x : (Steps, Samplers, -1) tensor.
+        unpacked_hidden_states : The starting hidden states.
+        masks : (Steps, Samplers) tensor.
+        split_steps : Steps (after the first one) at which an episode starts.
+        split_samplers : Samplers corresponding to `split_steps`.
+
+        # Returns
+
+        The (Steps, Samplers, -1) outputs and the final hidden states.
+        """
+        nsteps, nsamplers = masks.shape[:2]
+        device = x.device
+
+        # Segments sorted by sampler and then by start step
+        is_start = np.zeros((nsamplers, nsteps), dtype=np.bool_)
+        is_start[:, 0] = True
+        is_start[split_samplers, split_steps] = True
+        seg_samplers, seg_starts = np.nonzero(is_start)
+        is_last = np.append(seg_samplers[1:] != seg_samplers[:-1], True)
+        seg_ends = np.append(seg_starts[1:], nsteps)
+        seg_ends[is_last] = nsteps
+        lengths = seg_ends - seg_starts
+        nsegs, max_length = len(lengths), int(lengths.max())
+
+        # Gather the (zero-padded) inputs of each segment, [max_length, nsegs, -1]
+        offsets = np.arange(max_length).reshape(-1, 1)
+        steps = np.minimum(seg_starts.reshape(1, -1) + offsets, nsteps - 1)
+        gather_inds = torch.from_numpy(steps * nsamplers + seg_samplers).to(device)
+        padded_x = x.reshape(nsteps * nsamplers, -1)[gather_inds]
+
+        seg_samplers_device = torch.from_numpy(seg_samplers).to(device)
+        seg_masks = masks[torch.from_numpy(seg_starts).to(device), seg_samplers_device]
+        if isinstance(unpacked_hidden_states, tuple):
+            initial_hidden_states = tuple(
+                v[:, seg_samplers_device] for v in unpacked_hidden_states
+            )
+        else:
+            initial_hidden_states = unpacked_hidden_states[:, seg_samplers_device]
+
+        packed_outputs, final_hidden_states = self.rnn(
+            nn.utils.rnn.pack_padded_sequence(
+                padded_x, torch.from_numpy(lengths), enforce_sorted=False
+            ),
+            self._mask_hidden(
+                initial_hidden_states, cast(torch.FloatTensor, seg_masks.view(1, -1, 1))
+            ),
+        )
+        padded_outputs, _ = nn.utils.rnn.pad_packed_sequence(
+            packed_outputs, total_length=max_length
+        )
+
+        # Scatter the outputs of every segment back to their (step, sampler)
+        positions = np.empty((nsteps, nsamplers), dtype=np.int64)
+        valid_offsets, valid_segs = np.nonzero(offsets < lengths.reshape(1, -1))
+        positions[seg_starts[valid_segs] + valid_offsets, seg_samplers[valid_segs]] = (
+            valid_offsets * nsegs + valid_segs
+        )
+        outputs = padded_outputs.reshape(max_length * nsegs, -1)[
+            torch.from_numpy(positions).to(device)
+        ]
+
+        # The final hidden state of each sampler is that of its last segment
+        last_segs = torch.from_numpy(np.nonzero(is_last)[0]).to(device)
+        if isinstance(final_hidden_states, tuple):
+            final_hidden_states = tuple(v[:, last_segs] for v in final_hidden_states)
+        else:
+            final_hidden_states = final_hidden_states[:, last_segs]
+
+        return cast(torch.FloatTensor, outputs), final_hidden_states
+
     def forward(  # type: ignore
         self,
         x: torch.FloatTensor,
         hidden_states: torch.FloatTensor,
         masks: torch.FloatTensor,
+        episode_starts: Optional[torch.Tensor] = None,
     ) -> Tuple[
         torch.FloatTensor, Union[torch.FloatTensor, Tuple[torch.FloatTensor, ...]]
     ]:
         nsteps = masks.shape[0]
         if nsteps == 1:
             return self.single_forward(x, hidden_states, masks)
-        return self.seq_forward(x, hidden_states, masks)
+        return self.seq_forward(x, hidden_states, masks, episode_starts)
 
 
 class LinearActorCritic(ActorCriticModel[CategoricalDistr]):
@@ -699,11 +795,13 @@ class RNNActorCritic(ActorCriticModel[CategoricalDistr]):
         memory: Memory,
         prev_actions: torch.Tensor,
         masks: torch.FloatTensor,
+        episode_starts: Optional[torch.Tensor] = None,
     ) -> Tuple[ActorCriticOutput[DistributionType], Optional[Memory]]:
         rnn_out, mem_return = self.state_encoder(
             x=observations[self.input_uuid],
             hidden_states=memory.tensor(self.memory_key),
             masks=masks,
+            episode_starts=episode_starts,
         )
 
         # noinspection PyCallingNonCallable
@@ -168,6 +168,56 @@ def get_args():
     )
     parser.set_defaults(disable_config_saving=False)
 
+    parser.add_argument(
+        "--node_rank",
+        type=int,
+        default=int(os.environ.get("NODE_RANK", 0)),
+        required=False,
+        help="rank of this node for multi-node training (defaults to the NODE_RANK"
+        " environment variable, or 0). Only node 0 saves checkpoints and logs.",
+    )
+
+    parser.add_argument(
+        "--num_nodes",
+        type=int,
+        default=int(os.environ.get("NUM_NODES", 1)),
+        required=False,
+        help="number of nodes for multi-node training (defaults to the NUM_NODES"
+        " environment variable, or 1). Training must be started on every node, with"
+        " the same config and seed.",
+    )
+
+    parser.add_argument(
+        "--master_address",
+        type=str,
+        default=os.environ.get("MASTER_ADDR", "127.0.0.1"),
+        required=False,
+        help="address of node 0 for multi-node training (defaults to the MASTER_ADDR"
+        " environment variable, or 127.0.0.1).",
+    )
+
+    parser.add_argument(
+        "--master_port",
+        type=int,
+        default=int(os.environ["MASTER_PORT"]) if "MASTER_PORT" in os.environ else None,
+        required=False,
+        help="free port of node 0 for multi-node training (defaults to the"
+        " MASTER_PORT environment variable, required with multiple nodes).",
+    )
+
+    parser.add_argument(
+        "--trainers_per_node",
+        type=int,
+        nargs="+",
+        default=[int(n) for n in os.environ["TRAINERS_PER_NODE"].split(",")]
+        if "TRAINERS_PER_NODE" in os.environ
+        else None,
+        required=False,
+        help="number of the experiment's train workers (with their devices given by"
+        " the machine params of all nodes together) run by each node (defaults to the"
+        " comma-separated TRAINERS_PER_NODE environment variable, or an even split).",
+    )
+
     parser.add_argument(
         "--version", action="version", version=f"allenact {__version__}"
     )
@@ -290,6 +340,11 @@ def main():
             checkpoint=args.checkpoint,
             restart_pipeline=args.restart_pipeline,
             max_sampler_processes_per_worker=args.max_sampler_processes_per_worker,
+            node_rank=args.node_rank,
+            num_nodes=args.num_nodes,
+            master_address=args.master_address,
+            master_port=args.master_port,
+            trainers_per_node=args.trainers_per_node,
         )
     else:
         OnPolicyRunner(
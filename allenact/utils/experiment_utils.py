@@ -27,6 +27,7 @@ from allenact.algorithms.offpolicy_sync.losses.abstract_offpolicy_loss import (
     AbstractOffPolicyLoss,
     Memory,
 )
+from allenact.algorithms.onpolicy_sync.grad_compression import GradientCompressor
 from allenact.algorithms.onpolicy_sync.losses.abstract_loss import (
     AbstractActorCriticLoss,
 )
@@ -238,6 +239,8 @@ class LoggingPackage(object):
 
         self.metrics_tracker = ScalarMeanTracker()
         self.train_info_tracker = ScalarMeanTracker()
+        # Histograms (bin edges and counts per bin) by name
+        self.histograms: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
         self.metric_dicts: List[Any] = []
         self.viz_data: Optional[Dict[str, List[Dict[str, Any]]]] = None
         self.checkpoint_file_name: Optional[str] = None
@@ -283,6 +286,13 @@ class LoggingPackage(object):
         assert n >= 0
         self.train_info_tracker.add_scalars(scalars=train_info_dict, n=n)
 
+    def add_histogram(self, name: str, bin_edges: np.ndarray, counts: np.ndarray):
+        """Adds the counts (per bin, with the given `bin_edges`) to the
+        histogram `name`."""
+        if name in self.histograms:
+            counts = self.histograms[name][1] + counts
+        self.histograms[name] = (bin_edges, counts)
+
 
 class LinearDecay(object):
     """Linearly decay between two values over some number of steps.
@@ -433,6 +443,9 @@ class PipelineStage(object):
         as `loss_name`. If this is `None`, all weights will be assumed to be one.
     teacher_forcing : If applicable, defines the probability an agent will take the
         expert action (as opposed to its own sampled action) at a given time point.
+    gradient_compressor : Optional compression (or builder of it) of the gradients
+        all-reduced in distributed training during this stage, overriding that of
+        the `TrainingPipeline`.
     """
 
     def __init__(
@@ -442,6 +455,9 @@ class PipelineStage(object):
         loss_weights: Optional[typing.Sequence[float]] = None,
         teacher_forcing: Optional[LinearDecay] = None,
         offpolicy_component: Optional[OffPolicyPipelineComponent] = None,
+        gradient_compressor: Optional[
+            Union[GradientCompressor, Builder[GradientCompressor]]
+        ] = None,
     ):
         self.loss_names = loss_names
         self.max_stage_steps = max_stage_steps
@@ -457,6 +473,7 @@ class PipelineStage(object):
         self.loss_weights = loss_weights
         self.teacher_forcing = teacher_forcing
         self.offpolicy_component = offpolicy_component
+        self.gradient_compressor = gradient_compressor
 
         self.steps_taken_in_stage: int = 0
         self.rollout_count = 0
@@ -522,7 +539,19 @@ class TrainingPipeline(object):
     pipeline_stages : A list of PipelineStages. Each of these define how the agent
         will be trained and are executed sequentially.
     optimizer_builder : Builder object to instantiate the optimizer to use during training.
-    num_mini_batch : The number of mini-batches to break a rollout into.
+    num_mini_batch : The number of mini-batches to break a rollout into. Rollouts of
+        memoryless models are split into shuffled transitions (see
+        `RolloutStorage.feed_forward_generator`), otherwise into groups of samplers.
+    shuffle_minibatch_samplers : Whether samplers are randomly assigned to mini-batches
+        (rather than split into contiguous ranges of samplers).
+    zero_copy_minibatches : Whether mini-batches of (contiguous ranges of) samplers are
+        views into the rollout storage rather than contiguous copies, see
+        `RolloutStorage.recurrent_generator`.
+    recurrent_chunk_length : If not `None`, the rollouts of recurrent models are split
+        into chunks of `recurrent_chunk_length` steps (starting from the memory stored
+        at their first step) which are shuffled across samplers into mini-batches
+        (i.e. truncated backpropagation through time), see
+        `RolloutStorage.chunked_recurrent_generator`.
     update_repeats : The number of times we will cycle through the mini-batches corresponding
         to a single rollout doing gradient updates.
     max_grad_norm : The maximum "inf" norm of any gradient step (gradients are clipped to not exceed this).
@@ -541,6 +570,14 @@ class TrainingPipeline(object):
         as to a tensorboard file.
     lr_scheduler_builder : Optional builder object to instantiate the learning rate scheduler used
         through the pipeline.
+    gradient_compressor : Optional compression (or builder of it) of the gradients all-reduced
+        in distributed training (see `allenact.algorithms.onpolicy_sync.grad_compression`),
+        used in all stages not defining their own.
+    vtrace_rho_clip : Truncation of the importance weights of the V-trace targets and
+        advantages (see `allenact.algorithms.onpolicy_sync.returns.compute_vtrace`)
+        computed when rollouts are collected asynchronously (see
+        `MachineParams.async_rollouts`).
+    vtrace_c_clip : Truncation of the importance weights of the V-trace traces.
     """
 
     # noinspection PyUnresolvedReferences
@@ -561,6 +598,14 @@ class TrainingPipeline(object):
         metric_accumulate_interval: int,
         should_log: bool = True,
         lr_scheduler_builder: Optional[Builder[optim.lr_scheduler._LRScheduler]] = None,  # type: ignore
+        shuffle_minibatch_samplers: bool = False,
+        zero_copy_minibatches: bool = False,
+        recurrent_chunk_length: Optional[int] = None,
+        gradient_compressor: Optional[
+            Union[GradientCompressor, Builder[GradientCompressor]]
+        ] = None,
+        vtrace_rho_clip: float = 1.0,
+        vtrace_c_clip: float = 1.0,
     ):
         """Initializer.
 
@@ -572,6 +617,10 @@ class TrainingPipeline(object):
         self.optimizer_builder = optimizer_builder
         self.lr_scheduler_builder = lr_scheduler_builder
         self.num_mini_batch = num_mini_batch
+        self.shuffle_minibatch_samplers = shuffle_minibatch_samplers
+        self.zero_copy_minibatches = zero_copy_minibatches
+        self.recurrent_chunk_length = recurrent_chunk_length
+        self.gradient_compressor = gradient_compressor
 
         self.update_repeats = update_repeats
         self.max_grad_norm = max_grad_norm
@@ -580,6 +629,8 @@ class TrainingPipeline(object):
         self.gamma = gamma
         self.use_gae = use_gae
         self.gae_lambda = gae_lambda
+        self.vtrace_rho_clip = vtrace_rho_clip
+        self.vtrace_c_clip = vtrace_c_clip
         self.advance_scene_rollout_period = advance_scene_rollout_period
         self.should_log = should_log
 
@@ -700,6 +751,19 @@ class TrainingPipeline(object):
 
         return self.current_stage.named_losses
 
+    @property
+    def current_stage_gradient_compressor(self) -> Optional[GradientCompressor]:
+        """The gradient compressor of the current stage (that of the pipeline if
+        the stage does not define one)."""
+        owner = (
+            self.current_stage
+            if self.current_stage.gradient_compressor is not None
+            else self
+        )
+        if isinstance(owner.gradient_compressor, Builder):
+            owner.gradient_compressor = owner.gradient_compressor()
+        return owner.gradient_compressor
+
     @property
     def current_stage_offpolicy_losses(self) -> Dict[str, AbstractOffPolicyLoss]:
         if self.current_stage.offpolicy_named_losses is None:
@@ -0,0 +1,165 @@
+"""Profiler timing named phases (spans) of the training loop."""
+
+import os
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import torch
+
+from allenact.utils.system import get_logger
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, profiler: "PhaseProfiler", name: str):
+        self.profiler = profiler
+        self.name = name
+        self._record_function = None
+        self._start_time = 0.0
+
+    def __enter__(self):
+        if self.profiler.is_tracing:
+            self._record_function = torch.autograd.profiler.record_function(
+                self.name
+            )
+            self._record_function.__enter__()
+        self.profiler.synchronize_device()
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.synchronize_device()
+        self.profiler.add(self.name, time.perf_counter() - self._start_time)
+        if self._record_function is not None:
+            self._record_function.__exit__(exc_type, exc_val, exc_tb)
+        return False
+
+
+class PhaseProfiler(object):
+    """Times named phases of the training loop.
+
+    Phases are timed with `with profiler.span(name): ...` (spans can be
+    nested, each span is timed separately). If the profiler is disabled,
+    `span` returns a shared no-op context manager.
+
+    Profilers are not thread-safe, phases timed in other threads should use
+    their own profilers, whose timings can be merged (see `merge`).
+
+    # Attributes
+
+    enabled : Whether spans are timed.
+    synchronize : Whether to synchronize `device` (if it is a CUDA device)
+        when entering and exiting spans, so that the time of asynchronous
+        CUDA kernels is attributed to the span launching them (this slows
+        down training).
+    device : The device to synchronize.
+    trace_rollouts : Optional `(first_rollout, num_rollouts)` pair, an
+        autograd profiler trace (including all spans) of rollouts `first_rollout`
+        to `first_rollout + num_rollouts - 1` is then saved (in chrome trace
+        format) to `trace_path`.
+    trace_path : Where to save the trace.
+    totals : Mapping from span name to its total time (in seconds) and number
+        of calls since the last call to `pop`.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        synchronize: bool = False,
+        device: Union[str, torch.device, None] = None,
+        trace_rollouts: Optional[Tuple[int, int]] = None,
+        trace_path: Optional[str] = None,
+    ):
+        self.enabled = enabled
+        self.synchronize = synchronize
+        self.device = torch.device("cpu") if device is None else torch.device(device)
+        self._synchronize_cuda = (
+            self.enabled and self.synchronize and self.device.type == "cuda"
+        )
+
+        assert (
+            trace_rollouts is None or trace_path is not None
+        ), "A `trace_path` is required to save traces."
+        self.trace_rollouts = trace_rollouts
+        self.trace_path = trace_path
+        self._trace: Optional[torch.autograd.profiler.profile] = None
+
+        self.totals: Dict[str, List] = {}
+
+    @property
+    def is_tracing(self) -> bool:
+        return self._trace is not None
+
+    def synchronize_device(self) -> None:
+        if self._synchronize_cuda:
+            torch.cuda.synchronize(self.device)
+
+    def span(self, name: str):
+        """Context manager timing the enclosed code as phase `name`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def add(self, name: str, seconds: float) -> None:
+        total = self.totals.get(name)
+        if total is None:
+            self.totals[name] = [seconds, 1]
+        else:
+            total[0] += seconds
+            total[1] += 1
+
+    def pop(self) -> Dict[str, Tuple[float, int]]:
+        """Returns the (mean time, count) pair of every span and resets the
+        timings."""
+        result = {
+            name: (total[0] / total[1], total[1])
+            for name, total in self.totals.items()
+        }
+        self.totals = {}
+        return result
+
+    def merge(self, timings: Dict[str, Tuple[float, int]]) -> None:
+        """Adds timings (as returned by `pop`, e.g. of another profiler) to
+        those of this profiler."""
+        for name, (mean_time, count) in timings.items():
+            total = self.totals.setdefault(name, [0.0, 0])
+            total[0] += mean_time * count
+            total[1] += count
+
+    def before_rollout(self, rollout_count: int) -> None:
+        """Starts or stops the trace, must be called before collecting each
+        rollout with the number of rollouts collected so far."""
+        if self.trace_rollouts is None:
+            return
+
+        first_rollout, num_rollouts = self.trace_rollouts
+        if rollout_count == first_rollout and self._trace is None:
+            self._trace = torch.autograd.profiler.profile(
+                use_cuda=self.device.type == "cuda"
+            )
+            self._trace.__enter__()
+        elif rollout_count == first_rollout + num_rollouts:
+            self.close()
+
+    def close(self) -> None:
+        """Stops and saves the trace (if any)."""
+        if self._trace is None:
+            return
+
+        self._trace.__exit__(None, None, None)
+        trace_dir = os.path.dirname(self.trace_path)
+        if trace_dir != "":
+            os.makedirs(trace_dir, exist_ok=True)
+        self._trace.export_chrome_trace(self.trace_path)
+        get_logger().info("Saved profiler trace to {}".format(self.trace_path))
+        self._trace = None
@@ -3,7 +3,17 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from typing import Union, Tuple, List, cast, Iterable
+from typing import (
+    Union,
+    Tuple,
+    List,
+    cast,
+    Iterable,
+    Any,
+    Callable,
+    Dict,
+    Sequence,
+)
 from collections import OrderedDict
 
 import numpy as np
@@ -39,62 +49,12 @@ def flatdim(space):
 
 def flatten(space, torch_x):
     """Flatten data points from a space."""
-    if isinstance(space, gym.Box):
-        if len(space.shape) > 0:
-            return torch_x.view(torch_x.shape[: -len(space.shape)] + (-1,))
-        else:
-            return torch_x.view(torch_x.shape + (-1,))
-    elif isinstance(space, gym.Discrete):
-        # Assume tensor input does NOT contain a dimension for action
-        if isinstance(torch_x, torch.Tensor):
-            return torch_x.unsqueeze(-1)
-        else:
-            return torch.tensor(torch_x).view(1)
-    elif isinstance(space, gym.Tuple):
-        return torch.cat(
-            [flatten(s, x_part) for x_part, s in zip(torch_x, space.spaces)], dim=-1
-        )
-    elif isinstance(space, gym.Dict):
-        return torch.cat(
-            [flatten(s, torch_x[key]) for key, s in space.spaces.items()], dim=-1
-        )
-    elif isinstance(space, gym.MultiBinary):
-        return torch_x.view(torch_x.shape[: -len(space.shape)] + (-1,))
-    elif isinstance(space, gym.MultiDiscrete):
-        return torch_x.view(torch_x.shape[: -len(space.shape)] + (-1,))
-    else:
-        raise NotImplementedError
+    return space_spec(space).flatten(torch_x)
 
 
 def unflatten(space, torch_x):
     """Unflatten a concatenated data points tensor from a space."""
-    if isinstance(space, gym.Box):
-        return torch_x.view(torch_x.shape[:-1] + space.shape).float()
-    elif isinstance(space, gym.Discrete):
-        res = torch_x.view(torch_x.shape[:-1] + space.shape).long()
-        return res if len(res.shape) > 0 else res.item()
-    elif isinstance(space, gym.Tuple):
-        dims = [flatdim(s) for s in space.spaces]
-        list_flattened = torch.split(torch_x, dims, dim=-1)
-        list_unflattened = [
-            unflatten(s, flattened)
-            for flattened, s in zip(list_flattened, space.spaces)
-        ]
-        return tuple(list_unflattened)
-    elif isinstance(space, gym.Dict):
-        dims = [flatdim(s) for s in space.spaces.values()]
-        list_flattened = torch.split(torch_x, dims, dim=-1)
-        list_unflattened = [
-            (key, unflatten(s, flattened))
-            for flattened, (key, s) in zip(list_flattened, space.spaces.items())
-        ]
-        return OrderedDict(list_unflattened)
-    elif isinstance(space, gym.MultiBinary):
-        return torch_x.view(torch_x.shape[:-1] + space.shape).byte()
-    elif isinstance(space, gym.MultiDiscrete):
-        return torch_x.view(torch_x.shape[:-1] + space.shape).long()
-    else:
-        raise NotImplementedError
+    return space_spec(space).unflatten(torch_x)
 
 
 def torch_point(space, np_x):
@@ -178,17 +138,249 @@ def action_list(
 
     Assumes `flat_actions` are of shape `[step, sampler, flatdim]`.
     """
+    return space_spec(action_space).action_list(flat_actions)
+
+
+def _flat_view(shape: Tuple[int, ...]) -> Callable[[torch.Tensor], torch.Tensor]:
+    if len(shape) > 0:
+        ndims = len(shape)
+        return lambda x: x.view(x.shape[:-ndims] + (-1,))
+    return lambda x: x.view(x.shape + (-1,))
+
+
+class SpaceSpec(object):
+    """Conversions between points of a gym space and their flattened tensors
+    (`flatten`, `unflatten` and `action_list`), compiled once for the space
+    so that converting points only calls one precomputed function per leaf
+    space (without walking the space).
+
+    Use `space_spec` to get the (cached) spec of a space.
+
+    # Attributes
+
+    space : The gym space.
+    flatdim : The size of flattened points (see `flatdim`).
+    """
+
+    def __init__(self, space: gym.Space):
+        self.space = space
+        self.flatdim = flatdim(space)
+        self._flatten = self._compile_flatten(space)
+        self._unflatten = self._compile_unflatten(space)
+        self._batch_tolist = self._compile_batch_tolist(space)
+
+    @staticmethod
+    def _compile_flatten(space: gym.Space) -> Callable[[Any], torch.Tensor]:
+        if isinstance(space, (gym.Box, gym.MultiBinary, gym.MultiDiscrete)):
+            return _flat_view(space.shape)
+        elif isinstance(space, gym.Discrete):
+            # Assume tensor input does NOT contain a dimension for action
+            return lambda x: (
+                x.unsqueeze(-1)
+                if isinstance(x, torch.Tensor)
+                else torch.tensor(x).view(1)
+            )
+        elif isinstance(space, gym.Tuple):
+            parts = [SpaceSpec._compile_flatten(s) for s in space.spaces]
+            return lambda x: torch.cat([f(xp) for f, xp in zip(parts, x)], dim=-1)
+        elif isinstance(space, gym.Dict):
+            items = [
+                (key, SpaceSpec._compile_flatten(s)) for key, s in space.spaces.items()
+            ]
+            return lambda x: torch.cat([f(x[key]) for key, f in items], dim=-1)
+        else:
+            raise NotImplementedError
+
+    @staticmethod
+    def _compile_unflatten(space: gym.Space) -> Callable[[torch.Tensor], Any]:
+        if isinstance(space, gym.Box):
+            shape = space.shape
+            return lambda x: x.view(x.shape[:-1] + shape).float()
+        elif isinstance(space, gym.Discrete):
+            shape = space.shape
+
+            def unflatten_discrete(x: torch.Tensor):
+                res = x.view(x.shape[:-1] + shape).long()
+                return res if len(res.shape) > 0 else res.item()
+
+            return unflatten_discrete
+        elif isinstance(space, (gym.Tuple, gym.Dict)):
+            subspaces = (
+                space.spaces
+                if isinstance(space, gym.Tuple)
+                else list(space.spaces.values())
+            )
+            dims = [flatdim(s) for s in subspaces]
+            parts = [SpaceSpec._compile_unflatten(s) for s in subspaces]
+            if isinstance(space, gym.Tuple):
+                return lambda x: tuple(
+                    f(xp) for f, xp in zip(parts, torch.split(x, dims, dim=-1))
+                )
+            keys = list(space.spaces.keys())
+            return lambda x: OrderedDict(
+                (key, f(xp))
+                for key, f, xp in zip(keys, parts, torch.split(x, dims, dim=-1))
+            )
+        elif isinstance(space, gym.MultiBinary):
+            shape = space.shape
+            return lambda x: x.view(x.shape[:-1] + shape).byte()
+        elif isinstance(space, gym.MultiDiscrete):
+            shape = space.shape
+            return lambda x: x.view(x.shape[:-1] + shape).long()
+        else:
+            raise NotImplementedError
+
+    @staticmethod
+    def _compile_batch_tolist(space: gym.Space) -> Callable[[torch.Tensor], List]:
+        """Compiles the conversion of a `[sampler, flatdim]` tensor to the list
+        (over samplers) of unflattened points with tensors converted to
+        (nested) lists of Python numbers."""
+        if isinstance(space, (gym.Tuple, gym.Dict)):
+            subspaces = (
+                space.spaces
+                if isinstance(space, gym.Tuple)
+                else list(space.spaces.values())
+            )
+            dims = [flatdim(s) for s in subspaces]
+            parts = [SpaceSpec._compile_batch_tolist(s) for s in subspaces]
+
+            def part_lists(x: torch.Tensor) -> List[List]:
+                return [f(xp) for f, xp in zip(parts, torch.split(x, dims, dim=-1))]
+
+            if isinstance(space, gym.Tuple):
+                return lambda x: [tuple(point) for point in zip(*part_lists(x))]
+            keys = list(space.spaces.keys())
+            return lambda x: [
+                OrderedDict(zip(keys, point)) for point in zip(*part_lists(x))
+            ]
+
+        # A leaf space, unflattened for all samplers at once
+        if isinstance(space, gym.Discrete):
+            shape = space.shape
+            return lambda x: x.view(x.shape[:-1] + shape).long().tolist()
+        unflatten_leaf = SpaceSpec._compile_unflatten(space)
+        return lambda x: unflatten_leaf(x).tolist()
+
+    def flatten(self, torch_x: Any) -> torch.Tensor:
+        """Flatten data points from the space (see `flatten`)."""
+        return self._flatten(torch_x)
+
+    def unflatten(self, torch_x: torch.Tensor) -> Any:
+        """Unflatten a concatenated data points tensor from the space (see
+        `unflatten`)."""
+        return self._unflatten(torch_x)
+
+    def action_list(self, flat_actions: torch.Tensor) -> List[ActionType]:
+        """Convert flattened actions of shape `[step, sampler, flatdim]` to a
+        list (see `action_list`)."""
+        return self._batch_tolist(flat_actions[0])
+
+    def batch_action_list(
+        self, flat_actions: Union[np.ndarray, torch.Tensor]
+    ) -> List[ActionType]:
+        """Convert flattened actions of shape `[sampler, flatdim]` (e.g. the
+        rows of the samplers run by one worker process, as sent by
+        `VectorSampledTasks.async_step`) to a list."""
+        if isinstance(flat_actions, np.ndarray):
+            flat_actions = torch.from_numpy(flat_actions)
+        return self._batch_tolist(flat_actions)
+
+
+_SPACE_SPECS: Dict[int, Tuple[gym.Space, SpaceSpec]] = {}
+
+
+def space_spec(space: gym.Space) -> SpaceSpec:
+    """The (cached) `SpaceSpec` of `space`."""
+    cached = _SPACE_SPECS.get(id(space))
+    if cached is None or cached[0] is not space:
+        cached = (space, SpaceSpec(space))
+        _SPACE_SPECS[id(space)] = cached
+    return cached[1]
+
+
+class TreeSpec(object):
+    """The key paths of the leaves of nested dictionaries (e.g. of
+    observations) with a fixed structure, computed once so that such trees
+    can be flattened into (and rebuilt from) lists of leaves without walking
+    them.
+
+    # Attributes
+
+    paths : The key path of every leaf.
+    keys : The top-level keys.
+    """
+
+    def __init__(self, paths: Sequence[Sequence[str]]):
+        self.paths: Tuple[Tuple[str, ...], ...] = tuple(tuple(p) for p in paths)
+        self.keys: Tuple[str, ...] = tuple(
+            OrderedDict.fromkeys(p[0] for p in self.paths)
+        )
+
+    @classmethod
+    def from_tree(cls, tree: Dict[str, Any]) -> "TreeSpec":
+        """The spec of `tree`, whose leaves are its non-dict values."""
+        paths: List[Tuple[str, ...]] = []
+
+        def add_paths(node: Dict[str, Any], prefix: Tuple[str, ...]):
+            for key in node:
+                if isinstance(node[key], Dict):
+                    add_paths(node[key], prefix + (key,))
+                else:
+                    paths.append(prefix + (key,))
+
+        add_paths(tree, ())
+        return cls(paths)
+
+    @classmethod
+    def from_space(cls, space: gym.Dict) -> "TreeSpec":
+        """The spec of the points of `space`, whose leaves are the points of
+        its non-dict subspaces."""
+        paths: List[Tuple[str, ...]] = []
+
+        def add_paths(node: gym.Dict, prefix: Tuple[str, ...]):
+            for key, subspace in node.spaces.items():
+                if isinstance(subspace, gym.Dict):
+                    add_paths(subspace, prefix + (key,))
+                else:
+                    paths.append(prefix + (key,))
+
+        add_paths(space, ())
+        return cls(paths)
+
+    def matches(self, tree: Dict[str, Any]) -> bool:
+        """Cheap check of whether `tree` has (at least at its top level) the
+        structure of the spec."""
+        return len(tree) == len(self.keys) and all(key in tree for key in self.keys)
+
+    def leaves(self, tree: Dict[str, Any]) -> List[Any]:
+        """The leaves of `tree` (in the order of `paths`)."""
+        result = []
+        for path in self.paths:
+            node = tree
+            for key in path:
+                node = node[key]
+            result.append(node)
+        return result
+
+    def unflatten(self, leaves: Sequence[Any]) -> Dict[str, Any]:
+        """The tree with the given leaves (in the order of `paths`)."""
+        tree: Dict[str, Any] = {}
+        for path, leaf in zip(self.paths, leaves):
+            node = tree
+            for key in path[:-1]:
+                child = node.get(key)
+                if child is None:
+                    child = node[key] = {}
+                node = child
+            node[path[-1]] = leaf
+        return tree
+
+    def map(self, fn: Callable[[Any], Any], tree: Dict[str, Any]) -> Dict[str, Any]:
+        """The tree with `fn` applied to every leaf of `tree`."""
+        return self.unflatten([fn(leaf) for leaf in self.leaves(tree)])
 
-    def tolist(action):
-        if isinstance(action, torch.Tensor):
-            return action.tolist()
-        if isinstance(action, Tuple):
-            actions = [tolist(ac) for ac in action]
-            return tuple(actions)
-        if isinstance(action, OrderedDict):
-            actions = [(key, tolist(action[key])) for key in action.keys()]
-            return OrderedDict(actions)
-        # else, it's a scalar
-        return action
-
-    return [tolist(unflatten(action_space, ac)) for ac in flat_actions[0]]
+    def to(
+        self, tree: Dict[str, Any], device: Union[str, torch.device, int]
+    ) -> Dict[str, Any]:
+        """The tree with every (tensor) leaf of `tree` moved to `device`."""
+        return self.map(lambda leaf: leaf.to(device), tree)
@@ -3,8 +3,9 @@ import logging
 import os
 import socket
 import sys
+import types
 from contextlib import closing
-from typing import cast, Optional, Tuple
+from typing import cast, List, Optional, Tuple
 
 from torch import multiprocessing as mp
 
@@ -75,6 +76,40 @@ def find_free_port(address: str = "127.0.0.1") -> int:
     return port
 
 
+def imported_module_names(cls: type) -> List[str]:
+    """Names of the modules defining `cls` and its base classes, together with
+    the (already imported) modules these import at their top level, e.g. to
+    preload them into a forkserver so that worker processes do not have to
+    import them again.
+
+    # Parameters
+
+    cls : The class (e.g. an `ExperimentConfig` subclass) to inspect.
+
+    # Returns
+
+    Sorted list of module names (excluding `__main__` and `builtins`).
+    """
+    names = set()
+    for base in cls.__mro__:
+        module = sys.modules.get(base.__module__)
+        if module is None:
+            continue
+        names.add(module.__name__)
+        for value in vars(module).values():
+            if isinstance(value, types.ModuleType):
+                names.add(value.__name__)
+            else:
+                value_module = getattr(value, "__module__", None)
+                if isinstance(value_module, str):
+                    names.add(value_module)
+    return sorted(
+        name
+        for name in names
+        if name in sys.modules and name not in ("__main__", "builtins")
+    )
+
+
 def _new_logger(log_level: Optional[int] = None):
     global _LOGGER
     if _LOGGER is None:
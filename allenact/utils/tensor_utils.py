@@ -4,7 +4,7 @@ import numbers
 import os
 import tempfile
 from collections import defaultdict
-from typing import List, Dict, Optional, DefaultDict, Union, Any, cast
+from typing import List, Dict, Optional, DefaultDict, Union, Any, Tuple, cast
 
 import PIL
 import numpy as np
@@ -19,6 +19,8 @@ from tensorboardX.proto.summary_pb2 import Summary as TBXSummary
 from tensorboardX.utils import _prepare_video as tbx_prepare_video
 from tensorboardX.x2num import make_np as tbxmake_np
 
+from allenact.base_abstractions.misc import StackedObservations
+from allenact.utils.spaces_utils import TreeSpec
 from allenact.utils.system import get_logger
 
 
@@ -188,6 +190,227 @@ def batch_observations(
     return cast(Dict[str, Union[Dict, torch.Tensor]], batch)
 
 
+class ObservationBatcher(object):
+    """Batches the observations of several samplers (as `batch_observations`)
+    into preallocated buffers.
+
+    The structure, shapes and dtypes of the observations are taken from the
+    first batch. Each observation is then copied directly into a (pinned, if
+    `device` is a CUDA device) host buffer of shape `[samplers, ...]`, and each
+    buffer is moved to `device` with a single (asynchronous) copy into a
+    preallocated device buffer. Batches whose observations do not match the
+    structure, shapes or dtypes of the first batch are batched with
+    `batch_observations`.
+
+    The returned tensors are views of the buffers, which are overwritten by the
+    next call to `batch`, so they must be consumed (e.g. copied into the rollout
+    storage) before then.
+
+    # Attributes
+
+    device : The device of the batched observations.
+    """
+
+    def __init__(self, device: Union[str, torch.device, int, None] = None):
+        self.device = (
+            torch.device("cpu")
+            if device is None or device == -1
+            else torch.device(device)
+        )
+        self._pin_memory = self.device.type == "cuda"
+
+        self._spec: Optional[TreeSpec] = None
+        # (shape, dtype) of every leaf of `_spec`
+        self._leaf_specs: List[Tuple[Tuple[int, ...], Any]] = []
+        self._capacity = 0
+        self._host_buffers: List[torch.Tensor] = []
+        self._host_arrays: List[np.ndarray] = []
+        self._device_buffers: List[torch.Tensor] = []
+        self._copy_done: Optional[torch.cuda.Event] = None
+
+    @staticmethod
+    def _leaf_spec(value: Any) -> Optional[Tuple[Tuple[int, ...], Any]]:
+        """The shape and dtype of an observation (as given by `to_tensor`),
+        `None` for unsupported observation types."""
+        if isinstance(value, np.ndarray):
+            if value.dtype == np.object_:
+                return None
+            return tuple(value.shape), value.dtype
+        if torch.is_tensor(value):
+            return tuple(value.shape), value.dtype
+        if isinstance(value, numbers.Number) and not isinstance(value, complex):
+            return (), np.int64 if isinstance(value, numbers.Integral) else np.float32
+        return None
+
+    @staticmethod
+    def _stacked_leaf_spec(value: Any) -> Optional[Tuple[Tuple[int, ...], Any]]:
+        """The shape and dtype of the observation of a single sampler in
+        stacked observations, `None` for unsupported observation types."""
+        if isinstance(value, np.ndarray) and value.ndim > 0:
+            if value.dtype == np.object_:
+                return None
+            return tuple(value.shape[1:]), value.dtype
+        if torch.is_tensor(value) and value.dim() > 0:
+            return tuple(value.shape[1:]), value.dtype
+        return None
+
+    def _build(
+        self, observation: Dict[str, Any], num_samplers: int, stacked: bool = False
+    ) -> bool:
+        leaf_spec_fn = self._stacked_leaf_spec if stacked else self._leaf_spec
+        spec = TreeSpec.from_tree(observation)
+        leaf_specs = [leaf_spec_fn(leaf) for leaf in spec.leaves(observation)]
+        if any(leaf_spec is None for leaf_spec in leaf_specs):
+            return False
+
+        self._spec = spec
+        self._leaf_specs = cast(List[Tuple[Tuple[int, ...], Any]], leaf_specs)
+        self._capacity = num_samplers
+        self._host_buffers = []
+        self._host_arrays = []
+        self._device_buffers = []
+        for shape, dtype in self._leaf_specs:
+            torch_dtype = (
+                dtype
+                if isinstance(dtype, torch.dtype)
+                else torch.from_numpy(np.empty(0, dtype=dtype)).dtype
+            )
+            host = torch.empty(
+                (num_samplers,) + shape, dtype=torch_dtype, pin_memory=self._pin_memory
+            )
+            self._host_buffers.append(host)
+            self._host_arrays.append(host.numpy())
+            if self.device.type != "cpu":
+                self._device_buffers.append(torch.empty_like(host, device=self.device))
+        self._copy_done = None
+        return True
+
+    def _fill(self, index: int, observation: Dict[str, Any]) -> bool:
+        """Copies the observation of the sampler at `index` into the host
+        buffers, returns `False` if it does not match the buffers."""
+        if not self._spec.matches(observation):
+            return False
+        try:
+            leaves = self._spec.leaves(observation)
+        except (KeyError, TypeError):
+            return False
+
+        for value, (shape, dtype), host, host_array in zip(
+            leaves, self._leaf_specs, self._host_buffers, self._host_arrays
+        ):
+            if isinstance(value, np.ndarray):
+                if value.shape != shape or value.dtype != dtype:
+                    return False
+                np.copyto(host_array[index], value)
+            elif torch.is_tensor(value):
+                if tuple(value.shape) != shape or value.dtype != dtype:
+                    return False
+                host[index].copy_(value)
+            else:
+                if self._leaf_spec(value) != (shape, dtype):
+                    return False
+                host_array[index] = value
+        return True
+
+    def _fill_stacked(self, stacked: Dict[str, Any], num_samplers: int) -> bool:
+        """Copies stacked observations (see `StackedObservations`) into the
+        host buffers, returns `False` if they do not match the buffers."""
+        if not self._spec.matches(stacked):
+            return False
+        try:
+            leaves = self._spec.leaves(stacked)
+        except (KeyError, TypeError):
+            return False
+
+        for value, (shape, dtype), host, host_array in zip(
+            leaves, self._leaf_specs, self._host_buffers, self._host_arrays
+        ):
+            if self._stacked_leaf_spec(value) != (shape, dtype):
+                return False
+            if len(value) != num_samplers:
+                return False
+            if isinstance(value, np.ndarray):
+                np.copyto(host_array[:num_samplers], value)
+            else:
+                host[:num_samplers].copy_(value)
+        return True
+
+    def batch(
+        self, observations: Union[List[Dict], StackedObservations]
+    ) -> Dict[str, Union[Dict, torch.Tensor]]:
+        """Batches the given observations (one per sampler).
+
+        # Parameters
+
+        observations : List of dicts of observations, or `StackedObservations`
+            (of samplers which all have an observation) which are copied into
+            the buffers without being split per sampler.
+
+        # Returns
+
+        Dict (with the same structure as the observations) of batched
+        observations.
+        """
+        if len(observations) == 0:
+            return cast(Dict[str, Union[Dict, torch.Tensor]], observations)
+
+        num_samplers = len(observations)
+        if isinstance(observations, StackedObservations):
+            return self._batch_stacked(observations)
+
+        if self._spec is None or num_samplers > self._capacity:
+            if not self._build(observations[0], max(num_samplers, self._capacity)):
+                return batch_observations(observations, device=self.device)
+
+        if self._copy_done is not None:
+            # The host buffers may still be being copied to the device
+            self._copy_done.synchronize()
+
+        for index, observation in enumerate(observations):
+            if not self._fill(index, observation):
+                return batch_observations(observations, device=self.device)
+
+        return self._batched(num_samplers)
+
+    def _batch_stacked(
+        self, observations: StackedObservations
+    ) -> Dict[str, Union[Dict, torch.Tensor]]:
+        num_samplers = len(observations)
+        if self._spec is None or num_samplers > self._capacity:
+            if not self._build(
+                observations.stacked, max(num_samplers, self._capacity), stacked=True
+            ):
+                return batch_observations(list(observations), device=self.device)
+
+        if self._copy_done is not None:
+            # The host buffers may still be being copied to the device
+            self._copy_done.synchronize()
+
+        if not self._fill_stacked(observations.stacked, num_samplers):
+            return batch_observations(list(observations), device=self.device)
+
+        return self._batched(num_samplers)
+
+    def _batched(self, num_samplers: int) -> Dict[str, Union[Dict, torch.Tensor]]:
+        """The first `num_samplers` entries of the (filled) host buffers, moved
+        to `device`."""
+        if self.device.type == "cpu":
+            batched = [host[:num_samplers] for host in self._host_buffers]
+        else:
+            batched = [
+                device_buffer[:num_samplers].copy_(
+                    host[:num_samplers], non_blocking=True
+                )
+                for host, device_buffer in zip(self._host_buffers, self._device_buffers)
+            ]
+            if self.device.type == "cuda":
+                if self._copy_done is None:
+                    self._copy_done = torch.cuda.Event()
+                self._copy_done.record(torch.cuda.current_stream(self.device))
+
+        return self._spec.unflatten(batched)
+
+
 def to_tensor(v) -> torch.Tensor:
     """Return a torch.Tensor version of the input.
 
@@ -0,0 +1,121 @@
+"""Measures the time taken by `RolloutStorage.compute_returns` (GAE and plain
+discounted returns) with the functions of
+`allenact.algorithms.onpolicy_sync.returns` and with the previous per-step
+Python loop, for a range of rollout lengths.
+
+Example:
+
+```bash
+python -m scripts.benchmarks.compute_returns --num_steps 32 128 512 2048 --device cuda
+```
+"""
+
+import argparse
+import time
+from typing import Callable
+
+import torch
+
+from allenact.algorithms.onpolicy_sync.returns import (
+    compute_discounted_returns,
+    compute_gae,
+)
+
+
+def legacy_compute_returns(
+    rewards: torch.Tensor,
+    value_preds: torch.Tensor,
+    masks: torch.Tensor,
+    returns: torch.Tensor,
+    use_gae: bool,
+    gamma: float,
+    tau: float,
+):
+    """The per-step loop previously used by
+    `RolloutStorage.compute_returns`."""
+    if use_gae:
+        gae = 0
+        for step in reversed(range(rewards.shape[0])):
+            delta = (
+                rewards[step]
+                + gamma * value_preds[step + 1] * masks[step + 1]
+                - value_preds[step]
+            )
+            gae = delta + gamma * tau * masks[step + 1] * gae
+            returns[step] = gae + value_preds[step]
+    else:
+        for step in reversed(range(rewards.shape[0])):
+            returns[step] = returns[step + 1] * gamma * masks[step + 1] + rewards[step]
+
+
+def compute_returns(
+    rewards: torch.Tensor,
+    value_preds: torch.Tensor,
+    masks: torch.Tensor,
+    returns: torch.Tensor,
+    use_gae: bool,
+    gamma: float,
+    tau: float,
+):
+    num_steps = rewards.shape[0]
+    if use_gae:
+        returns[:num_steps] = (
+            compute_gae(rewards, value_preds, masks, gamma, tau) + value_preds[:-1]
+        )
+    else:
+        returns[:num_steps] = compute_discounted_returns(
+            rewards, masks, returns[-1], gamma
+        )
+
+
+def benchmark(fn: Callable, repeats: int, device: torch.device, **kwargs) -> float:
+    """Returns the average time (in seconds) of a call to `fn`."""
+    fn(**kwargs)  # warm up (and let TorchScript optimize the scans)
+    fn(**kwargs)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(**kwargs)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--num_steps", type=int, nargs="+", default=[32, 128, 512, 2048]
+    )
+    parser.add_argument("--samplers", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    columns = ["gae legacy", "gae", "plain legacy", "plain"]
+
+    print("{:<10}".format("steps") + "".join("{:>14}".format(c) for c in columns))
+    for num_steps in args.num_steps:
+        masks = torch.rand(num_steps + 1, args.samplers, 1, device=device) > 0.01
+        kwargs = dict(
+            rewards=torch.randn(num_steps, args.samplers, 1, device=device),
+            value_preds=torch.randn(num_steps + 1, args.samplers, 1, device=device),
+            masks=masks.float(),
+            returns=torch.zeros(num_steps + 1, args.samplers, 1, device=device),
+            gamma=0.99,
+            tau=0.95,
+        )
+        times = [
+            benchmark(fn, args.repeats, device, use_gae=use_gae, **kwargs)
+            for use_gae in [True, False]
+            for fn in [legacy_compute_returns, compute_returns]
+        ]
+        print(
+            "{:<10}".format(num_steps)
+            + "".join("{:>12.2f}ms".format(1000 * t) for t in times)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Measures the time of a (distributed) update step, i.e. the backward pass
+and the gradient all-reduce of `OnPolicyTrainer.backprop_step`, with one
+all-reduce per parameter and with `BucketedGradientReducer` (with and without
+overlapping the all-reduce with the backward pass), for CPU workers
+communicating with gloo.
+
+The model is a ResNet-like stack of convolutional blocks (with batch norm)
+followed by an MLP, giving a few hundred parameter tensors.
+
+Example:
+
+```bash
+python -m scripts.benchmarks.gradient_all_reduce --workers 2 4 --bucket_size_mb 1 25
+```
+"""
+
+import argparse
+import socket
+import time
+from typing import Callable, List
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch import nn
+
+from allenact.algorithms.onpolicy_sync.grad_reduction import BucketedGradientReducer
+
+
+def make_model(num_blocks: int, channels: int) -> nn.Module:
+    layers: List[nn.Module] = [nn.Conv2d(3, channels, 3, padding=1)]
+    for _ in range(num_blocks):
+        layers.extend(
+            [
+                nn.Conv2d(channels, channels, 3, padding=1),
+                nn.BatchNorm2d(channels),
+                nn.ReLU(),
+            ]
+        )
+    layers.extend(
+        [
+            nn.AdaptiveAvgPool2d(1),
+            nn.Flatten(),
+            nn.Linear(channels, 512),
+            nn.ReLU(),
+            nn.Linear(512, 6),
+        ]
+    )
+    return nn.Sequential(*layers)
+
+
+def per_parameter_all_reduce(model: nn.Module):
+    """The all-reduce previously used by `OnPolicyTrainer.backprop_step`."""
+    reductions = []
+    for p in model.parameters():
+        if p.requires_grad:
+            if p.grad is None:
+                p.grad = torch.zeros_like(p.data)
+            reductions.append(dist.all_reduce(p.grad, async_op=True))
+    for reduction in reductions:
+        reduction.wait()
+
+
+def time_updates(
+    model: nn.Module, inputs: torch.Tensor, repeats: int, reduce: Callable
+) -> float:
+    """Returns the average time (in seconds) of an update step."""
+    times = []
+    for _ in range(repeats + 1):
+        dist.barrier()
+        start = time.perf_counter()
+        model.zero_grad()
+        reduce(lambda: model(inputs).pow(2).mean().backward())
+        times.append(time.perf_counter() - start)
+    return sum(times[1:]) / repeats
+
+
+def run_worker(rank: int, world_size: int, port: int, args, results: mp.Queue):
+    torch.set_num_threads(1)
+    dist.init_process_group(
+        "gloo",
+        init_method="tcp://127.0.0.1:{}".format(port),
+        rank=rank,
+        world_size=world_size,
+    )
+    model = make_model(args.blocks, args.channels)
+    inputs = torch.randn(args.batch_size, 3, 16, 16)
+
+    def per_parameter(backward: Callable):
+        backward()
+        per_parameter_all_reduce(model)
+
+    def bucketed(reducer: BucketedGradientReducer) -> Callable:
+        def reduce(backward: Callable):
+            reducer.prepare()
+            backward()
+            reducer.reduce()
+
+        return reduce
+
+    timings = [
+        ("per parameter", time_updates(model, inputs, args.repeats, per_parameter))
+    ]
+    for bucket_size_mb in args.bucket_size_mb:
+        for overlap in [False, True]:
+            reducer = BucketedGradientReducer(
+                model.parameters(), bucket_size_mb=bucket_size_mb, overlap=overlap
+            )
+            timings.append(
+                (
+                    "{}MiB{}".format(bucket_size_mb, " overlap" if overlap else ""),
+                    time_updates(model, inputs, args.repeats, bucketed(reducer)),
+                )
+            )
+    if rank == 0:
+        results.put((len(list(model.parameters())), timings))
+    dist.destroy_process_group()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--bucket_size_mb", type=float, nargs="+", default=[1.0, 25.0])
+    parser.add_argument("--blocks", type=int, default=60)
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("fork")
+    for world_size in args.workers:
+        results = ctx.Queue()
+        port = free_port()
+        processes = [
+            ctx.Process(target=run_worker, args=(rank, world_size, port, args, results))
+            for rank in range(world_size)
+        ]
+        for p in processes:
+            p.start()
+        num_params, timings = results.get()
+        for p in processes:
+            p.join()
+
+        print(
+            "{} workers, {} parameter tensors (update time)".format(
+                world_size, num_params
+            )
+        )
+        for name, seconds in timings:
+            print("  {:<20}{:>10.2f}ms".format(name, 1000 * seconds))
+
+
+if __name__ == "__main__":
+    main()
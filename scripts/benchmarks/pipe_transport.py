@@ -0,0 +1,140 @@
+"""Measures the throughput (bytes/sec per pipe) of sending step results from a
+worker process through a plain `multiprocessing` pipe and through an
+`OutOfBandConnection` (the ``'pickle5'`` transport of `VectorSampledTasks`).
+
+Each message mimics the result of a `VectorSampledTasks` worker stepping
+`samplers` task samplers: a list with, for every sampler, a nested observation
+dictionary (with an image and a depth map) and an `info` dictionary.
+
+Example:
+
+```bash
+python -m scripts.benchmarks.pipe_transport --samplers 1 8 64
+```
+"""
+
+import argparse
+import multiprocessing as mp
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from allenact.algorithms.onpolicy_sync.out_of_band_connection import (
+    OutOfBandConnection,
+)
+
+
+def make_message(num_samplers: int, image_shape: Tuple[int, ...]) -> List[Any]:
+    return [
+        (
+            {
+                "rgb": np.full(image_shape, i, dtype=np.uint8),
+                "depth": {
+                    "map": np.full(image_shape[:2], i, dtype=np.float32),
+                    "valid": True,
+                },
+            },
+            0.0,
+            False,
+            {"sampler": i, "success": False},
+        )
+        for i in range(num_samplers)
+    ]
+
+
+def message_nbytes(message: List[Any]) -> int:
+    return sum(
+        obs["rgb"].nbytes + obs["depth"]["map"].nbytes for obs, _, _, _ in message
+    )
+
+
+def send_messages(
+    send_fn, num_messages: int, num_samplers: int, image_shape: Tuple[int, ...]
+):
+    message = make_message(num_samplers, image_shape)
+    for _ in range(num_messages + 1):
+        send_fn(message)
+
+
+def benchmark(
+    out_of_band: bool,
+    num_messages: int,
+    num_samplers: int,
+    image_shape: Tuple[int, ...],
+    mp_ctx,
+) -> float:
+    """Returns the number of (array) bytes received per second."""
+    receiver, sender = mp_ctx.Pipe(duplex=False)
+    if out_of_band:
+        # Received as step results (into reused buffers)
+        receiver = OutOfBandConnection(receiver, reuse_buffers=True)
+        sender = OutOfBandConnection(sender)
+
+    worker = mp_ctx.Process(
+        target=send_messages,
+        args=(sender.send, num_messages, num_samplers, image_shape),
+        daemon=True,
+    )
+    worker.start()
+    try:
+        nbytes = message_nbytes(receiver.recv())  # warm up
+        start = time.perf_counter()
+        for _ in range(num_messages):
+            receiver.recv()
+        bytes_per_second = nbytes * num_messages / (time.perf_counter() - start)
+    finally:
+        worker.join()
+        receiver.close()
+        sender.close()
+    return bytes_per_second
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samplers", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument(
+        "--bytes",
+        type=float,
+        default=2e9,
+        help="Approximate number of bytes sent per pipe and configuration.",
+    )
+    parser.add_argument("--image_shape", type=int, nargs="+", default=[224, 224, 3])
+    parser.add_argument("--start_method", type=str, default="forkserver")
+    args = parser.parse_args()
+
+    mp_ctx = mp.get_context(args.start_method)
+    image_shape = tuple(args.image_shape)
+
+    results: Dict[str, List[float]] = {"pipe": [], "pickle5": []}
+    for num_samplers in args.samplers:
+        num_messages = max(
+            int(
+                args.bytes / message_nbytes(make_message(num_samplers, image_shape))
+            ),
+            10,
+        )
+        for name in results:
+            results[name].append(
+                benchmark(
+                    out_of_band=name == "pickle5",
+                    num_messages=num_messages,
+                    num_samplers=num_samplers,
+                    image_shape=image_shape,
+                    mp_ctx=mp_ctx,
+                )
+            )
+
+    print(
+        "{:<10}".format("samplers")
+        + "".join("{:>16}".format(name + " (MB/s)") for name in results)
+    )
+    for i, num_samplers in enumerate(args.samplers):
+        print(
+            "{:<10}".format(num_samplers)
+            + "".join("{:>16.1f}".format(results[name][i] / 1e6) for name in results)
+        )
+
+
+if __name__ == "__main__":
+    main()
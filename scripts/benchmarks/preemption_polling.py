@@ -0,0 +1,134 @@
+"""Measures the overhead of checking for straggler preemption during the
+rollout of distributed training, querying the number of finished workers
+from the `TCPStore` at every step (as previously done by
+`OnPolicyTrainer.run_pipeline`) versus checking the flag of a
+`RolloutDoneNotifier`.
+
+Every worker simulates rollouts of `--steps` steps taking `--step_ms`
+milliseconds each, with the last worker twice as slow (so that others are
+preempted).
+
+Example:
+
+```bash
+python -m scripts.benchmarks.preemption_polling --workers 2 4 8
+```
+"""
+
+import argparse
+import socket
+import time
+from typing import Tuple
+
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from allenact.algorithms.onpolicy_sync.preemption import RolloutDoneNotifier
+
+
+def busy_wait(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def run_worker(rank: int, world_size: int, port: int, args, results: mp.Queue):
+    store = dist.TCPStore("127.0.0.1", port, world_size, rank == 0)
+    step_seconds = args.step_ms / 1000 * (2 if rank == world_size - 1 else 1)
+    notifier = RolloutDoneNotifier(
+        store=store,
+        address="127.0.0.1",
+        port=port,
+        world_size=world_size,
+        threshold=args.threshold,
+    )
+
+    def polling_rollout(rollout: int) -> Tuple[float, int]:
+        key = "polling{}".format(rollout)
+        store.add(key, 0)
+        check_seconds = 0.0
+        for step in range(args.steps):
+            start = time.perf_counter()
+            num_done = int(store.get(key))
+            check_seconds += time.perf_counter() - start
+            if num_done > args.threshold * world_size:
+                break
+            busy_wait(step_seconds)
+        store.add(key, 1)
+        return check_seconds, step + 1
+
+    def notifier_rollout(_: int) -> Tuple[float, int]:
+        notifier.start()
+        check_seconds = 0.0
+        for step in range(args.steps):
+            start = time.perf_counter()
+            notified = notifier.notified
+            check_seconds += time.perf_counter() - start
+            if notified:
+                break
+            busy_wait(step_seconds)
+        notifier.finish()
+        return check_seconds, step + 1
+
+    timings = {}
+    for name, rollout in [
+        ("store polling", polling_rollout),
+        ("notifier", notifier_rollout),
+    ]:
+        check_seconds, checks = 0.0, 0
+        for it in range(args.rollouts):
+            rollout_seconds, rollout_checks = rollout(it)
+            check_seconds += rollout_seconds
+            checks += rollout_checks
+            barrier = "{}_barrier{}".format(name, it)
+            store.add(barrier, 1)
+            while int(store.get(barrier)) < world_size:
+                time.sleep(0.001)
+        timings[name] = check_seconds / checks
+    notifier.stop()
+    results.put((rank, timings))
+
+    # The first worker hosts the store, so it exits last
+    store.add("exit", 1)
+    if rank == 0:
+        while int(store.get("exit")) < world_size:
+            time.sleep(0.01)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--steps", type=int, default=128)
+    parser.add_argument("--step_ms", type=float, default=1.0)
+    parser.add_argument("--rollouts", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.7)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("fork")
+    for world_size in args.workers:
+        results = ctx.Queue()
+        port = free_port()
+        processes = [
+            ctx.Process(target=run_worker, args=(rank, world_size, port, args, results))
+            for rank in range(world_size)
+        ]
+        for p in processes:
+            p.start()
+        worker_timings = [results.get()[1] for _ in range(world_size)]
+        for p in processes:
+            p.join()
+
+        print("{} workers (mean time of a preemption check)".format(world_size))
+        for name in worker_timings[0]:
+            mean = sum(t[name] for t in worker_timings) / world_size
+            print("  {:<20}{:>10.1f}us".format(name, 1e6 * mean))
+
+
+if __name__ == "__main__":
+    main()
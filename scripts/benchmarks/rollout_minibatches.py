@@ -0,0 +1,199 @@
+"""Measures the time taken to assemble the minibatches of a rollout with
+`RolloutStorage.recurrent_generator` (with shuffled samplers, contiguous
+sampler ranges gathered into reused buffers and contiguous sampler ranges
+as zero-copy views) and with the previous implementation, which stacked the
+data of each sampler of a minibatch.
+
+Each configuration iterates over all minibatches of `epochs` PPO epochs,
+touching every minibatch tensor once (as a loss would).
+
+Example:
+
+```bash
+python -m scripts.benchmarks.rollout_minibatches --samplers 64 128 --num_mini_batch 4
+```
+"""
+
+import argparse
+import random
+import time
+from typing import Dict, Iterator, List
+
+import gym
+import numpy as np
+import torch
+
+from allenact.algorithms.onpolicy_sync.storage import RolloutStorage
+from allenact.base_abstractions.misc import Memory
+import allenact.utils.spaces_utils as su
+
+
+class BenchmarkModel(object):
+    """Provides the attributes of an `ActorCriticModel` used by
+    `RolloutStorage`."""
+
+    action_space = gym.spaces.Discrete(4)
+    recurrent_memory_specification = {
+        "rnn": ((("layer", 1), ("sampler", None), ("hidden", 512)), torch.float32)
+    }
+
+
+def make_rollouts(
+    num_steps: int, num_samplers: int, feature_shape: List[int], device: torch.device
+) -> RolloutStorage:
+    rollouts = RolloutStorage(
+        num_steps=num_steps,
+        num_samplers=num_samplers,
+        actor_critic=BenchmarkModel(),  # type:ignore
+    )
+    rollouts.to(device)
+
+    def observations():
+        return {
+            "features": torch.randn(num_samplers, *feature_shape, device=device),
+            "goal": torch.randn(num_samplers, 32, device=device),
+        }
+
+    rollouts.insert_observations(observations())
+    for _ in range(num_steps):
+        rollouts.insert(
+            observations=observations(),
+            memory=Memory(rnn=(torch.randn(1, num_samplers, 512, device=device), 1)),
+            actions=torch.randint(4, (num_samplers, 1), device=device).float(),
+            action_log_probs=torch.randn(num_samplers, 1, device=device),
+            value_preds=torch.randn(num_samplers, 1, device=device),
+            rewards=torch.randn(num_samplers, 1, device=device),
+            masks=torch.ones(num_samplers, 1, device=device),
+        )
+    rollouts.returns.normal_()
+    return rollouts
+
+
+def legacy_recurrent_generator(
+    rollouts: RolloutStorage, advantages: torch.Tensor, num_mini_batch: int
+) -> Iterator[Dict]:
+    """The implementation of `recurrent_generator` prior to index-based
+    minibatch assembly (without compact storage dtype conversion)."""
+    normalized_advantages = (advantages - advantages.mean()) / (
+        advantages.std() + 1e-5
+    )
+
+    num_samplers = rollouts.rewards.shape[1]
+    inds = np.round(
+        np.linspace(0, num_samplers, num_mini_batch + 1, endpoint=True)
+    ).astype(np.int32)
+    pairs = list(zip(inds[:-1], inds[1:]))
+    random.shuffle(pairs)
+
+    for start_ind, end_ind in pairs:
+        cur_samplers = list(range(start_ind, end_ind))
+
+        memory_batch = rollouts.memory.step_squeeze(0).sampler_select(cur_samplers)
+        observations_batch = rollouts.unflatten_observations(
+            rollouts.observations.slice(dim=0, stop=-1).sampler_select(cur_samplers)
+        )
+
+        lists: Dict[str, List[torch.Tensor]] = {
+            name: []
+            for name in [
+                "actions",
+                "prev_actions",
+                "values",
+                "returns",
+                "masks",
+                "old_action_log_probs",
+                "adv_targ",
+                "norm_adv_targ",
+            ]
+        }
+        for ind in cur_samplers:
+            lists["actions"].append(rollouts.actions[:, ind])
+            lists["prev_actions"].append(rollouts.prev_actions[:-1, ind])
+            lists["values"].append(rollouts.value_preds[:-1, ind])
+            lists["returns"].append(rollouts.returns[:-1, ind])
+            lists["masks"].append(rollouts.masks[:-1, ind])
+            lists["old_action_log_probs"].append(rollouts.action_log_probs[:, ind])
+            lists["adv_targ"].append(advantages[:, ind])
+            lists["norm_adv_targ"].append(normalized_advantages[:, ind])
+
+        batch = {name: torch.stack(tensors, 1) for name, tensors in lists.items()}
+        yield {
+            **batch,
+            "observations": observations_batch,
+            "memory": memory_batch,
+            "actions": su.unflatten(rollouts.action_space, batch["actions"]),
+            "prev_actions": su.unflatten(rollouts.action_space, batch["prev_actions"]),
+        }
+
+
+def touch(batch: Dict) -> float:
+    total = 0.0
+    for value in batch.values():
+        if isinstance(value, Memory):
+            value = {key: value.tensor(key) for key in value}
+        if isinstance(value, dict):
+            total += sum(float(v.sum()) for v in value.values())
+        else:
+            total += float(value.sum())
+    return total
+
+
+def benchmark(
+    rollouts: RolloutStorage, num_mini_batch: int, epochs: int, mode: str
+) -> float:
+    """Returns the average time (in seconds) to go through one epoch."""
+    advantages = rollouts.returns[:-1] - rollouts.value_preds[:-1]
+
+    def epoch():
+        if mode == "legacy":
+            generator = legacy_recurrent_generator(
+                rollouts, advantages, num_mini_batch
+            )
+        else:
+            generator = rollouts.recurrent_generator(
+                advantages,
+                num_mini_batch,
+                shuffle_samplers=mode == "shuffled",
+                zero_copy=mode == "zero_copy",
+            )
+        for batch in generator:
+            touch(batch)
+
+    epoch()  # warm up (and allocate buffers)
+    start = time.perf_counter()
+    for _ in range(epochs):
+        epoch()
+    return (time.perf_counter() - start) / epochs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samplers", type=int, nargs="+", default=[16, 64, 128])
+    parser.add_argument("--num_steps", type=int, default=128)
+    parser.add_argument("--num_mini_batch", type=int, default=4)
+    parser.add_argument("--epochs", type=int, default=4)
+    parser.add_argument("--feature_shape", type=int, nargs="+", default=[128, 7, 7])
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    modes = ["legacy", "ranges", "shuffled", "zero_copy"]
+
+    print("{:<10}".format("samplers") + "".join("{:>14}".format(m) for m in modes))
+    for num_samplers in args.samplers:
+        rollouts = make_rollouts(
+            args.num_steps, num_samplers, args.feature_shape, device
+        )
+        times = [
+            benchmark(rollouts, args.num_mini_batch, args.epochs, mode)
+            for mode in modes
+        ]
+        print(
+            "{:<10}".format(num_samplers)
+            + "".join("{:>12.1f}ms".format(1000 * t) for t in times)
+        )
+        del rollouts
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Compares the throughput of the process (`VectorSampledTasks`) and thread
+(`ThreadedVectorSampledTasks`) sampler backends on a synthetic task whose
+step sleeps (releasing the GIL, as simulators waiting on a socket or
+rendering in native code do) and returns an image observation.
+
+Example:
+
+```bash
+python -m scripts.benchmarks.vector_sampled_tasks_backends --samplers 8 --max_processes 4
+```
+"""
+
+import argparse
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import gym
+import numpy as np
+from gym.spaces.dict import Dict as SpaceDict
+
+from allenact.algorithms.onpolicy_sync.vector_sampled_tasks import (
+    VectorSampledTasks,
+    ThreadedVectorSampledTasks,
+)
+from allenact.base_abstractions.misc import RLStepResult
+from allenact.base_abstractions.task import Task, TaskSampler
+
+
+class SleepingTask(Task):
+    """Task sleeping for `step_time` seconds at every step."""
+
+    def __init__(self, step_time: float, image_shape: Tuple[int, ...]):
+        super().__init__(env=None, sensors=[], task_info={}, max_steps=100)
+        self.step_time = step_time
+        self.image = np.zeros(image_shape, dtype=np.uint8)
+
+    @property
+    def action_space(self) -> gym.Space:
+        return gym.spaces.Discrete(4)
+
+    def get_observations(self, **kwargs) -> Any:
+        return {"rgb": self.image}
+
+    def _step(self, action: int) -> RLStepResult:
+        time.sleep(self.step_time)
+        self.image = np.full_like(self.image, action)
+        return RLStepResult(
+            observation=self.get_observations(), reward=0.0, done=False, info={}
+        )
+
+    def render(self, mode: str = "rgb", *args, **kwargs) -> np.ndarray:
+        return self.image
+
+    def reached_terminal_state(self) -> bool:
+        return False
+
+    @classmethod
+    def class_action_names(cls, **kwargs) -> Tuple[str, ...]:
+        return ("a", "b", "c", "d")
+
+    def close(self) -> None:
+        pass
+
+
+class SleepingTaskSampler(TaskSampler):
+    def __init__(self, step_time: float, image_shape: Tuple[int, ...], **kwargs):
+        self.step_time = step_time
+        self.image_shape = tuple(image_shape)
+        self.observation_space = SpaceDict(
+            {
+                "rgb": gym.spaces.Box(
+                    low=0, high=255, shape=self.image_shape, dtype=np.uint8
+                )
+            }
+        )
+        self._last_task: Optional[SleepingTask] = None
+
+    @property
+    def length(self) -> float:
+        return float("inf")
+
+    @property
+    def last_sampled_task(self) -> Optional[Task]:
+        return self._last_task
+
+    def next_task(self, force_advance_scene: bool = False) -> Optional[Task]:
+        self._last_task = SleepingTask(self.step_time, self.image_shape)
+        return self._last_task
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def all_observation_spaces_equal(self) -> bool:
+        return True
+
+    def reset(self) -> None:
+        pass
+
+    def set_seed(self, seed: int) -> None:
+        pass
+
+
+def make_sleeping_sampler(**kwargs) -> SleepingTaskSampler:
+    return SleepingTaskSampler(**kwargs)
+
+
+def benchmark(
+    vst_class,
+    num_samplers: int,
+    max_processes: Optional[int],
+    num_steps: int,
+    sampler_args: Dict[str, Any],
+    start_method: str,
+) -> Tuple[float, float]:
+    """Returns the startup time (in seconds) and the number of (sampler)
+    steps per second."""
+    start = time.perf_counter()
+    vst = vst_class(
+        make_sampler_fn=make_sleeping_sampler,
+        sampler_fn_args=[dict(sampler_args) for _ in range(num_samplers)],
+        multiprocessing_start_method=start_method,
+        max_processes=max_processes,
+        should_log=False,
+    )
+    try:
+        vst.get_observations()
+        startup_time = time.perf_counter() - start
+
+        actions = [1] * num_samplers
+        vst.step(actions)  # warm up
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            vst.step(actions)
+        steps_per_second = num_samplers * num_steps / (time.perf_counter() - start)
+    finally:
+        vst.close()
+    return startup_time, steps_per_second
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samplers", type=int, default=8)
+    parser.add_argument(
+        "--max_processes",
+        type=int,
+        default=None,
+        help="Number of worker processes/threads (defaults to one per sampler).",
+    )
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument(
+        "--step_time",
+        type=float,
+        default=0.005,
+        help="Time (in seconds) each step sleeps for.",
+    )
+    parser.add_argument("--image_shape", type=int, nargs="+", default=[224, 224, 3])
+    parser.add_argument("--start_method", type=str, default="forkserver")
+    args = parser.parse_args()
+
+    sampler_args = {"step_time": args.step_time, "image_shape": args.image_shape}
+    print("{:<8} {:>12} {:>12}".format("backend", "startup (s)", "steps/s"))
+    for name, vst_class in [
+        ("process", VectorSampledTasks),
+        ("thread", ThreadedVectorSampledTasks),
+    ]:
+        startup_time, steps_per_second = benchmark(
+            vst_class=vst_class,
+            num_samplers=args.samplers,
+            max_processes=args.max_processes,
+            num_steps=args.steps,
+            sampler_args=sampler_args,
+            start_method=args.start_method,
+        )
+        print("{:<8} {:>12.2f} {:>12.1f}".format(name, startup_time, steps_per_second))
+
+
+if __name__ == "__main__":
+    main()
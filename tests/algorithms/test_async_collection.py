@@ -0,0 +1,83 @@
+import time
+
+import pytest
+from torch import nn
+
+from allenact.algorithms.onpolicy_sync.async_collection import AsyncRolloutCollector
+
+
+class FakeRollouts(object):
+    """Provides the `RolloutStorage` method used by `AsyncRolloutCollector`."""
+
+    def __init__(self):
+        self.start = 0
+        self.collected = None
+
+    def continue_from(self, rollouts: "FakeRollouts"):
+        self.start = rollouts.start + 1
+
+
+class TestAsyncRolloutCollector(object):
+    def test_collects_with_published_weights(self):
+        model = nn.Linear(1, 1, bias=False)
+        nn.init.zeros_(model.weight)
+        num_collected = [0]
+
+        def collect_rollout(rollouts: FakeRollouts):
+            rollouts.collected = model.weight.item()
+            num_collected[0] += 1
+            return num_collected[0]
+
+        collector = AsyncRolloutCollector(
+            storages=[FakeRollouts() for _ in range(4)],  # type:ignore
+            acting_model=model,
+            collect_rollout=collect_rollout,  # type:ignore
+            queue_size=2,
+            poll_seconds=0.01,
+        )
+        collector.start()
+        try:
+            # Collection pauses with a full queue (and one rollout in progress)
+            time.sleep(0.2)
+            assert num_collected[0] == 3
+
+            # Used from the next rollout on (once the queue has room)
+            learner = nn.Linear(1, 1, bias=False)
+            nn.init.ones_(learner.weight)
+            collector.publish_weights(learner, version=1)
+            # The acting model gets a copy of the weights
+            nn.init.constant_(learner.weight, 2.0)
+
+            rollouts, version, collection_info = collector.get()
+            assert (rollouts.start, rollouts.collected, version) == (0, 0.0, 0)
+            assert collection_info == 1
+            collector.release(rollouts)
+
+            starts = []
+            for _ in range(3):
+                rollouts, version, collection_info = collector.get()
+                starts.append(rollouts.start)
+                collector.release(rollouts)
+            # The last rollout was collected after publishing the weights
+            assert (rollouts.collected, version) == (1.0, 1)
+            assert starts == [1, 2, 3]
+            # The value returned by `collect_rollout` comes with its rollout
+            assert collection_info == 4
+        finally:
+            collector.stop()
+
+    def test_raises_collection_errors(self):
+        def collect_rollout(rollouts: FakeRollouts):
+            raise ValueError("Sampler failed.")
+
+        collector = AsyncRolloutCollector(
+            storages=[FakeRollouts() for _ in range(3)],  # type:ignore
+            acting_model=nn.Linear(1, 1),
+            collect_rollout=collect_rollout,  # type:ignore
+            poll_seconds=0.01,
+        )
+        collector.start()
+        with pytest.raises(RuntimeError) as excinfo:
+            collector.get()
+        assert isinstance(excinfo.value.__cause__, ValueError)
+        collector.stop()
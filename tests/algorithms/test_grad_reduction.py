@@ -0,0 +1,170 @@
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch import nn
+
+from allenact.algorithms.onpolicy_sync.grad_compression import (
+    CastCompressor,
+    PowerSGDCompressor,
+    TopKCompressor,
+)
+from allenact.algorithms.onpolicy_sync.grad_reduction import BucketedGradientReducer
+from allenact.utils.system import find_free_port
+
+WORLD_SIZE = 2
+
+
+def make_model() -> nn.Module:
+    torch.manual_seed(0)
+    model = nn.Sequential(
+        nn.Conv2d(3, 8, 3),
+        nn.ReLU(),
+        nn.Flatten(),
+        nn.Linear(8 * 6 * 6, 16),
+        nn.ReLU(),
+        nn.Linear(16, 4),
+    )
+    # A parameter without gradient (e.g. of an unused head)
+    model.unused = nn.Linear(4, 4)
+    return model
+
+
+def compute_grads(model: nn.Module, rank: int):
+    torch.manual_seed(rank + 1)
+    model.zero_grad()
+    model(torch.randn(5, 3, 8, 8)).pow(2).sum().backward()
+
+
+def run_worker(rank: int, port: int, results: mp.Queue):
+    dist.init_process_group(
+        "gloo",
+        init_method="tcp://127.0.0.1:{}".format(port),
+        rank=rank,
+        world_size=WORLD_SIZE,
+    )
+    try:
+        model = make_model()
+
+        # Reference: one all-reduce per parameter
+        compute_grads(model, rank)
+        for p in model.parameters():
+            if p.grad is None:
+                p.grad = torch.zeros_like(p)
+            dist.all_reduce(p.grad)
+        expected = [p.grad.clone() for p in model.parameters()]
+
+        reduced = {}
+        for bucket_size_mb, overlap in [(25.0, False), (0.001, False), (0.001, True)]:
+            model.unused.weight.grad = model.unused.bias.grad = None
+            reducer = BucketedGradientReducer(
+                model.parameters(), bucket_size_mb=bucket_size_mb, overlap=overlap
+            )
+            for _ in range(2):
+                reducer.prepare()
+                compute_grads(model, rank)
+                reducer.reduce()
+            # Gradients are not views into the buckets, so they can be clipped
+            nn.utils.clip_grad_norm_(model.parameters(), 1e6)
+            reduced[(bucket_size_mb, overlap)] = (
+                reducer.num_buckets,
+                [torch.equal(p.grad, e) for p, e in zip(model.parameters(), expected)],
+            )
+
+        # Lossless settings of the compressors, and lossy ones sending less data
+        compressed = {}
+        for name, compressor, atol in [
+            ("fp16", CastCompressor(torch.float16), 1e-2),
+            ("powersgd", PowerSGDCompressor(rank=64, min_compression_rate=0), 1e-4),
+            ("topk", TopKCompressor(ratio=1.0), 1e-6),
+            ("topk_sparse", TopKCompressor(ratio=0.1), None),
+            ("powersgd_rank1", PowerSGDCompressor(rank=1), None),
+        ]:
+            reducer = BucketedGradientReducer(
+                model.parameters(), bucket_size_mb=0.01, compressor=compressor
+            )
+            reducer.prepare()
+            compute_grads(model, rank)
+            reducer.reduce()
+            compressed[name] = (
+                atol is None
+                or all(
+                    torch.allclose(p.grad, e, atol=atol)
+                    for p, e in zip(model.parameters(), expected)
+                ),
+                reducer.pop_stats()["compression_ratio"],
+            )
+        results.put((rank, reduced, compressed))
+    finally:
+        dist.destroy_process_group()
+
+
+def run_powersgd_worker(rank: int, port: int, results: mp.Queue):
+    dist.init_process_group(
+        "gloo",
+        init_method="tcp://127.0.0.1:{}".format(port),
+        rank=rank,
+        world_size=WORLD_SIZE,
+    )
+    try:
+        # Rank one gradients along different directions on every worker, which
+        # a rank two approximation of their sum captures exactly
+        torch.manual_seed(rank + 1)
+        u, v = torch.randn(16, 1), torch.randn(12, 1)
+        compressor = PowerSGDCompressor(rank=2, min_compression_rate=0)
+
+        error_ratios, close = [], []
+        for update in range(10):
+            grad = (update + 1) * (u @ v.t())
+            expected = grad.clone()
+            dist.all_reduce(expected)
+            buffer = grad.view(-1).clone()
+            compressor.all_reduce(0, buffer, [grad.shape], None)
+            error_ratios.append((compressor._errors[0].norm() / grad.norm()).item())
+            close.append(
+                torch.allclose(buffer.view_as(grad), expected, rtol=1e-4, atol=1e-3)
+            )
+        results.put((rank, error_ratios, close))
+    finally:
+        dist.destroy_process_group()
+
+
+def run_workers(target) -> list:
+    ctx = mp.get_context("fork")
+    results = ctx.Queue()
+    port = find_free_port()
+    processes = [
+        ctx.Process(target=target, args=(rank, port, results))
+        for rank in range(WORLD_SIZE)
+    ]
+    for p in processes:
+        p.start()
+    worker_results = [results.get(timeout=60) for _ in range(WORLD_SIZE)]
+    for p in processes:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+    return worker_results
+
+
+class TestGradReduction(object):
+    def test_matches_per_parameter_all_reduce(self):
+        reduced = run_workers(run_worker)
+
+        for _, worker_reduced, worker_compressed in reduced:
+            assert worker_reduced[(25.0, False)][0] == 1
+            for _, equal in worker_reduced.values():
+                assert all(equal)
+            assert worker_reduced[(0.001, False)][0] > 1
+
+            for name, (close, compression_ratio) in worker_compressed.items():
+                assert close, name
+                if name == "fp16":
+                    assert compression_ratio == 2
+                elif name in ["topk_sparse", "powersgd_rank1"]:
+                    assert compression_ratio > 1, name
+
+    def test_powersgd_error_feedback_stays_bounded(self):
+        for _, error_ratios, close in run_workers(run_powersgd_worker):
+            assert all(close)
+            # Each worker only keeps the error of its own approximation, not
+            # its difference from the others (which grows with every update)
+            assert max(error_ratios) < 1e-3
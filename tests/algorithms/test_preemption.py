@@ -0,0 +1,70 @@
+import time
+
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from allenact.algorithms.onpolicy_sync.preemption import RolloutDoneNotifier
+from allenact.utils.system import find_free_port
+
+WORLD_SIZE = 3
+
+
+def store_barrier(store: dist.TCPStore, name: str):
+    store.add(name, 1)
+    while int(store.get(name)) < WORLD_SIZE:
+        time.sleep(0.01)
+
+
+def run_worker(rank: int, port: int, results: mp.Queue):
+    store = dist.TCPStore("127.0.0.1", port, WORLD_SIZE, rank == 0)
+    notifier = RolloutDoneNotifier(
+        store=store,
+        address="127.0.0.1",
+        port=port,
+        world_size=WORLD_SIZE,
+        threshold=0.5,
+    )
+    for rollout in range(2):
+        notifier.start()
+        notified = None
+        if rank == 0:
+            # The straggler is notified once two other workers are done
+            deadline = time.time() + 30
+            while not notifier.notified and time.time() < deadline:
+                time.sleep(0.01)
+            notified = notifier.notified
+        num_done = notifier.finish()
+        results.put((rank, notifier.num_done_to_notify, notified, num_done))
+        store_barrier(store, "rollout{}".format(rollout))
+    notifier.stop()
+    # The first worker hosts the store, so it exits last
+    store_barrier(store, "exit")
+    if rank == 0:
+        while int(store.get("exit")) < 2 * WORLD_SIZE - 1:
+            time.sleep(0.01)
+    else:
+        store.add("exit", 1)
+
+
+class TestRolloutDoneNotifier(object):
+    def test_notifies_stragglers(self):
+        ctx = mp.get_context("fork")
+        results = ctx.Queue()
+        port = find_free_port()
+        processes = [
+            ctx.Process(target=run_worker, args=(rank, port, results))
+            for rank in range(WORLD_SIZE)
+        ]
+        for p in processes:
+            p.start()
+        worker_results = [results.get(timeout=60) for _ in range(2 * WORLD_SIZE)]
+        for p in processes:
+            p.join(timeout=60)
+            assert p.exitcode == 0
+
+        for rank, num_done_to_notify, notified, num_done in worker_results:
+            # More than half of the workers
+            assert num_done_to_notify == 2
+            if rank == 0:
+                assert notified
+                assert num_done == WORLD_SIZE
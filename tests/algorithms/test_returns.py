@@ -0,0 +1,158 @@
+import torch
+
+from allenact.algorithms.onpolicy_sync.returns import (
+    compute_discounted_returns,
+    compute_gae,
+    compute_n_step_returns,
+    compute_vtrace,
+)
+
+
+def legacy_returns(
+    rewards: torch.Tensor,
+    value_preds: torch.Tensor,
+    masks: torch.Tensor,
+    next_value: torch.Tensor,
+    use_gae: bool,
+    gamma: float,
+    tau: float,
+) -> torch.Tensor:
+    """The per-step loop previously used by
+    `RolloutStorage.compute_returns`."""
+    value_preds = value_preds.clone()
+    returns = torch.zeros_like(value_preds)
+
+    def extend(stored_tensor: torch.Tensor):
+        return stored_tensor.view(
+            *stored_tensor.shape
+            + (1,) * (len(value_preds.shape) - len(stored_tensor.shape))
+        )
+
+    extended_mask = extend(masks)
+    extended_rewards = extend(rewards)
+
+    if use_gae:
+        value_preds[-1] = next_value
+        gae = 0
+        for step in reversed(range(extended_rewards.shape[0])):
+            delta = (
+                extended_rewards[step]
+                + gamma * value_preds[step + 1] * extended_mask[step + 1]
+                - value_preds[step]
+            )
+            gae = delta + gamma * tau * extended_mask[step + 1] * gae
+            returns[step] = gae + value_preds[step]
+    else:
+        returns[-1] = next_value
+        for step in reversed(range(extended_rewards.shape[0])):
+            returns[step] = (
+                returns[step + 1] * gamma * extended_mask[step + 1]
+                + extended_rewards[step]
+            )
+    return returns[:-1]
+
+
+def make_rollout(num_steps: int, value_shape, reward_shape):
+    torch.manual_seed(num_steps)
+    rewards = torch.randn(num_steps, *reward_shape)
+    values = torch.randn(num_steps + 1, *value_shape)
+    masks = (torch.rand(num_steps + 1, *reward_shape) > 0.1).float()
+    return rewards, values, masks
+
+
+class TestReturns(object):
+    def test_matches_legacy_loop(self):
+        gamma, tau = 0.99, 0.95
+        for value_shape, reward_shape in [
+            ((8, 1), (8, 1)),
+            # Multi-agent values with shared rewards
+            ((8, 2, 1), (8, 1)),
+            ((8, 2, 1), (8, 2, 1)),
+        ]:
+            for num_steps in [1, 7, 64]:
+                rewards, values, masks = make_rollout(
+                    num_steps, value_shape, reward_shape
+                )
+                next_value = values[-1]
+
+                expected = legacy_returns(
+                    rewards, values, masks, next_value, True, gamma, tau
+                )
+                returns = compute_gae(rewards, values, masks, gamma, tau) + values[:-1]
+                assert torch.equal(returns, expected)
+
+                expected = legacy_returns(
+                    rewards, values, masks, next_value, False, gamma, tau
+                )
+                returns = compute_discounted_returns(rewards, masks, next_value, gamma)
+                assert torch.equal(returns, expected)
+
+                # Narrowed rollouts (views of the first steps)
+                narrow_steps = max(num_steps // 2, 1)
+                expected = legacy_returns(
+                    rewards[:narrow_steps],
+                    values[: narrow_steps + 1],
+                    masks[: narrow_steps + 1],
+                    values[narrow_steps],
+                    True,
+                    gamma,
+                    tau,
+                )
+                returns = compute_gae(
+                    rewards[:narrow_steps],
+                    values[: narrow_steps + 1],
+                    masks[: narrow_steps + 1],
+                    gamma,
+                    tau,
+                )
+                assert torch.equal(returns + values[:narrow_steps], expected)
+
+    def test_n_step_and_vtrace(self):
+        gamma = 0.9
+        num_steps = 10
+        rewards, values, masks = make_rollout(num_steps, (4, 1), (4, 1))
+
+        # One-step TD targets
+        assert torch.allclose(
+            compute_n_step_returns(rewards, values, masks, gamma, 1),
+            rewards + gamma * masks[1:] * values[1:],
+        )
+        # As many steps as the rollout gives the discounted returns
+        assert torch.allclose(
+            compute_n_step_returns(rewards, values, masks, gamma, num_steps),
+            compute_discounted_returns(rewards, masks, values[-1], gamma),
+        )
+        # Explicit sum for an intermediate `n`
+        n = 3
+        expected = torch.zeros_like(rewards)
+        for t in range(num_steps):
+            discount = torch.ones_like(rewards[0])
+            for k in range(min(n, num_steps - t)):
+                expected[t] += discount * rewards[t + k]
+                discount = discount * gamma * masks[t + k + 1]
+            expected[t] += discount * values[min(t + n, num_steps)]
+        assert torch.allclose(
+            compute_n_step_returns(rewards, values, masks, gamma, n), expected
+        )
+
+        # On-policy V-trace targets are the GAE (lambda-)returns
+        tau = 0.8
+        vs, advantages = compute_vtrace(
+            rewards, values, masks, torch.zeros_like(rewards), gamma, tau=tau
+        )
+        gae = compute_gae(rewards, values, masks, gamma, tau)
+        assert torch.allclose(vs, gae + values[:-1], atol=1e-6)
+        next_vs = torch.cat([vs[1:], values[-1:]])
+        assert torch.allclose(
+            advantages, rewards + gamma * masks[1:] * next_vs - values[:-1]
+        )
+
+        # Truncated importance weights
+        log_rhos = torch.full_like(rewards, 2.0)
+        vs_clipped, _ = compute_vtrace(
+            rewards, values, masks, log_rhos, gamma, rho_clip=1.0, c_clip=1.0
+        )
+        vs_on_policy, _ = compute_vtrace(
+            rewards, values, masks, torch.zeros_like(rewards), gamma
+        )
+        assert torch.allclose(vs_clipped, vs_on_policy)
@@ -0,0 +1,218 @@
+import queue
+from typing import Optional, Sequence
+
+import gym
+import torch
+from torch import nn
+
+from allenact.algorithms.onpolicy_sync.engine import OnPolicyRLEngine, OnPolicyTrainer
+from allenact.algorithms.onpolicy_sync.storage import RolloutStorage
+from allenact.algorithms.onpolicy_sync.vector_sampled_tasks import VectorSampledTasks
+from allenact.base_abstractions.distributions import CategoricalDistr
+from allenact.base_abstractions.experiment_config import MachineParams
+from allenact.base_abstractions.misc import ActorCriticOutput
+from allenact.utils.profiling import PhaseProfiler
+from allenact.utils.tensor_utils import ObservationBatcher
+from tests.multiprocessing.test_vector_sampled_tasks import make_counting_sampler
+
+NUM_SAMPLERS = 4
+
+
+class CountingPolicy(nn.Module):
+    """Deterministic (memoryless) policy for the `CountingTask`s, whose
+    actions depend on the sampler and on the steps taken."""
+
+    action_space = gym.spaces.Discrete(4)
+    recurrent_memory_specification = None
+
+    def forward(self, observations, memory, prev_actions, masks):
+        frame = observations["frame"][..., 0, 0]
+        sampler_ids = observations["nested"]["ids"][..., 0]
+        actions = (frame + sampler_ids).long() % 4
+        return (
+            ActorCriticOutput(
+                distributions=CategoricalDistr(
+                    logits=10.0 * nn.functional.one_hot(actions, 4).float()
+                ),
+                values=frame.unsqueeze(-1),
+                extras={},
+            ),
+            None,
+        )
+
+
+class CollectingTrainer(OnPolicyTrainer):
+    """An `OnPolicyTrainer` with only what is needed to collect rollouts (and
+    acting without the training pipeline)."""
+
+    act = OnPolicyRLEngine.act
+
+    def __init__(
+        self,
+        num_rollout_groups: int = 2,
+        paused_sampler_compaction_threshold: Optional[float] = None,
+        max_tasks: Optional[Sequence[Optional[int]]] = None,
+    ):
+        self.mode = "train"
+        self.worker_id = 0
+        self.device = torch.device("cpu")
+        self.machine_params = MachineParams(
+            nprocesses=NUM_SAMPLERS, num_rollout_groups=num_rollout_groups
+        )
+        self.profiler = PhaseProfiler(enabled=False)
+        self.observation_batcher = ObservationBatcher(device=self.device)
+        self.sensor_preprocessor_graph = None
+        self.actor_critic = CountingPolicy()
+        self.acting_actor_critic = None
+        self.deterministic_agents = True
+        self.paused_sampler_compaction_threshold = paused_sampler_compaction_threshold
+        self.active_samplers = None
+        self.single_process_metrics_queue = queue.Queue()
+        self.worker_timings_info = []
+        self.collection_profiler = self.profiler
+        self.collection_worker_timings_info = self.worker_timings_info
+        self._in_flight_groups = None
+        self._is_closed = False
+        self._vector_tasks = VectorSampledTasks(
+            make_sampler_fn=make_counting_sampler,
+            sampler_fn_args=[
+                {
+                    "sampler_id": i,
+                    "max_steps": 3,
+                    "max_tasks": None if max_tasks is None else max_tasks[i],
+                }
+                for i in range(NUM_SAMPLERS)
+            ],
+            multiprocessing_start_method="fork",
+            should_log=False,
+            max_processes=2,
+        )
+
+
+def collect(num_rollout_groups: Optional[int], num_steps: int) -> RolloutStorage:
+    """Collects a rollout in lock-step (if `num_rollout_groups` is `None`) or
+    with split groups."""
+    rollouts = RolloutStorage(
+        num_steps=num_steps,
+        num_samplers=NUM_SAMPLERS,
+        actor_critic=CountingPolicy(),  # type:ignore
+    )
+    with CollectingTrainer(num_rollout_groups=num_rollout_groups or 1) as engine:
+        engine.initialize_rollouts(rollouts)
+        for step in range(num_steps):
+            if num_rollout_groups is None:
+                num_paused = engine.collect_rollout_step(rollouts)
+            else:
+                num_paused = engine.collect_split_groups_rollout_step(
+                    rollouts, is_last_step=step == num_steps - 1
+                )
+            assert num_paused == 0
+        assert engine._in_flight_groups is None
+    return rollouts
+
+
+def collect_while_pausing(
+    paused_sampler_compaction_threshold: Optional[float], num_steps: int
+):
+    """Collects steps (in lock-step) while the samplers run out of tasks one
+    at a time (sampler `i` after `i + 1` episodes of 3 steps).
+
+    # Returns
+
+    The transitions of the running samplers (by step and sampler id) and
+    the numbers of stored and of active samplers after each step.
+    """
+    rollouts = RolloutStorage(
+        num_steps=num_steps + 1,
+        num_samplers=NUM_SAMPLERS,
+        actor_critic=CountingPolicy(),  # type:ignore
+    )
+    transitions = {}
+    num_samplers = []
+    with CollectingTrainer(
+        paused_sampler_compaction_threshold=paused_sampler_compaction_threshold,
+        max_tasks=[i + 1 for i in range(NUM_SAMPLERS)],
+    ) as engine:
+        engine.initialize_rollouts(rollouts)
+        for _ in range(num_steps):
+            engine.collect_rollout_step(rollouts)
+            step = rollouts.step
+            num_stored = rollouts.masks.shape[1]
+            active = (
+                list(range(num_stored))
+                if engine.active_samplers is None
+                else engine.active_samplers
+            )
+            num_samplers.append((num_stored, len(active)))
+
+            observations = rollouts.pick_observation_step(step, active)
+            sampler_ids = observations["nested"]["ids"][0, :, 0].long().tolist()
+            frames = observations["frame"][0, :, 0, 0].tolist()
+            for sampler_id, frame, sampler in zip(sampler_ids, frames, active):
+                transitions[step, sampler_id] = (
+                    frame,
+                    rollouts.actions[step - 1, sampler].tolist(),
+                    rollouts.rewards[step - 1, sampler].tolist(),
+                    rollouts.masks[step, sampler].tolist(),
+                )
+    return transitions, num_samplers
+
+
+class TestRolloutCollection(object):
+    def test_split_groups_match_lock_step(self):
+        # Episodes of 3 steps, so that the rollout includes episode ends
+        num_steps = 7
+        expected = collect(None, num_steps)
+        for num_rollout_groups in [1, 2]:
+            rollouts = collect(num_rollout_groups, num_steps)
+            assert rollouts.step == expected.step
+            for name in [
+                "actions",
+                "prev_actions",
+                "masks",
+                "rewards",
+                "value_preds",
+                "action_log_probs",
+            ]:
+                assert torch.equal(getattr(rollouts, name), getattr(expected, name))
+            for key in expected.observations:
+                assert torch.equal(
+                    rollouts.observations.tensor(key),
+                    expected.observations.tensor(key),
+                )
+        # The actions depend on the steps taken and differ across samplers
+        assert len(expected.actions.unique()) > 1
+
+    def test_masked_paused_samplers_match_compaction(self):
+        num_steps = 11
+        expected, expected_num_samplers = collect_while_pausing(None, num_steps)
+        transitions, num_samplers = collect_while_pausing(0.5, num_steps)
+        assert transitions == expected
+
+        # Sampler `i` pauses at step `3 * (i + 1)`
+        num_running = [4, 4, 3, 3, 3, 2, 2, 2, 1, 1, 1]
+        assert expected_num_samplers == [(n, n) for n in num_running]
+        # The storage keeps its size until fewer than half the samplers run
+        assert num_samplers == [(4 if n >= 2 else n, n) for n in num_running]
+        assert len(transitions) == sum(num_running)
+
+    def test_split_groups_pausing_reads_pending_steps(self):
+        # The samplers of the second process (i.e. rollout group) run out of tasks
+        # after their first episode (of 3 steps), the first group keeps stepping
+        with CollectingTrainer(max_tasks=[None, None, 1, 1]) as engine:
+            rollouts = RolloutStorage(
+                num_steps=4,
+                num_samplers=NUM_SAMPLERS,
+                actor_critic=CountingPolicy(),  # type:ignore
+            )
+            engine.initialize_rollouts(rollouts)
+            num_paused = [
+                engine.collect_split_groups_rollout_step(rollouts, is_last_step=False)
+                for _ in range(3)
+            ]
+            assert num_paused == [0, 0, 2]
+            assert engine._in_flight_groups is None
+
+            # The (already sent) fourth step of the first group was read, so the
+            # next reply is that of the call (in the second episode of sampler 0)
+            assert engine.vector_tasks.call_at(0, "num_steps_taken") == 1
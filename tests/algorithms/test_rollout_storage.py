@@ -0,0 +1,437 @@
+from typing import Optional
+
+import gym
+import torch
+
+from allenact.algorithms.onpolicy_sync.storage import RolloutStorage, StorageDtype
+from allenact.base_abstractions.misc import Memory
+from allenact.embodiedai.models.basic_models import RNNStateEncoder
+
+
+class StorageTestModel(object):
+    """Provides the attributes of an `ActorCriticModel` used by
+    `RolloutStorage`."""
+
+    action_space = gym.spaces.Discrete(3)
+    recurrent_memory_specification = {
+        "rnn": (
+            (("layer", 1), ("sampler", None), ("hidden", 4)),
+            torch.float32,
+        )
+    }
+
+
+def make_rollouts(num_steps: int = 4, num_samplers: int = 3, **kwargs):
+    return RolloutStorage(
+        num_steps=num_steps,
+        num_samplers=num_samplers,
+        actor_critic=StorageTestModel(),  # type:ignore
+        **kwargs,
+    )
+
+
+def make_observations(num_samplers: int, step: int):
+    return {
+        "rgb": torch.rand(num_samplers, 2, 2, 3),
+        "nested": {"features": torch.randn(num_samplers, 5) * (step + 1)},
+        "target": torch.full((num_samplers, 1), step, dtype=torch.int64),
+    }
+
+
+def insert_step(
+    rollouts: RolloutStorage,
+    num_samplers: int,
+    step: int,
+    masks: Optional[torch.Tensor] = None,
+):
+    observations = make_observations(num_samplers, step)
+    memory = Memory(rnn=(torch.randn(1, num_samplers, 4), 1))
+    rollouts.insert(
+        observations=observations,
+        memory=memory,
+        actions=torch.zeros(num_samplers, 1),
+        action_log_probs=torch.zeros(num_samplers, 1),
+        value_preds=torch.zeros(num_samplers, 1),
+        rewards=torch.ones(num_samplers, 1),
+        masks=torch.ones(num_samplers, 1) if masks is None else masks,
+    )
+    return observations, memory
+
+
+class TestRolloutStorage(object):
+    def test_compact_storage_dtypes(self):
+        rollouts = make_rollouts(
+            observation_dtypes={
+                "rgb": StorageDtype(torch.uint8, 255.0),
+                "nested/features": torch.float16,
+            },
+            memory_dtypes={"rnn": torch.float16},
+        )
+        rollouts.insert_observations(make_observations(3, 0))
+        observations, memory = insert_step(rollouts, 3, 1)
+
+        rgb_key = rollouts.unflattened_to_flattened["observations"][("rgb",)]
+        assert rollouts.observations.tensor(rgb_key).dtype == torch.uint8
+        assert rollouts.memory.tensor("rnn").dtype == torch.float16
+
+        # Values are converted back to their original dtypes when read
+        picked = rollouts.pick_observation_step(1)
+        assert picked["rgb"].dtype == torch.float32
+        assert (picked["rgb"][0] - observations["rgb"]).abs().max() <= 0.5 / 255
+        assert picked["nested"]["features"].dtype == torch.float32
+        assert torch.allclose(
+            picked["nested"]["features"][0],
+            observations["nested"]["features"],
+            rtol=1e-3,
+            atol=1e-3,
+        )
+        assert torch.equal(picked["target"][0], observations["target"])
+
+        picked_memory = rollouts.pick_memory_step(1)
+        assert picked_memory.tensor("rnn").dtype == torch.float32
+        assert torch.allclose(
+            picked_memory.tensor("rnn"), memory.tensor("rnn"), rtol=1e-3, atol=1e-3
+        )
+
+        nbytes = rollouts.nbytes_by_key()
+        assert nbytes["observations/rgb"] == 5 * 3 * 2 * 2 * 3
+        assert nbytes["observations/nested/features"] == 5 * 3 * 5 * 2
+        assert nbytes["observations/target"] == 5 * 3 * 8
+        assert nbytes["memory/rnn"] == 2 * 3 * 4 * 2
+        assert nbytes["rewards"] == 4 * 3 * 4
+
+    def test_recurrent_generator_modes(self):
+        num_steps, num_samplers = 4, 5
+        rollouts = make_rollouts(num_steps=num_steps, num_samplers=num_samplers)
+        rollouts.insert_observations(make_observations(num_samplers, 0))
+        for step in range(num_steps):
+            insert_step(rollouts, num_samplers, step + 1)
+        rollouts.returns.normal_()
+        advantages = rollouts.returns[:-1] - rollouts.value_preds[:-1]
+
+        for shuffle_samplers, zero_copy in [
+            (False, False),
+            (True, False),
+            (False, True),
+        ]:
+            seen = []
+            for batch in rollouts.recurrent_generator(
+                advantages, 2, shuffle_samplers=shuffle_samplers, zero_copy=zero_copy
+            ):
+                # Identify the samplers of the minibatch by their features
+                features = batch["observations"]["nested"]["features"]
+                stored = rollouts.observations.tensor(
+                    rollouts.unflattened_to_flattened["observations"][
+                        ("nested", "features")
+                    ]
+                )[:-1]
+                samplers = [
+                    next(
+                        s
+                        for s in range(num_samplers)
+                        if torch.equal(stored[:, s], features[:, i])
+                    )
+                    for i in range(features.shape[1])
+                ]
+                seen.extend(samplers)
+                if not shuffle_samplers:
+                    assert samplers == list(range(samplers[0], samplers[-1] + 1))
+
+                assert torch.equal(batch["returns"], rollouts.returns[:-1, samplers])
+                assert torch.equal(batch["adv_targ"], advantages[:, samplers])
+                assert torch.equal(
+                    batch["memory"].tensor("rnn"),
+                    rollouts.memory.tensor("rnn")[0][:, samplers],
+                )
+                assert batch["actions"].shape == (num_steps, len(samplers))
+            assert sorted(seen) == list(range(num_samplers))
+
+    def test_feed_forward_generator(self):
+        num_steps, num_samplers = 4, 3
+
+        class MemorylessModel(StorageTestModel):
+            recurrent_memory_specification = None
+
+        rollouts = RolloutStorage(
+            num_steps=num_steps,
+            num_samplers=num_samplers,
+            actor_critic=MemorylessModel(),  # type:ignore
+        )
+        rollouts.insert_observations(make_observations(num_samplers, 0))
+        for step in range(num_steps):
+            observations = make_observations(num_samplers, step + 1)
+            rollouts.insert(
+                observations=observations,
+                memory=None,
+                actions=torch.zeros(num_samplers, 1),
+                action_log_probs=torch.zeros(num_samplers, 1),
+                value_preds=torch.zeros(num_samplers, 1),
+                rewards=torch.ones(num_samplers, 1),
+                masks=torch.ones(num_samplers, 1),
+            )
+        rollouts.returns.normal_()
+        advantages = rollouts.returns[:-1] - rollouts.value_preds[:-1]
+
+        # More minibatches than samplers
+        batches = [
+            {
+                "target": batch["observations"]["target"].clone(),
+                "returns": batch["returns"].clone(),
+            }
+            for batch in rollouts.feed_forward_generator(advantages, 5)
+        ]
+        assert [b["returns"].shape[:2] for b in batches] == [
+            (1, n) for n in [2, 3, 2, 3, 2]
+        ]
+
+        # Every transition (identified by its step and return) appears once
+        targets = torch.cat([b["target"][0, :, 0] for b in batches])
+        returns = torch.cat([b["returns"][0, :, 0] for b in batches])
+        assert sorted(zip(targets.tolist(), returns.tolist())) == sorted(
+            (step, rollouts.returns[step, sampler, 0].item())
+            for step in range(num_steps)
+            for sampler in range(num_samplers)
+        )
+
+    def test_chunked_recurrent_generator(self):
+        num_steps, num_samplers, chunk_length = 5, 3, 2
+        rollouts = make_rollouts(
+            num_steps=num_steps,
+            num_samplers=num_samplers,
+            memory_chunk_length=chunk_length,
+        )
+        # Memory for the start of the chunks and the latest step
+        assert rollouts.memory.tensor("rnn").shape[0] == 4
+
+        def memory_at(step: int) -> Memory:
+            # The hidden state of sampler `s` at step `t` is `t + 10 * s`
+            values = torch.arange(num_samplers).float() * 10 + step
+            return Memory(rnn=(values.view(1, num_samplers, 1).repeat(1, 1, 4), 1))
+
+        rollouts.insert_observations(make_observations(num_samplers, 0))
+        rollouts.insert_memory(memory_at(0), 0)
+        for step in range(num_steps):
+            rollouts.insert(
+                observations=make_observations(num_samplers, step + 1),
+                memory=memory_at(step + 1),
+                actions=torch.zeros(num_samplers, 1),
+                action_log_probs=torch.zeros(num_samplers, 1),
+                value_preds=torch.zeros(num_samplers, 1),
+                rewards=torch.ones(num_samplers, 1),
+                masks=torch.ones(num_samplers, 1),
+            )
+        latest = rollouts.pick_memory_step(num_steps).tensor("rnn")
+        assert latest[0, :, 0].tolist() == [5.0, 15.0, 25.0]
+        rollouts.returns.normal_()
+        advantages = rollouts.returns[:-1] - rollouts.value_preds[:-1]
+
+        batches = list(rollouts.chunked_recurrent_generator(advantages, 2))
+        # Two minibatches of (3 + 3) full chunks plus the last steps of all samplers
+        assert [b["masks"].shape[:2] for b in batches] == [(2, 3), (2, 3), (1, 3)]
+
+        chunk_starts = []
+        for batch in batches:
+            for i in range(batch["masks"].shape[1]):
+                hidden = batch["memory"].tensor("rnn")[0, i, 0].item()
+                start, sampler = int(hidden) % 10, int(hidden) // 10
+                chunk_starts.append((start, sampler))
+
+                length = batch["masks"].shape[0]
+                assert batch["observations"]["target"][:, i, 0].tolist() == list(
+                    range(start, start + length)
+                )
+                assert torch.equal(
+                    batch["returns"][:, i],
+                    rollouts.returns[start : start + length, sampler],
+                )
+        assert sorted(chunk_starts) == [
+            (start, sampler) for start in [0, 2, 4] for sampler in range(3)
+        ]
+
+    def test_episode_starts(self):
+        num_steps, num_samplers = 6, 4
+        rollouts = make_rollouts(num_steps=num_steps, num_samplers=num_samplers)
+        rollouts.insert_observations(make_observations(num_samplers, 0))
+        # Sampler 0 never restarts, the others restart at different steps
+        restarts = {1: [3], 2: [1, 2, 5], 3: [4]}
+        for step in range(num_steps):
+            masks = torch.ones(num_samplers, 1)
+            for sampler, steps in restarts.items():
+                if step + 1 in steps:
+                    masks[sampler] = 0.0
+            insert_step(rollouts, num_samplers, step + 1, masks=masks)
+        rollouts.returns.normal_()
+        advantages = rollouts.returns[:-1] - rollouts.value_preds[:-1]
+
+        (batch,) = rollouts.recurrent_generator(advantages, 1)
+        assert batch["episode_starts"].device == torch.device("cpu")
+        assert torch.equal(batch["episode_starts"], batch["masks"][..., 0] == 0)
+
+        for rnn_type in ["GRU", "LSTM"]:
+            encoder = RNNStateEncoder(5, 4, rnn_type=rnn_type)
+            x = torch.randn(num_steps, num_samplers, 5)
+            hidden = torch.randn(encoder.num_recurrent_layers, num_samplers, 4)
+
+            # Reference: step by step
+            expected_outputs = []
+            expected_hidden = hidden
+            for step in range(num_steps):
+                out, expected_hidden = encoder(
+                    x[step : step + 1], expected_hidden, batch["masks"][step : step + 1]
+                )
+                expected_outputs.append(out)
+            expected = torch.cat(expected_outputs, dim=0)
+
+            for episode_starts in [None, batch["episode_starts"]]:
+                outputs, final_hidden = encoder(
+                    x, hidden, batch["masks"], episode_starts=episode_starts
+                )
+                assert torch.allclose(outputs, expected, atol=1e-5)
+                assert torch.allclose(final_hidden, expected_hidden, atol=1e-5)
+
+    def test_vtrace_returns_and_continue_from(self):
+        num_steps, num_samplers = 5, 3
+        rollouts = make_rollouts(num_steps=num_steps, num_samplers=num_samplers)
+        rollouts.insert_observations(make_observations(num_samplers, 0))
+        for step in range(num_steps):
+            masks = torch.ones(num_samplers, 1)
+            masks[step % num_samplers] = 0.0
+            insert_step(rollouts, num_samplers, step + 1, masks=masks)
+        rollouts.rewards.normal_()
+        rollouts.action_log_probs.normal_()
+
+        # With the behaviour policy as learner, the targets are the GAE returns
+        values = torch.randn(num_steps + 1, num_samplers, 1)
+        behaviour_log_probs = rollouts.action_log_probs.clone()
+        rollouts.compute_vtrace_returns(values, behaviour_log_probs, gamma=0.9, tau=0.8)
+        vtrace_returns = rollouts.returns.clone()
+        rollouts.compute_returns(values[-1], use_gae=True, gamma=0.9, tau=0.8)
+        assert torch.allclose(vtrace_returns[:-1], rollouts.returns[:-1], atol=1e-6)
+        assert torch.equal(rollouts.value_preds, values)
+
+        # The learner log probabilities replace the stored ones
+        learner_log_probs = behaviour_log_probs - 1.0
+        advantages = rollouts.compute_vtrace_returns(
+            values, learner_log_probs, gamma=0.9, tau=0.8
+        )
+        assert advantages.shape == (num_steps, num_samplers, 1)
+        assert torch.equal(rollouts.action_log_probs, learner_log_probs)
+
+        # A new rollout starts from the last step of the previous one
+        next_rollouts = make_rollouts(num_steps=num_steps, num_samplers=num_samplers)
+        next_rollouts.continue_from(rollouts)
+        assert next_rollouts.step == 0
+        assert torch.equal(next_rollouts.masks[0], rollouts.masks[-1])
+        assert torch.equal(
+            next_rollouts.pick_observation_step(0)["nested"]["features"],
+            rollouts.pick_observation_step(-1)["nested"]["features"],
+        )
+        assert torch.equal(
+            next_rollouts.pick_memory_step(0).tensor("rnn"),
+            rollouts.pick_memory_step(-1).tensor("rnn"),
+        )
+
+    def test_per_sampler_steps(self):
+        num_steps, num_samplers = 4, 3
+
+        def select(observations, samplers):
+            return {
+                key: select(value, samplers)
+                if isinstance(value, dict)
+                else value[samplers]
+                for key, value in observations.items()
+            }
+
+        initial_observations = make_observations(num_samplers, 0)
+        transitions = [
+            dict(
+                observations=make_observations(num_samplers, step + 1),
+                memory=torch.randn(1, num_samplers, 4),
+                actions=torch.randint(3, (num_samplers, 1)).float(),
+                action_log_probs=torch.randn(num_samplers, 1),
+                value_preds=torch.randn(num_samplers, 1),
+                rewards=torch.randn(num_samplers, 1),
+                masks=(torch.rand(num_samplers, 1) > 0.5).float(),
+            )
+            for step in range(2)
+        ]
+
+        def insert(rollouts: RolloutStorage, step: int, samplers=None):
+            inds = list(range(num_samplers)) if samplers is None else samplers
+            transition = transitions[step]
+            rollouts.insert(
+                observations=select(transition["observations"], inds),
+                memory=Memory(rnn=(transition["memory"][:, inds], 1)),
+                **{
+                    name: transition[name][inds]
+                    for name in [
+                        "actions",
+                        "action_log_probs",
+                        "value_preds",
+                        "rewards",
+                        "masks",
+                    ]
+                },
+                samplers=samplers,
+            )
+
+        # Reference: all samplers in lock-step
+        expected = make_rollouts(num_steps=num_steps, num_samplers=num_samplers)
+        expected.insert_observations(initial_observations)
+        for step in range(2):
+            insert(expected, step)
+
+        # Samplers progressing at different rates (and in any order)
+        rollouts = make_rollouts(num_steps=num_steps, num_samplers=num_samplers)
+        rollouts.insert_observations(initial_observations)
+        rollouts.start_per_sampler_steps()
+        insert(rollouts, 0, [0])
+        insert(rollouts, 1, [0])
+        insert(rollouts, 0, [2, 1])
+        assert rollouts.sampler_steps == [2, 1, 1]
+
+        # Samplers are picked at their own steps
+        sampler_steps = list(rollouts.sampler_steps)
+        picked = rollouts.pick_observation_step(sampler_steps, [0, 1, 2])
+        for sampler, step in enumerate(sampler_steps):
+            assert torch.equal(
+                picked["nested"]["features"][0, sampler],
+                transitions[step - 1]["observations"]["nested"]["features"][sampler],
+            )
+        picked_memory = rollouts.pick_memory_step([1, 2], [1, 0])
+        assert torch.equal(
+            picked_memory.tensor("rnn")[:, 1], transitions[1]["memory"][:, 0]
+        )
+        assert torch.equal(
+            rollouts.pick_masks_step([1], [2])[0],
+            transitions[0]["masks"][[2]],
+        )
+
+        insert(rollouts, 1, [1, 2])
+        rollouts.finish_per_sampler_steps()
+        assert rollouts.sampler_steps is None and rollouts.step == expected.step
+
+        for name in [
+            "actions",
+            "prev_actions",
+            "masks",
+            "rewards",
+            "value_preds",
+            "action_log_probs",
+        ]:
+            assert torch.equal(getattr(rollouts, name), getattr(expected, name))
+        for key in expected.observations:
+            assert torch.equal(
+                rollouts.observations.tensor(key), expected.observations.tensor(key)
+            )
+        assert torch.equal(rollouts.memory.tensor("rnn"), expected.memory.tensor("rnn"))
+
+        # Replacing the observations of a subset of the samplers
+        replacement = make_observations(1, 0)
+        rollouts.insert_observations(replacement, time_step=rollouts.step, samplers=[1])
+        picked = rollouts.pick_observation_step(rollouts.step)
+        assert torch.equal(picked["target"][0, 1], replacement["target"][0])
+        assert torch.equal(
+            picked["target"][0, [0, 2]],
+            transitions[1]["observations"]["target"][[0, 2]],
+        )
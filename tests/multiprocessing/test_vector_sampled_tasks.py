@@ -0,0 +1,498 @@
+import time
+from typing import Any, Optional, Tuple
+
+import gym
+import numpy as np
+import pytest
+import torch
+from gym.spaces.dict import Dict as SpaceDict
+
+from allenact.algorithms.onpolicy_sync.out_of_band_connection import (
+    OUT_OF_BAND_PICKLING_AVAILABLE,
+)
+from allenact.algorithms.onpolicy_sync.vector_sampled_tasks import (
+    VectorSampledTasks,
+    ThreadedVectorSampledTasks,
+    COMPLETE_TASK_METRICS_KEY,
+    WORKER_TIMINGS_KEY,
+)
+from allenact.base_abstractions.misc import (
+    RLStepResult,
+    BatchedStepResult,
+    StackedStepResults,
+)
+from allenact.base_abstractions.task import Task, TaskSampler, BatchedTaskSampler
+from allenact.utils.system import imported_module_names
+
+
+class CountingTask(Task):
+    """Task whose observations encode the number of steps taken and the last
+    action, useful for checking that results come back from the right
+    sampler."""
+
+    def __init__(
+        self, sampler_id: int, task_id: int, max_steps: int, step_delay: float = 0.0
+    ):
+        super().__init__(env=None, sensors=[], task_info={}, max_steps=max_steps)
+        self.sampler_id = sampler_id
+        self.step_delay = step_delay
+        self.task_id = task_id
+        self.observation_space = SpaceDict(
+            {
+                "frame": gym.spaces.Box(
+                    low=0, high=np.inf, shape=(2, 3), dtype=np.float32
+                ),
+                "nested": SpaceDict(
+                    {"ids": gym.spaces.Box(low=0, high=np.inf, shape=(2,))}
+                ),
+                "parity": gym.spaces.Discrete(2),
+            }
+        )
+        self.last_action = 0
+
+    @property
+    def action_space(self) -> gym.Space:
+        return gym.spaces.Discrete(4)
+
+    def get_observations(self, **kwargs) -> Any:
+        return {
+            "frame": np.full(
+                (2, 3), 10 * self.num_steps_taken() + self.last_action, np.float32
+            ),
+            "nested": {"ids": np.array([self.sampler_id, self.task_id], np.float32)},
+            "parity": self.num_steps_taken() % 2,
+        }
+
+    def _step(self, action: int) -> RLStepResult:
+        time.sleep(self.step_delay)
+        self.last_action = action
+        self._num_steps_taken += 1
+        obs = self.get_observations()
+        self._num_steps_taken -= 1
+        return RLStepResult(
+            observation=obs,
+            reward=float(action + self.sampler_id),
+            done=False,
+            info={"sampler_id": self.sampler_id},
+        )
+
+    def render(self, mode: str = "rgb", *args, **kwargs) -> np.ndarray:
+        return np.zeros((2, 2, 3), dtype=np.uint8)
+
+    def reached_terminal_state(self) -> bool:
+        return False
+
+    @classmethod
+    def class_action_names(cls, **kwargs) -> Tuple[str, ...]:
+        return ("a", "b", "c", "d")
+
+    def close(self) -> None:
+        pass
+
+
+class CountingTaskSampler(TaskSampler):
+    def __init__(
+        self,
+        sampler_id: int,
+        max_steps: int = 3,
+        max_tasks: Optional[int] = None,
+        step_delay: float = 0.0,
+        **kwargs
+    ):
+        self.sampler_id = sampler_id
+        self.step_delay = step_delay
+        self.max_steps = max_steps
+        self.max_tasks = max_tasks
+        self.num_tasks = 0
+        self._last_task: Optional[CountingTask] = None
+
+    @property
+    def length(self):
+        return (
+            float("inf") if self.max_tasks is None else self.max_tasks - self.num_tasks
+        )
+
+    @property
+    def last_sampled_task(self) -> Optional[Task]:
+        return self._last_task
+
+    def next_task(self, force_advance_scene: bool = False) -> Optional[Task]:
+        if self.max_tasks is not None and self.num_tasks >= self.max_tasks:
+            return None
+        self._last_task = CountingTask(
+            sampler_id=self.sampler_id,
+            task_id=self.num_tasks,
+            max_steps=self.max_steps,
+            step_delay=self.step_delay,
+        )
+        self.num_tasks += 1
+        return self._last_task
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def all_observation_spaces_equal(self) -> bool:
+        return True
+
+    def reset(self) -> None:
+        self.num_tasks = 0
+
+    def set_seed(self, seed: int) -> None:
+        pass
+
+    def get_state(self) -> Optional[Any]:
+        return self.num_tasks
+
+    def set_state(self, state: Any) -> None:
+        self.num_tasks = state
+
+
+def make_counting_sampler(**kwargs) -> CountingTaskSampler:
+    return CountingTaskSampler(**kwargs)
+
+
+class CountingBatchedTaskSampler(BatchedTaskSampler):
+    """Batched counterpart of `CountingTaskSampler` (episodes of `max_steps`
+    steps, at most `max_tasks` tasks per environment)."""
+
+    def __init__(self, sampler_fn_args_list):
+        self.sampler_ids = np.array([a["sampler_id"] for a in sampler_fn_args_list])
+        self.max_steps = np.array(
+            [a.get("max_steps", 3) for a in sampler_fn_args_list]
+        )
+        self.max_tasks = np.array(
+            [a.get("max_tasks", np.inf) for a in sampler_fn_args_list]
+        )
+        self.num_tasks = np.ones(len(sampler_fn_args_list))
+        self.steps = np.zeros(len(sampler_fn_args_list), dtype=np.int64)
+
+    @property
+    def num_envs(self) -> int:
+        return len(self.sampler_ids)
+
+    @property
+    def observation_space(self) -> gym.Space:
+        return SpaceDict({"steps": gym.spaces.Box(low=0, high=np.inf, shape=(1,))})
+
+    @property
+    def action_space(self) -> gym.Space:
+        return gym.spaces.Discrete(4)
+
+    @property
+    def has_task(self) -> np.ndarray:
+        return self.num_tasks <= self.max_tasks
+
+    def get_observations(self) -> Any:
+        return {"steps": self.steps[:, None].astype(np.float32)}
+
+    def step(self, actions: np.ndarray, env_indices=None) -> BatchedStepResult:
+        envs = (
+            np.arange(self.num_envs) if env_indices is None else np.array(env_indices)
+        )
+        self.steps[envs] += 1
+        dones = self.steps[envs] == self.max_steps[envs]
+        metrics = [
+            {"ep_length": int(s)} if d else None
+            for s, d in zip(self.steps[envs], dones)
+        ]
+        self.num_tasks[envs[dones]] += 1
+        self.steps[envs[dones]] = 0
+        return BatchedStepResult(
+            observations={"steps": self.steps[envs, None].astype(np.float32)},
+            rewards=(actions + self.sampler_ids[envs]).astype(np.float32),
+            dones=dones,
+            infos=[{"sampler_id": i} for i in self.sampler_ids[envs]],
+            metrics=metrics,
+        )
+
+    def next_task(self, env_indices, force_advance_scene: bool = False) -> None:
+        self.num_tasks[env_indices] += 1
+        self.steps[env_indices] = 0
+
+    def reset(self) -> None:
+        self.num_tasks[:] = 1
+        self.steps[:] = 0
+
+    def set_seeds(self, env_indices, seeds) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def make_counting_batched_sampler(**kwargs) -> CountingBatchedTaskSampler:
+    return CountingBatchedTaskSampler(**kwargs)
+
+
+class TestVectorSampledTasks(object):
+    def _run_episodes(
+        self, transport: str, vst_class=VectorSampledTasks, flat_actions: bool = False
+    ):
+        vst = vst_class(
+            make_sampler_fn=make_counting_sampler,
+            sampler_fn_args=[
+                {"sampler_id": i, "max_steps": 3, "max_tasks": 1 + (i % 2)}
+                for i in range(4)
+            ],
+            multiprocessing_start_method="fork",
+            should_log=False,
+            max_processes=2,
+            transport=transport,
+        )
+        history = []
+        try:
+            for _ in range(7):
+                ids = list(range(vst.num_unpaused_tasks))
+                actions = [(i + 1) % 4 for i in ids]
+                if flat_actions:
+                    # Flattened `Discrete` actions, decoded by the workers
+                    results = vst.step(
+                        np.array(actions, dtype=np.int64).reshape(-1, 1),
+                        flat_action_space=gym.spaces.Discrete(4),
+                    )
+                else:
+                    results = vst.step(actions)
+                history.append(
+                    [
+                        (
+                            None
+                            if r.observation is None
+                            else (
+                                torch.as_tensor(r.observation["frame"]).tolist(),
+                                torch.as_tensor(
+                                    r.observation["nested"]["ids"]
+                                ).tolist(),
+                                r.observation["parity"],
+                            ),
+                            r.reward,
+                            r.done,
+                            r.info["sampler_id"],
+                            COMPLETE_TASK_METRICS_KEY in r.info,
+                        )
+                        for r in results
+                    ]
+                )
+                for it in reversed(
+                    [i for i, r in enumerate(results) if r.observation is None]
+                ):
+                    vst.pause_at(it)
+                if vst.num_unpaused_tasks == 0:
+                    break
+            vst.resume_all()
+            vst.reset_all()
+            history.append([r["nested"]["ids"][0] for r in vst.get_observations()])
+        finally:
+            vst.close()
+        return history
+
+    def test_shared_memory_transport_matches_pipe(self):
+        pipe_history = self._run_episodes("pipe")
+        shm_history = self._run_episodes("shared_memory")
+
+        assert pipe_history == shm_history
+        if OUT_OF_BAND_PICKLING_AVAILABLE:
+            assert pipe_history == self._run_episodes("pickle5")
+        else:
+            # Requires python>=3.8 or the `pickle5` package
+            with pytest.raises(ImportError):
+                self._run_episodes("pickle5")
+        assert pipe_history == self._run_episodes("pipe", ThreadedVectorSampledTasks)
+        for transport in ["pipe", "shared_memory"]:
+            assert pipe_history == self._run_episodes(transport, flat_actions=True)
+        # Samplers with a single task stop after their first episode
+        assert [len(h) for h in pipe_history[:-1]] == [4, 4, 4, 2, 2, 2]
+        assert pipe_history[-1] == [0, 1, 2, 3]
+
+    def test_parallel_startup(self):
+        vst = VectorSampledTasks(
+            make_sampler_fn=make_counting_sampler,
+            sampler_fn_args=[{"sampler_id": i, "max_steps": 3} for i in range(4)],
+            multiprocessing_start_method="forkserver",
+            should_log=False,
+            max_processes=2,
+            parallel_startup=True,
+            forkserver_preload=imported_module_names(CountingTaskSampler),
+        )
+        try:
+            assert len(vst.action_spaces) == 4
+            assert "frame" in vst.observation_space.spaces
+            assert [r["nested"]["ids"][0] for r in vst.get_observations()] == [
+                0,
+                1,
+                2,
+                3,
+            ]
+        finally:
+            vst.close()
+
+    def test_worker_timings(self):
+        vst = VectorSampledTasks(
+            make_sampler_fn=make_counting_sampler,
+            sampler_fn_args=[{"sampler_id": i, "max_steps": 100} for i in range(4)],
+            multiprocessing_start_method="fork",
+            should_log=False,
+            max_processes=2,
+            worker_timing_period=2,
+        )
+        try:
+            reports = []
+            for _ in range(4):
+                reports.append(
+                    [r.info.get(WORKER_TIMINGS_KEY) for r in vst.step([0, 1, 2, 3])]
+                )
+        finally:
+            vst.close()
+
+        assert all(r is None for r in reports[0] + reports[2])
+        # Each report only includes the steps taken since the previous one
+        for step_reports in [reports[1], reports[3]]:
+            assert all(
+                report["step"][1] == 2 and report["get_observations"][1] == 2
+                for report in step_reports
+            )
+            # Process-level timings go with the first sampler of each process
+            assert ["pipe_wait" in report for report in step_reports] == [
+                True,
+                False,
+                True,
+                False,
+            ]
+
+    def test_batched_task_samplers(self):
+        vst = VectorSampledTasks(
+            make_sampler_fn=make_counting_sampler,
+            sampler_fn_args=[
+                {"sampler_id": i, "max_steps": 2, "max_tasks": 1 + (i % 2)}
+                for i in range(4)
+            ],
+            multiprocessing_start_method="fork",
+            should_log=False,
+            max_processes=2,
+            make_batched_sampler_fn=make_counting_batched_sampler,
+        )
+        try:
+            assert vst.attr("num_envs") == [2, 2, 2, 2]
+            results = vst.step([1, 1, 1, 1])
+            # The stacked results of both processes
+            assert isinstance(results, StackedStepResults)
+            assert results.observations.stacked["steps"].shape == (4, 1)
+            assert [r.reward for r in results] == [1.0, 2.0, 3.0, 4.0]
+            assert [r.observation["steps"][0] for r in results] == [1.0] * 4
+            assert not any(COMPLETE_TASK_METRICS_KEY in r.info for r in results)
+
+            # Samplers with a single task run out of tasks after their first episode
+            results = vst.step([0, 0, 0, 0])
+            assert [r.done for r in results] == [True] * 4
+            assert [r.observation is None for r in results] == [True, False] * 2
+            assert [r.info[COMPLETE_TASK_METRICS_KEY] for r in results] == [
+                {"ep_length": 2}
+            ] * 4
+            vst.pause_at(2)
+            vst.pause_at(0)
+
+            results = vst.step([2, 2])
+            assert [r.info["sampler_id"] for r in results] == [1, 3]
+            assert [r.reward for r in results] == [3.0, 5.0]
+
+            # Paused environments are not stepped
+            vst.resume_all()
+            steps = [o["steps"][0] for o in vst.get_observations()]
+            assert steps == [0.0, 1.0, 0.0, 1.0]
+            vst.reset_all()
+            assert [o["steps"][0] for o in vst.get_observations()] == [0.0] * 4
+        finally:
+            vst.close()
+
+    def test_wait_step_ready_returns_fast_processes_first(self):
+        for vst_class in [VectorSampledTasks, ThreadedVectorSampledTasks]:
+            self._check_wait_step_ready(vst_class)
+
+    def _check_wait_step_ready(self, vst_class):
+        vst = vst_class(
+            make_sampler_fn=make_counting_sampler,
+            sampler_fn_args=[
+                {"sampler_id": i, "max_steps": 100, "step_delay": 1.0 * (i == 0)}
+                for i in range(4)
+            ],
+            multiprocessing_start_method="fork",
+            should_log=False,
+            max_processes=2,
+        )
+        try:
+            vst.async_step([0, 1, 2, 3])
+            ready = vst.wait_step_ready()
+            assert [process_ind for process_ind, _ in ready] == [1]
+            assert [r.info["sampler_id"] for r in ready[0][1]] == [2, 3]
+
+            # Process 1 can be stepped again while process 0 is still busy
+            vst.async_step([1, 1], process_inds=[1])
+            assert [r.reward for r in vst.wait_step([1])] == [3.0, 4.0]
+
+            ready = vst.wait_step_ready()
+            assert [process_ind for process_ind, _ in ready] == [0]
+            assert [r.reward for r in ready[0][1]] == [0.0, 2.0]
+        finally:
+            vst.close()
+
+    def test_rebalance_moves_samplers_off_slow_process(self):
+        for transport in ["pipe", "shared_memory"]:
+            vst = VectorSampledTasks(
+                make_sampler_fn=make_counting_sampler,
+                sampler_fn_args=[
+                    {"sampler_id": i, "max_steps": 100, "step_delay": 0.02 * (i < 2)}
+                    for i in range(4)
+                ],
+                multiprocessing_start_method="fork",
+                should_log=False,
+                max_processes=2,
+                transport=transport,
+                measure_sampler_latencies=True,
+            )
+            try:
+                # Samplers are on their third task
+                for _ in range(2):
+                    vst.next_task()
+                for _ in range(3):
+                    vst.step([0, 0, 0, 0])
+
+                histograms = vst.latency_histograms()
+                assert histograms["step"].sum() == 12
+                assert histograms["reset"].sum() == 12
+
+                migrated = vst.rebalance()
+                assert len(migrated) == 1 and migrated[0] in [0, 1]
+                mapping = vst.sampler_index_to_process_ind_and_subprocess_ind
+                assert [process_ind for process_ind, _ in mapping].count(1) == 3
+
+                # Results still come back in sampler order, the migrated sampler
+                # having moved on to its next task (rather than its first one)
+                results = vst.step([1, 1, 1, 1])
+                assert [r.reward for r in results] == [1.0, 2.0, 3.0, 4.0]
+                assert [r.observation["frame"][0, 0] for r in results] == [
+                    11.0 if i in migrated else 41.0 for i in range(4)
+                ]
+                assert [r.observation["nested"]["ids"][1] for r in results] == [
+                    3.0 if i in migrated else 2.0 for i in range(4)
+                ]
+                assert vst.latency_stats()[migrated[0]].num_steps == 1
+            finally:
+                vst.close()
+
+    def test_latencies_not_measured_by_default(self):
+        vst = VectorSampledTasks(
+            make_sampler_fn=make_counting_sampler,
+            sampler_fn_args=[{"sampler_id": i, "max_steps": 100} for i in range(4)],
+            multiprocessing_start_method="fork",
+            should_log=False,
+            max_processes=2,
+        )
+        try:
+            vst.next_task()
+            vst.step([0, 0, 0, 0])
+            assert all(stats.num_steps == 0 for stats in vst.latency_stats())
+            histograms = vst.latency_histograms()
+            assert histograms["step"].sum() == 0
+            assert histograms["reset"].sum() == 0
+        finally:
+            vst.close()
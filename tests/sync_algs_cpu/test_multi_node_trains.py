@@ -0,0 +1,74 @@
+import glob
+import multiprocessing as mp
+import os
+
+from allenact.algorithms.onpolicy_sync.runner import OnPolicyRunner
+from allenact.base_abstractions.experiment_config import MachineParams
+from allenact.utils.system import find_free_port
+from projects.babyai_baselines.experiments.go_to_obj.ppo import (
+    PPOBabyAIGoToObjExperimentConfig,
+)
+
+NUM_NODES = 2
+
+
+class TwoTrainersGoToObjExperimentConfig(PPOBabyAIGoToObjExperimentConfig):
+    TOTAL_RL_TRAIN_STEPS = 2048
+    NUM_TRAIN_SAMPLERS = 4
+    NUM_CKPTS_TO_SAVE = 2
+
+    @classmethod
+    def machine_params(cls, mode="train", **kwargs):
+        if mode == "train":
+            # Two CPU trainers (with two samplers each) across all nodes
+            return MachineParams(nprocesses=[2, 2], devices=["cpu", "cpu"])
+        return super().machine_params(mode=mode, **kwargs)
+
+
+def run_node(node_rank: int, output_dir: str, master_port: int):
+    OnPolicyRunner(
+        config=TwoTrainersGoToObjExperimentConfig(),
+        output_dir=output_dir,
+        loaded_config_src_files=None,
+        seed=1,
+        mode="train",
+        deterministic_cudnn=True,
+    ).start_train(
+        max_sampler_processes_per_worker=1,
+        node_rank=node_rank,
+        num_nodes=NUM_NODES,
+        master_address="127.0.0.1",
+        master_port=master_port,
+    )
+
+
+class TestMultiNodeTrains(object):
+    def test_two_nodes_train(self, tmpdir):
+        # Every "node" is a runner with its own output directory on this machine
+        output_dirs = [
+            str(tmpdir.mkdir("node{}".format(node_rank)))
+            for node_rank in range(NUM_NODES)
+        ]
+        port = find_free_port()
+
+        ctx = mp.get_context("fork")
+        nodes = [
+            ctx.Process(target=run_node, args=(node_rank, output_dirs[node_rank], port))
+            for node_rank in range(NUM_NODES)
+        ]
+        for node in nodes:
+            node.start()
+        for node in nodes:
+            node.join(timeout=600)
+            assert node.exitcode == 0
+
+        # Only node 0 (with the trainer of global rank 0) writes checkpoints
+        def checkpoints(output_dir: str):
+            return glob.glob(
+                os.path.join(output_dir, "checkpoints", "**", "*.pt"), recursive=True
+            )
+
+        assert len(checkpoints(output_dirs[0])) > 0
+        for output_dir in output_dirs[1:]:
+            assert len(checkpoints(output_dir)) == 0
+            assert not os.path.exists(os.path.join(output_dir, "used_configs"))
@@ -0,0 +1,79 @@
+import numpy as np
+import torch
+
+from allenact.base_abstractions.misc import StackedObservations
+from allenact.utils.tensor_utils import ObservationBatcher, batch_observations
+
+
+def make_observation(step: int, sampler: int):
+    return {
+        "rgb": np.full((4, 4, 3), step + sampler, dtype=np.uint8),
+        "goal": {
+            "position": np.array([step, sampler], dtype=np.float32),
+            "index": step * 10 + sampler,
+        },
+        "embedding": torch.full((5,), float(sampler)),
+    }
+
+
+def assert_equal_batches(batch, expected):
+    assert batch.keys() == expected.keys()
+    for key in expected:
+        if isinstance(expected[key], dict):
+            assert_equal_batches(batch[key], expected[key])
+        else:
+            assert batch[key].dtype == expected[key].dtype
+            assert torch.equal(batch[key], expected[key])
+
+
+class TestObservationBatcher(object):
+    def test_matches_batch_observations(self):
+        batcher = ObservationBatcher()
+        # The number of samplers decreases as samplers are paused
+        for step, num_samplers in enumerate([4, 4, 3, 1]):
+            observations = [make_observation(step, s) for s in range(num_samplers)]
+            assert_equal_batches(
+                batcher.batch(observations), batch_observations(observations)
+            )
+        assert batcher.batch([]) == []
+
+    def test_mismatching_observations(self):
+        batcher = ObservationBatcher()
+        batcher.batch([make_observation(0, s) for s in range(2)])
+
+        # Observations with a different shape are batched with `batch_observations`
+        observations = [make_observation(1, s) for s in range(2)]
+        for observation in observations:
+            observation["rgb"] = np.zeros((2, 2, 3), dtype=np.uint8)
+        assert_equal_batches(
+            batcher.batch(observations), batch_observations(observations)
+        )
+
+    def test_stacked_observations(self):
+        batcher = ObservationBatcher()
+        for step, num_samplers in enumerate([4, 3]):
+            observations = [make_observation(step, s) for s in range(num_samplers)]
+            stacked = StackedObservations(
+                {
+                    "rgb": np.stack([o["rgb"] for o in observations]),
+                    "goal": {
+                        "position": np.stack(
+                            [o["goal"]["position"] for o in observations]
+                        ),
+                        "index": np.array([o["goal"]["index"] for o in observations]),
+                    },
+                    "embedding": torch.stack([o["embedding"] for o in observations]),
+                }
+            )
+            assert_equal_batches(
+                batcher.batch(stacked), batch_observations(observations)
+            )
+
+        # Samplers without an observation are removed before batching
+        stacked.present[1] = False
+        assert stacked.num_missing == 1
+        assert stacked[1] is None
+        assert_equal_batches(
+            batcher.batch(stacked.select([0, 2])),
+            batch_observations([observations[0], observations[2]]),
+        )
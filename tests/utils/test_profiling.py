@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+import torch
+
+from allenact.utils.profiling import PhaseProfiler
+
+
+class TestPhaseProfiler(object):
+    def test_spans(self):
+        profiler = PhaseProfiler()
+        for _ in range(3):
+            with profiler.span("outer"):
+                with profiler.span("inner"):
+                    pass
+
+        means = profiler.pop()
+        assert sorted(means.keys()) == ["inner", "outer"]
+        assert means["outer"][1] == 3 and means["inner"][1] == 3
+        assert means["outer"][0] >= means["inner"][0]
+        assert profiler.pop() == {}
+
+    def test_merge(self):
+        profiler = PhaseProfiler()
+        profiler.add("act", 1.0)
+        profiler.merge({"act": (2.0, 2), "env_step": (0.5, 4)})
+        assert profiler.pop() == {"act": (5.0 / 3, 3), "env_step": (0.5, 4)}
+
+    def test_disabled(self):
+        profiler = PhaseProfiler(enabled=False)
+        with profiler.span("phase"):
+            pass
+        assert profiler.pop() == {}
+
+    def test_trace(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_path = os.path.join(tmp_dir, "trace.json")
+            profiler = PhaseProfiler(trace_rollouts=(1, 1), trace_path=trace_path)
+            for rollout_count in range(3):
+                profiler.before_rollout(rollout_count)
+                with profiler.span("rollout{}".format(rollout_count)):
+                    torch.ones(2) + 1
+
+            with open(trace_path, "r") as f:
+                trace = f.read()
+            assert "rollout1" in trace
+            assert "rollout0" not in trace and "rollout2" not in trace
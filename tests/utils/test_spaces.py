@@ -131,9 +131,63 @@ class TestSpaces(object):
         assert len(al[0]["tuple"]) == 2
         assert isinstance(al[0]["scalar"], int)
 
+    def test_batched_tolist(self):
+        samples = [self.space.sample() for _ in range(5)]
+        flat_actions = torch.stack(
+            [
+                su.flatten(self.space, su.torch_point(self.space, sample))
+                for sample in samples
+            ],
+            dim=0,
+        ).unsqueeze(0)  # add [step]
+        al = su.action_list(self.space, flat_actions)
+        assert len(al) == len(samples)
+        for action, flat_action in zip(al, flat_actions[0]):
+            # Same as converting each sampler's action separately
+            expected = su.unflatten(self.space, flat_action)
+            assert self.same(action, su.numpy_point(self.space, expected))
+            assert isinstance(action["second"][0]["third"], int)
+            assert isinstance(action["first"][2], float)
+
+        # Decoding the rows of a (host) array gives the same actions
+        spec = su.space_spec(self.space)
+        assert spec.batch_action_list(flat_actions[0].numpy()[1:3]) == al[1:3]
+
+    def test_tree_spec(self):
+        tree = {
+            "rgb": torch.zeros(2, 3),
+            "goal": {"position": torch.ones(2), "nested": {"index": torch.ones(1)}},
+        }
+        spec = su.TreeSpec.from_tree(tree)
+        assert spec.paths == (
+            ("rgb",),
+            ("goal", "position"),
+            ("goal", "nested", "index"),
+        )
+        assert spec.keys == ("rgb", "goal")
+        assert spec.matches(tree) and not spec.matches({"rgb": tree["rgb"]})
+
+        leaves = spec.leaves(tree)
+        assert leaves[2] is tree["goal"]["nested"]["index"]
+        assert spec.unflatten(leaves) == tree
+        doubled = spec.map(lambda leaf: 2 * leaf, tree)
+        assert torch.equal(doubled["goal"]["position"], 2 * torch.ones(2))
+
+        space_spec = su.TreeSpec.from_space(
+            gyms.Dict(
+                {
+                    "rgb": gyms.Box(0, 1, (2, 3)),
+                    "goal": gyms.Dict({"position": gyms.Box(-1, 1, (2,))}),
+                }
+            )
+        )
+        assert sorted(space_spec.paths) == [("goal", "position"), ("rgb",)]
+
 
 if __name__ == "__main__":
     TestSpaces().test_conversion()  # type:ignore
     TestSpaces().test_flatten()  # type:ignore
     TestSpaces().test_batched()  # type:ignore
     TestSpaces().test_tolist()  # type:ignore
+    TestSpaces().test_batched_tolist()  # type:ignore
+    TestSpaces().test_tree_spec()  # type:ignore